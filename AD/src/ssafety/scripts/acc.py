@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import rospy
-import os
+import os, sys
 import rospkg
 from math import cos, sin, pi, sqrt, pow, atan2
 from geometry_msgs.msg import Point, PoseWithCovarianceStamped
@@ -42,7 +42,14 @@ class pure_pursuit :
         rospy.Subscriber("/local_path", Path, self.path_callback)
         rospy.Subscriber("/odom", Odometry, self.odom_callback)
         rospy.Subscriber("/Ego_topic" ,EgoVehicleStatus,self.status_callback)
+        # 차량 / 장애물은 시뮬레이터 ground truth(/Object_topic) 사용
+        # launch args 로 보행자 topic 을 지정하면 (ex. /Object_topic_to_camera) 보행자만 그 topic 의 결과로 교체
+        arg = rospy.myargv(argv=sys.argv)
+        self.pedestrian_topic_name = arg[1] if len(arg) > 1 else None
+        self.pedestrian_data = None
         rospy.Subscriber("/Object_topic", ObjectStatusList,self.object_info_callback)
+        if self.pedestrian_topic_name is not None:
+            rospy.Subscriber(self.pedestrian_topic_name, ObjectStatusList, self.pedestrian_info_callback)
         # rospy.Subscriber("/GetTrafficLightStatus", GetTrafficLightStatus, self.get_traffic_callback)  # 교통 상황 - 신호등
         self.ctrl_cmd_pub = rospy.Publisher('/ctrl_cmd',CtrlCmd, queue_size=1)
 
@@ -148,9 +155,17 @@ class pure_pursuit :
         self.is_global_path = True
 
     def object_info_callback(self,data): ## Object information Subscriber
+        if self.pedestrian_topic_name is not None:
+            # 보행자 목록만 교체 (아직 보행자 topic 을 받지 못했으면 보행자 없음)
+            pedestrians = self.pedestrian_data.pedestrian_list if self.pedestrian_data is not None else []
+            data.pedestrian_list = pedestrians
+            data.num_of_pedestrian = len(pedestrians)
         self.is_object_info = True
         self.object_data = data 
 
+    def pedestrian_info_callback(self, data): ## 보행자 topic Subscriber (ex. lidar_camera_fusion)
+        self.pedestrian_data = data
+
     #========================================================#
     # 교통 상황 - 신호등 데이터
     # def get_traffic_callback(self, msg):
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rospy
+import cv2
+import numpy as np
+import os
+import time
+
+from sensor_msgs.msg import CompressedImage
+from std_msgs.msg import UInt64
+
+# camera_frame_bus 는 카메라 프레임을 공유 메모리(shared memory)로 여러 노드에 나눠주는 공용 모듈입니다.
+# camera_frontend 노드가 /image_jpeg/compressed 를 한 번만 디코딩해서 공유 메모리 ring buffer 에 쓰고,
+# 같은 PC 의 vision 노드들은 /camera_frame_bus 로 sequence 번호만 받아 해당 slot 을 복사 없이 읽습니다.
+# HSV / gray 는 요청한 노드가 처음 접근할 때 노드 자신의 배열로 변환해서 그 프레임 동안 cache 합니다.
+# (공유 HSV 영역에 여러 노드가 lock 없이 쓰면, 늦게 끝난 이전 프레임 변환이 slot 재사용 후의 결과를 덮어쓸 수 있음)
+
+# 공유 메모리는 /dev/shm 파일을 np.memmap 으로 매핑해서 사용합니다.
+# (multiprocessing.shared_memory 는 객체가 해제될 때 numpy view 가 남아 있어도 unmap 해 버려 segfault 가 날 수 있음)
+
+# 공유 메모리 구조
+# [ header(int64 x 8) | slot header(int64 x 4) x n_slots | BGR slot x n_slots ]
+#   header      : magic, width, height, n_slots, latest_seq
+#   slot header : seq(쓰는 중이면 -1), stamp(ns)
+
+# 사용 예 (vision 노드)
+#   self.camera_sub = CameraSubscriber(self.frame_callback)   # ~use_frame_bus 파라미터로 bus / jpeg 선택
+#   def frame_callback(self, frame):
+#       img_bgr, img_hsv = frame.bgr, frame.hsv
+#       ... 처리 ...
+#       if not frame.is_valid():    # 처리하는 동안 slot 이 덮어써졌으면 결과를 버림
+#           return
+
+# 주의 : frame.bgr 는 공유 메모리 view 이므로 (n_slots - 1) 프레임 이상 지나면 덮어써진다.
+#        frame.bgr / frame.hsv 로 만든 결과는 사용하기 전에 frame.is_valid() 로 확인하고,
+#        callback 밖(메인 루프 등)에서 쓰려면 frame.own_bgr() 로 노드 소유 배열을 받아서 보관 (frame.copy() 도 가능)
+
+BUS_NAME = 'ssafety_camera'
+SHM_DIR = '/dev/shm'
+BUS_TOPIC = '/camera_frame_bus'
+BUS_MAGIC = 0x53534146
+
+HEADER_LEN = 8
+SLOT_HEADER_LEN = 4
+
+
+class _FrameBusLayout:
+    # writer / reader 가 같은 offset 계산을 쓰도록 공유 메모리 배열 view 를 만든다
+    def __init__(self, buf, width, height, n_slots):
+        # buf : np.memmap - 모든 view 의 base 가 memmap 이므로 view 가 남아 있는 동안 매핑이 유지된다
+        self.width = width
+        self.height = height
+        self.n_slots = n_slots
+
+        offset = 8 * (HEADER_LEN + SLOT_HEADER_LEN * n_slots)
+
+        self.header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=buf)
+        self.slot_header = np.ndarray((n_slots, SLOT_HEADER_LEN), dtype=np.int64, buffer=buf, offset=8 * HEADER_LEN)
+        self.bgr = np.ndarray((n_slots, height, width, 3), dtype=np.uint8, buffer=buf, offset=offset)
+
+    @staticmethod
+    def nbytes(width, height, n_slots):
+        return 8 * (HEADER_LEN + SLOT_HEADER_LEN * n_slots) + n_slots * height * width * 3
+
+
+class FrameBusWriter:
+    '''
+    디코딩된 BGR 프레임을 공유 메모리 ring buffer 에 기록
+    \n slot 을 쓰는 동안 slot seq 를 -1 로 두어 reader 가 쓰는 중인 프레임을 읽지 않게 한다 (seqlock)
+    '''
+    def __init__(self, width, height, n_slots=4, name=BUS_NAME):
+        self.layout_args = (width, height, n_slots)
+
+        self.path = os.path.join(SHM_DIR, name)
+
+        # 이전 실행이 비정상 종료되어 남아 있는 공유 메모리는 새 파일로 교체 (기존 reader 는 다음 read 에서 다시 연결)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self.buf = np.memmap(self.path, dtype=np.uint8, mode='w+', shape=(_FrameBusLayout.nbytes(width, height, n_slots),))
+        self.layout = _FrameBusLayout(self.buf, width, height, n_slots)
+
+        self.layout.slot_header[:] = -1
+        self.layout.header[:] = 0
+        self.layout.header[1:4] = (width, height, n_slots)
+        self.layout.header[0] = BUS_MAGIC
+
+        self.seq = 0
+
+    def write(self, img_bgr, stamp_ns):
+        self.seq += 1
+        slot = self.seq % self.layout.n_slots
+
+        self.layout.slot_header[slot, 0] = -1
+        np.copyto(self.layout.bgr[slot], img_bgr)
+        self.layout.slot_header[slot, 1] = stamp_ns
+        self.layout.slot_header[slot, 0] = self.seq
+        self.layout.header[4] = self.seq
+
+        return self.seq
+
+    def close(self):
+        self.layout = None
+        self.buf = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class CameraFrame:
+    '''
+    프레임 1장 (seq, stamp, bgr, hsv)
+    \n bus 에서 읽은 프레임의 bgr 는 공유 메모리 view, jpeg 에서 디코딩한 프레임은 자체 배열
+    \n hsv / gray 는 처음 접근할 때 노드 자신의 배열로 변환 (bus 프레임이면 사용 전에 is_valid() 확인)
+    '''
+    def __init__(self, seq, stamp, bgr, layout=None, slot=None):
+        self.seq = seq
+        self.stamp = stamp
+        self.bgr = bgr
+        self.layout = layout
+        self.slot = slot
+        self._hsv = None
+        self._gray = None
+
+    def is_valid(self):
+        # bus 프레임이 writer 에 의해 덮어써졌는지 확인
+        return self.layout is None or self.layout.slot_header[self.slot, 0] == self.seq
+
+    @property
+    def hsv(self):
+        if self._hsv is None:
+            self._hsv = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV)
+        return self._hsv
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    def own_bgr(self):
+        '''
+        노드가 callback 이후에도 들고 있을 BGR 배열
+        \n bus 프레임은 복사본 (복사하는 동안 덮어써졌으면 None), jpeg 프레임은 그대로
+        '''
+        if self.layout is None:
+            return self.bgr
+
+        bgr = self.bgr.copy()
+        return bgr if self.is_valid() else None
+
+    def copy(self):
+        frame = CameraFrame(self.seq, self.stamp, self.bgr.copy())
+        if self._hsv is not None:
+            frame._hsv = self._hsv.copy()
+        return frame
+
+
+class FrameBusReader:
+    '''
+    공유 메모리 ring buffer 에서 프레임을 읽는다
+    \n writer 가 재시작되면(공유 메모리 재생성) 다음 read 에서 다시 연결
+    '''
+    def __init__(self, name=BUS_NAME):
+        self.path = os.path.join(SHM_DIR, name)
+        self.layout = None
+
+    def attach(self):
+        self.detach()
+        try:
+            buf = np.memmap(self.path, dtype=np.uint8, mode='r+')
+        except (FileNotFoundError, ValueError):
+            return False
+
+        header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=buf)
+        if header[0] != BUS_MAGIC:
+            return False
+
+        width, height, n_slots = (int(v) for v in header[1:4])
+        self.layout = _FrameBusLayout(buf, width, height, n_slots)
+
+        return True
+
+    def detach(self):
+        # 매핑 해제는 이 layout 을 참조하는 프레임 view 가 모두 사라질 때 자동으로 이루어진다
+        self.layout = None
+
+    def read(self, seq=None):
+        '''
+        # seq 프레임을 읽는다. seq 가 없으면 가장 최근 프레임
+        # Output
+            # CameraFrame, 해당 프레임이 이미 덮어써졌거나 아직 없으면 None
+        '''
+        for _ in range(2):
+            if self.layout is None and not self.attach():
+                return None
+
+            if seq is None:
+                seq = int(self.layout.header[4])
+            slot = seq % self.layout.n_slots
+
+            if self.layout.slot_header[slot, 0] == seq:
+                stamp = self.layout.slot_header[slot, 1] * 1e-9
+                return CameraFrame(seq, stamp, self.layout.bgr[slot], self.layout, slot)
+
+            # 이미 덮어써졌거나, writer 가 재시작되어(공유 메모리 재생성) 예전 메모리를 보고 있는 경우
+            # 다시 연결해서 한 번 더 확인
+            self.detach()
+
+        return None
+
+
+class CameraSubscriber:
+    '''
+    카메라 프레임 수신기 - callback(CameraFrame) 호출
+    \n use_frame_bus=True : camera_frontend 의 공유 메모리 bus 사용 (같은 PC, 디코딩 없음)
+    \n use_frame_bus=False : /image_jpeg/compressed 를 직접 디코딩 (기존 방식)
+    \n None 이면 ~use_frame_bus 파라미터 사용
+    '''
+    def __init__(self, callback, use_frame_bus=None, topic="/image_jpeg/compressed", imread_flag=cv2.IMREAD_COLOR):
+        self.callback = callback
+        self.imread_flag = imread_flag
+
+        if use_frame_bus is None:
+            use_frame_bus = rospy.get_param('~use_frame_bus', False)
+
+        if use_frame_bus:
+            self.reader = FrameBusReader()
+            self.sub = rospy.Subscriber(BUS_TOPIC, UInt64, self.bus_callback, queue_size=1)
+        else:
+            self.reader = None
+            self.seq = 0
+            self.sub = rospy.Subscriber(topic, CompressedImage, self.jpeg_callback, queue_size=1, buff_size=2**24)
+
+    def bus_callback(self, msg):
+        frame = self.reader.read(msg.data)
+        if frame is not None:
+            self.callback(frame)
+
+    def jpeg_callback(self, msg):
+        # stamp 는 수신 시각 (시뮬레이터 header.stamp 는 비어 있는 경우가 있음)
+        self.recv_time = time.time()
+        np_arr = np.frombuffer(msg.data, np.uint8)
+        img_bgr = cv2.imdecode(np_arr, self.imread_flag)
+        if img_bgr is None:
+            return
+
+        self.seq += 1
+        self.callback(CameraFrame(self.seq, self.recv_time, img_bgr))
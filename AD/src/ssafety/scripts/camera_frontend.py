@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rospy
+import cv2
+import numpy as np
+import os, sys
+import time
+
+from sensor_msgs.msg import CompressedImage
+from std_msgs.msg import UInt64
+
+current_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(current_path)
+
+from camera_frame_bus import FrameBusWriter, BUS_NAME, BUS_TOPIC
+
+# camera_frontend 는 카메라 JPEG 을 프레임당 한 번만 디코딩해서 공유 메모리 frame bus 로 나눠주는 노드입니다.
+# image_lane_fitting, camera_pedes_detector, lidar_ex_calib_velodyne, image_parser_binarization 등
+# vision 노드를 _use_frame_bus:=true 로 실행하면 각 노드가 같은 JPEG 을 다시 디코딩하지 않습니다.
+
+# 노드 실행 순서
+# 1. /image_jpeg/compressed subscriber, /camera_frame_bus publisher 선언
+# 2. JPEG 디코딩 (프레임당 1회)
+# 3. 첫 프레임(또는 해상도 변경) 시 공유 메모리 ring buffer 생성
+# 4. 공유 메모리 slot 에 기록 후 sequence 번호 Publish
+
+class CameraFrontend:
+    def __init__(self):
+        #TODO: (1) subscriber, publisher 선언
+        self.image_sub = rospy.Subscriber("/image_jpeg/compressed", CompressedImage, self.callback, queue_size=1, buff_size=2**24)
+        self.seq_pub = rospy.Publisher(BUS_TOPIC, UInt64, queue_size=1)
+
+        self.n_slots = rospy.get_param('~n_slots', 4)
+        self.bus_name = rospy.get_param('~bus_name', BUS_NAME)
+        self.writer = None
+
+        rospy.on_shutdown(self.shutdown)
+
+    def callback(self, msg):
+        stamp_ns = time.time_ns()
+
+        #TODO: (2) JPEG 디코딩 (프레임당 1회)
+        np_arr = np.frombuffer(msg.data, np.uint8)
+        img_bgr = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        if img_bgr is None:
+            return
+
+        #TODO: (3) 공유 메모리 ring buffer 생성
+        height, width = img_bgr.shape[:2]
+        if self.writer is None or self.writer.layout_args[:2] != (width, height):
+            if self.writer is not None:
+                self.writer.close()
+            self.writer = FrameBusWriter(width, height, self.n_slots, self.bus_name)
+
+        #TODO: (4) slot 기록 후 sequence 번호 Publish
+        seq = self.writer.write(img_bgr, stamp_ns)
+        self.seq_pub.publish(UInt64(seq))
+
+    def shutdown(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+if __name__ == '__main__':
+    rospy.init_node('camera_frontend', anonymous=True)
+
+    camera_frontend = CameraFrontend()
+
+    rospy.spin()
@@ -4,9 +4,21 @@
 import rospy
 import cv2
 import numpy as np
+import os, sys
+import math
+import time
+import threading
+from collections import deque
 
-from sensor_msgs.msg import CompressedImage
-from cv_bridge import CvBridgeError
+from std_msgs.msg import Float32MultiArray
+
+current_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(current_path)
+# nms_util 은 AI 서비스와 같이 쓰는 저장소 최상위 common/ 모듈
+sys.path.append(os.path.abspath(os.path.join(current_path, '..', '..', '..', '..', 'common')))
+
+from nms_util import nms
+from camera_frame_bus import CameraSubscriber
 
 # camera_pedes_detector: 카메라로 보행자 인식하는 Object-detection 
 # HoG feature 추출 후 사전 학습된 SVM 알고리즘을 통해 보행자 영역이 분류됨
@@ -22,91 +34,270 @@ from cv_bridge import CvBridgeError
 # 7. NMS 내부 (IOU 계산)
 # 8. 추출된 좌표 Detection 용 박스 화
 
-def non_maximum_supression(bboxes, threshold=0.3):
-    bboxes = sorted(bboxes, key=lambda detections: detections[3], reverse=True)
+# 검출 파이프라인
+# - 콜백은 backend 별 큐에 넣기만 하고 바로 반환 (콜백에서 rate.sleep 제거)
+# - ~reduce (기본 1) 로 축소 디코딩(cv2.IMREAD_REDUCED_*) 가능, 대신 HOG 창(64x128)이 원본 기준 128 * reduce px 가 되므로
+#   그보다 작은 (먼) 보행자는 검출되지 않음 (reduce 2 : 256 px 이상만)
+# - backend 마다 worker thread 1개, 큐 크기 1 (새 프레임이 오면 처리 못 한 이전 프레임은 버림)
+# - ~roi (기본 전체 프레임) 안에서만 검출, 검출 지연이 프레임 주기보다 길면 프레임을 건너뛰어 입력 주기를 맞춤
+#   예: ~roi [0.0, 0.3, 1.0, 1.0] 이면 위쪽 30% (하늘 등) 를 제외
+# - backend: hog (기본) + OpenCV DNN (~dnn_model 지정 시, CPU)
+# - backend 별 지연/드롭 통계를 /pedes_detector/<backend>/stats 로 Publish
+#   data = [평균 지연(ms), 최대 지연(ms), 처리 fps, 누적 처리, 누적 드롭, 누적 스킵]
+
+def non_maximum_supression(bboxes, threshold=0.3, scores=None):
+    '''
+    # (x, y, w, h) 박스 NMS, 남은 박스를 점수 내림차순 list 로 반환
+    # scores 가 없으면 박스 높이를 점수로 사용 (HOG weight / DNN confidence 를 넘기는 것을 권장)
+    '''
+    bboxes = np.asarray(bboxes).reshape(-1, 4)
+
+    #TODO: (7)  IOU 계산 - nms_util 에서 IoU 를 행렬로 계산
+    keep = nms(bboxes, scores, iou_threshold=threshold)
+
+    return [tuple(int(v) for v in bboxes[i]) for i in keep]
+
+
+# cv2.imdecode 축소 디코딩 flag (JPEG 은 디코딩 단계에서 축소하므로 full decode + resize 보다 빠름)
+IMREAD_REDUCED = {1: cv2.IMREAD_COLOR,
+                  2: cv2.IMREAD_REDUCED_COLOR_2,
+                  4: cv2.IMREAD_REDUCED_COLOR_4,
+                  8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+class LatestFrameQueue:
+    '''
+    최신 프레임만 유지하는 큐 (drop-oldest)
+    \n put 할 때 아직 처리되지 않은 프레임이 있으면 버리고 dropped 를 증가
+    '''
+    def __init__(self, maxlen=1):
+        self.frames = deque(maxlen=maxlen)
+        self.cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, frame):
+        with self.cond:
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+            self.frames.append(frame)
+            self.cond.notify()
+
+    def get(self, timeout=0.5):
+        with self.cond:
+            if not self.frames:
+                self.cond.wait(timeout)
+            if not self.frames:
+                return None
+            return self.frames.popleft()
+
+
+class HOGBackend:
+    name = 'hog'
+
+    def __init__(self):
+        #TODO: (2) HOG descitpor 생성
+        self.pedes_detector = cv2.HOGDescriptor()
+
+        #TODO: (3) 사전 학습된 SVM 분류기 설정 (for peds)
+        self.pedes_detector.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+        # 축소 디코딩 시 검출 가능한 최소 보행자 높이는 원본 기준 128 * reduce px
+        win_stride = rospy.get_param('~hog_win_stride', 4)
+        self.win_stride = (win_stride, win_stride)
+        self.scale = rospy.get_param('~hog_scale', 32)
+
+    def detect(self, img_bgr):
+        img_gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+
+        #TODO: (5)  검출 (paramter 바꿔가면서 설정)
+        (rects, weights) = self.pedes_detector.detectMultiScale(img_gray, winStride=self.win_stride, padding=(2, 2), scale=self.scale)
+
+        return np.asarray(rects).reshape(-1, 4), np.asarray(weights, dtype=np.float64).reshape(-1)
+
+
+class DNNBackend:
+    '''
+    OpenCV DNN SSD 계열 검출기 (예: MobileNet-SSD caffe), CPU 실행
+    \n 출력 [1, 1, N, 7] = [image_id, class_id, score, x1, y1, x2, y2] (0~1 정규화 좌표)
+    '''
+    name = 'dnn'
+
+    def __init__(self, model, config=''):
+        self.net = cv2.dnn.readNet(model, config)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+        self.input_size = rospy.get_param('~dnn_input_size', 300)
+        self.scale = rospy.get_param('~dnn_scale', 0.007843)
+        self.mean = rospy.get_param('~dnn_mean', 127.5)
+        self.person_class = rospy.get_param('~dnn_person_class', 15)
+        self.conf_threshold = rospy.get_param('~dnn_conf', 0.5)
+
+    def detect(self, img_bgr):
+        h, w = img_bgr.shape[:2]
+        blob = cv2.dnn.blobFromImage(img_bgr, self.scale, (self.input_size, self.input_size),
+                                     (self.mean, self.mean, self.mean), swapRB=False, crop=False)
+        self.net.setInput(blob)
+        out = self.net.forward().reshape(-1, 7)
+
+        out = out[(out[:, 1] == self.person_class) & (out[:, 2] > self.conf_threshold)]
+        x1 = np.clip(out[:, 3] * w, 0, w - 1)
+        y1 = np.clip(out[:, 4] * h, 0, h - 1)
+        x2 = np.clip(out[:, 5] * w, 0, w - 1)
+        y2 = np.clip(out[:, 6] * h, 0, h - 1)
+
+        rects = np.stack([x1, y1, x2 - x1, y2 - y1], axis=1).astype(np.int32)
+        valid = (rects[:, 2] > 0) & (rects[:, 3] > 0)
+        return rects[valid], out[valid, 2]
+
+
+class DetectorWorker:
+    '''
+    backend 1개를 worker thread 에서 실행하고 지연/드롭/스킵 통계를 관리
+    '''
+    def __init__(self, backend, roi, frame_period):
+        self.backend = backend
+        self.roi = roi
+        self.frame_period = frame_period
 
-    new_bboxes = []
-    new_bboxes.append(bboxes[0])
-    
-    bboxes.pop(0)
+        self.queue = LatestFrameQueue()
+        self.stats_pub = rospy.Publisher('/pedes_detector/{}/stats'.format(backend.name), Float32MultiArray, queue_size=1)
 
-    for _, bbox in enumerate(bboxes):
+        self.lock = threading.Lock()
+        self.result = (None, [])
+        self.latency_ema = 0.
+        self.latencies = []
+        self.processed = 0
+        self.skipped = 0
+        self.frame_count = 0
+        self.skip_n = 0
+        self.stats_time = time.time()
 
-        for new_bbox in new_bboxes:
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
 
-            x1_tl = bbox[0]
-            x2_tl = new_bbox[0]
-            x1_br = bbox[0] + bbox[2]
-            x2_br = new_bbox[0] + new_bbox[2]
-            y1_tl = bbox[1]
-            y2_tl = new_bbox[1]
-            y1_br = bbox[1] + bbox[3]
-            y2_br = new_bbox[1] + new_bbox[3]
+    def submit(self, img_bgr, stamp):
+        # 지연이 프레임 주기보다 길면 skip_n 프레임마다 1개만 큐에 넣는다
+        self.frame_count += 1
+        if self.frame_count % (self.skip_n + 1) != 0:
+            self.skipped += 1
+            return
 
-            #TODO: (7)  IOU 계산
-            # 이미지의 IoU를 계산하는 영역입니다. 위에 입력된 파라미터를 이용하여 IoU를 계산.
-            x_overlap = max(0, min(x1_br, x2_br) - max(x1_tl, x2_tl))
-            y_overlap = max(0, min(y1_br, y2_br) - max(y1_tl, y2_tl))
-            overlap_area = x_overlap * y_overlap
+        self.queue.put((img_bgr, stamp))
 
-            area_1 = bbox[2] * bbox[3]
-            area_2 = new_bbox[2] * new_bbox[3]
-            
-            total_area = area_1 + area_2
+    def run(self):
+        while not rospy.is_shutdown():
+            frame = self.queue.get()
+            if frame is None:
+                continue
 
-            overlap_area = overlap_area / (total_area - overlap_area)
+            img_bgr, stamp = frame
+            h, w = img_bgr.shape[:2]
+            x0, y0, x1, y1 = int(self.roi[0] * w), int(self.roi[1] * h), int(self.roi[2] * w), int(self.roi[3] * h)
 
-            if overlap_area < threshold:
-                new_bboxes.append(bbox)
+            rects, scores = self.backend.detect(img_bgr[y0:y1, x0:x1])
+            if len(rects) != 0:
+                #TODO: (6)  NMS 후처리 통과
+                rects = [(x + x0, y + y0, bw, bh) for (x, y, bw, bh) in non_maximum_supression(rects, scores=scores)]
 
-    return new_bboxes
+            latency = time.time() - stamp
+
+            with self.lock:
+                self.result = (img_bgr, rects)
+                self.processed += 1
+                self.latencies.append(latency)
+                self.latency_ema = latency if self.processed == 1 else 0.8 * self.latency_ema + 0.2 * latency
+                self.skip_n = max(0, int(math.ceil(self.latency_ema / self.frame_period)) - 1)
+
+    def get_result(self):
+        with self.lock:
+            return self.result
+
+    def publish_stats(self):
+        with self.lock:
+            latencies = self.latencies
+            self.latencies = []
+            processed = self.processed
+
+        now = time.time()
+        elapsed = max(now - self.stats_time, 1e-6)
+        self.stats_time = now
+
+        stats = Float32MultiArray()
+        stats.data = [1000. * float(np.mean(latencies)) if latencies else 0.,
+                      1000. * float(np.max(latencies)) if latencies else 0.,
+                      len(latencies) / elapsed,
+                      processed,
+                      self.queue.dropped,
+                      self.skipped]
+        self.stats_pub.publish(stats)
 
 
 class PEDESDetector:
     def __init__(self):
 
         #TODO: (1) subscriber 선언
-        self.image_sub = rospy.Subscriber("/image_jpeg/compressed", CompressedImage, self.callback)
+        # 축소 디코딩 배율(1, 2, 4, 8), 검출 ROI (이미지 크기 대비 비율 x0, y0, x1, y1), 카메라 입력 주기
+        # 기본값은 기존과 같은 원본 해상도 / 전체 프레임 (최소 보행자 높이 128 px)
+        self.reduce = rospy.get_param('~reduce', 1)
+        self.imread_flag = IMREAD_REDUCED[self.reduce]
+        roi = rospy.get_param('~roi', [0.0, 0.0, 1.0, 1.0])
+        frame_period = 1.0 / rospy.get_param('~camera_hz', 20)
 
-        self.rate = rospy.Rate(20)
+        backends = [HOGBackend()]
+        dnn_model = rospy.get_param('~dnn_model', '')
+        if dnn_model:
+            backends.append(DNNBackend(dnn_model, rospy.get_param('~dnn_config', '')))
 
-        #TODO: (2) HOG descitpor 생성
-        self.pedes_detector = cv2.HOGDescriptor()
+        self.workers = [DetectorWorker(backend, roi, frame_period) for backend in backends]
 
-        #TODO: (3) 사전 학습된 SVM 분류기 설정 (for peds)
-        self.pedes_detector.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        # frame bus 사용 시 이미 디코딩된 원본 해상도 프레임을 받아서 축소
+        self.image_sub = CameraSubscriber(self.callback, imread_flag=self.imread_flag)
 
-    def callback(self, msg):
+        rate = rospy.Rate(20)
+        stats_time = time.time()
+        while not rospy.is_shutdown():
+            for worker in self.workers:
+                img_bgr, rects = worker.get_result()
+                if img_bgr is None:
+                    continue
 
-        self.rate.sleep()
+                img_show = img_bgr.copy()
+                for (x,y,w,h) in rects:
+                    #TODO: (8)  추출된 좌표로 박스 생성
+                    cv2.rectangle(img_show, (x, y), (x+w, y+h), (0,255,255), 2)
 
-        try:
-            #TODO: (4)  이미지 불러오기
-            np_arr = np.frombuffer(msg.data, np.uint8)
-            img_bgr = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        except CvBridgeError as err:
-            print(err)
+                cv2.imshow("Pedes detection Cam ({})".format(worker.backend.name), img_show)
 
-        img_gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+            cv2.waitKey(1)
 
-        #TODO: (5)  검출 (paramter 바꿔가면서 설정)
-        (rects_temp, _) = self.pedes_detector.detectMultiScale(img_gray, winStride=(4, 4), padding=(2, 2), scale=32)
-        
-        if len(rects_temp) != 0:            
-            #TODO: (6)  NMS 후처리 통과
-            rects = non_maximum_supression(rects_temp)
+            if time.time() - stats_time > 1.0:
+                stats_time = time.time()
+                for worker in self.workers:
+                    worker.publish_stats()
 
-            for (x,y,w,h) in rects:
-                #TODO: (8)  추출된 좌표로 박스 생성
-                cv2.rectangle(img_bgr, (x, y), (x+w, y+h), (0,255,255), 2)
+            rate.sleep()
 
-        cv2.imshow("Pedes detection Cam", img_bgr)
-        cv2.waitKey(1)
+    def callback(self, frame):
+        #TODO: (4)  이미지 불러오기
+        if frame.layout is not None and self.reduce > 1:
+            # frame bus 프레임은 원본 해상도 공유 메모리 view 이므로 축소한 노드 소유 배열을 worker 에 넘긴다
+            img_bgr = cv2.resize(frame.bgr, None, fx=1.0/self.reduce, fy=1.0/self.reduce, interpolation=cv2.INTER_AREA)
+            if not frame.is_valid():
+                return
+        else:
+            # worker thread 가 callback 이후에 쓰므로 bus 프레임은 복사 (복사하는 동안 덮어써졌으면 None)
+            img_bgr = frame.own_bgr()
+            if img_bgr is None:
+                return
 
+        for worker in self.workers:
+            worker.submit(img_bgr, frame.stamp)
 
 if __name__ == '__main__':
     rospy.init_node('pedes_detector', anonymous=True)
 
     pedes_detector = PEDESDetector()
 
-    rospy.spin() 
+    rospy.spin()
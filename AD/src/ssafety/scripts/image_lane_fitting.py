@@ -7,28 +7,42 @@ import numpy as np
 import os, rospkg
 import json
 import math
-import random
+import sys
 import tf
 
-from cv_bridge import CvBridgeError
-from sklearn import linear_model
 
 from nav_msgs.msg import Odometry, Path
-from sensor_msgs.msg import CompressedImage
 from geometry_msgs.msg import PoseStamped, Point
 from morai_msgs.msg import CtrlCmd, EgoVehicleStatus
 
+current_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(current_path)
+
+from path_msg_util import PathMsgBuilder, transform_points
+from camera_frame_bus import CameraSubscriber
+from lane_binarizer import LaneBinarizer, start_reconfigure_server
+
 # image_lane_fitting - 이제 차선 정보를 인지해보자
 # 차선 위치 pixel 좌표 계산해서 좌우 차선 각각 RANSAC 을 활용한 3차 곡선 근사 수행
+# RANSAC 은 sklearn 대신 numpy 로 구현한 RobustPolyFit 사용 (모든 trial 을 행렬곱 1번으로 평가)
 
 # 노드 실행 순서
 # 1. CURVEFIT Parameter 입력
 # 2. RANSAC Parameter 입력
 
+# 매 프레임 반복되는 연산 줄이기
+# - ROI mask, 역행렬은 시작할 때 한 번만 계산
+#   ROI mask 를 BEV 공간으로 미리 warp 해두고, 매 프레임은 BEV 변환 후 bitwise_and 1번으로 masking
+# - 중간 이미지(BEV, HSV, 이진화)는 미리 할당한 버퍼를 재사용
+# - 차선 point 는 BEV 이미지에서 바로 지면 좌표로 복원 (warp_inv_img 왕복 제거)
+# - lane_tracking=True 이면 이전 frame 차선 주변 열(column)만 이진화/탐색 (LaneTracker)
+#   신뢰도가 떨어지면 histogram 기반 sliding window 로 전체 탐색
+
 class IMGParser:
-    def __init__(self, pkg_name = 'ssafety'):
+    def __init__(self, pkg_name = 'ssafety', lane_tracking = True):
 
-        self.image_sub = rospy.Subscriber("/image_jpeg/compressed", CompressedImage, self.image_callback)
+        # ~use_frame_bus:=true 이면 camera_frontend 가 디코딩한 프레임을 공유 메모리에서 바로 사용
+        self.camera_sub = CameraSubscriber(self.image_callback)
 
         rospy.Subscriber("/odom", Odometry, self.odom_callback)
 
@@ -39,12 +53,9 @@ class IMGParser:
         self.edges = None 
         self.is_status = False
 
-        # white, yellow 색상 영역 검출하기 위해 범위를 지정
-        self.lower_wlane = np.array([0, 0, 205])
-        self.upper_wlane = np.array([30, 60, 255])
-
-        self.lower_ylane = np.array([0, 70, 120])         # ([0,60,100])
-        self.upper_ylane = np.array([40, 195, 230])       # ([40,175,255])
+        # white, yellow 색상 영역 검출 - 범위는 lane_binarizer.LANE_COLOR_RANGES, rqt_reconfigure 로 실시간 변경
+        self.binarizer = LaneBinarizer()
+        self.reconfigure_server = start_reconfigure_server(self.binarizer)
 
         self.crop_pts = np.array([[[0,480], [0,350], [280,200], [360,200], [640,350], [640,480]]])
 
@@ -56,29 +67,41 @@ class IMGParser:
 
         params_cam = sensor_params["params_cam"]
 
+        # 고정된 ROI 다각형 mask 와 출력 버퍼는 한 번만 생성
+        self.init_buffers(params_cam["HEIGHT"], params_cam["WIDTH"])
+
         bev_op = BEVTransform(params_cam=params_cam)
+        # BEV 공간의 ROI mask 생성
+        bev_op.build_roi_mask(self.roi_mask)
 
         #TODO: (1) CURVEFit Parameter 입력
         #========================================================#
         # (slef, 다항식 차수- 3차, lasso 상수, 차선 폭, 파라 T- 중심축과의 y축 마진(보통 2~3alpha), 차선 추정 x좌표 범위, x좌표 간격, RANSAC 알고리즘에 필요한 최소 포인트 수)
         curve_learner = CURVEFit(order=3, lane_width=3.5, y_margin=1, x_range=5, min_pts=50)
         #END
+        lane_tracker = LaneTracker(params_cam["WIDTH"], params_cam["HEIGHT"]) if lane_tracking else None
+        if lane_tracker is not None:
+            # 추적 중에는 발행하는 /lane_path 차선도 같은 비율로 smoothing
+            curve_learner.smooth = lane_tracker.smooth
         rate = rospy.Rate(10)
 
         while not rospy.is_shutdown():
 
             if self.img_bgr is not None and self.is_status == True:
-                # 이미지 잘라서 항공뷰 -> 이진화 -> 역 왜곡(실제 차선 반영)
-                # 마스킹(masking) - 차량 앞 이미지 자르기
-                img_crop = self.mask_roi(self.img_bgr)
-                # 항공 뷰 - bev 반영 이미지
-                img_warp = bev_op.warp_bev_img(img_crop)
-                # 차선 이진화 - white & yellow
-                img_lane = self.binarize(img_warp)
-                # BEV 에서 왜곡 줄여서 다시 실제 차선 반영
-                img_f = bev_op.warp_inv_img(img_lane)
-                #======================================================#
-                lane_pts = bev_op.recon_lane_pts(img_f)
+                # 이미지 잘라서 항공뷰 -> 이진화 -> BEV 에서 바로 지면 좌표 복원
+                # 항공 뷰 + 마스킹(masking) - 차량 앞 영역의 bev 이미지
+                img_warp = bev_op.warp_bev_img(self.img_bgr, self.img_warp)
+                if lane_tracker is not None:
+                    # 이전 차선 주변 열만 이진화 (추적 전이면 전체)
+                    cols = lane_tracker.search_cols()
+                    img_lane = self.binarize(img_warp, cols)
+                    UV_mark = lane_tracker.update(img_lane, cols)
+                    lane_pts = bev_op.recon_lane_pts_uv(UV_mark)
+                else:
+                    # 차선 이진화 - white & yellow
+                    img_lane = self.binarize(img_warp)
+                    #======================================================#
+                    lane_pts = bev_op.recon_lane_pts_bev(img_lane)
 
                 x_pred, y_pred_l, y_pred_r = curve_learner.fit_curve(lane_pts)
                 
@@ -109,47 +132,49 @@ class IMGParser:
         self.status_msg = msg    
         self.is_status = True
 
-    def image_callback(self, msg):
-        try:
-            np_arr = np.frombuffer(msg.data, np.uint8)
-            self.img_bgr = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        except CvBridgeError as err:
-            print(err)
+    def image_callback(self, frame):
+        # bus 프레임은 공유 메모리 view 라 메인 루프에서 쓰는 동안 덮어써질 수 있으므로 노드 소유 배열로 보관
+        img_bgr = frame.own_bgr()
+        if img_bgr is not None:
+            self.img_bgr = img_bgr
+
+    def init_buffers(self, h, w):
+        # ROI 다각형은 고정이므로 mask 는 1채널로 한 번만 그린다
+        self.roi_mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(self.roi_mask, self.crop_pts, 255)
+
+        # 매 프레임 재사용할 출력 버퍼
+        self.img_crop = np.empty((h, w, 3), dtype=np.uint8)
+        self.img_warp = np.empty((h, w, 3), dtype=np.uint8)
+        self.img_hsv = np.empty((h, w, 3), dtype=np.uint8)
+        self.img_lane = np.empty((h, w), dtype=np.uint8)
+
+    def binarize(self, img, cols=None):
+        # cols : [(u0, u1), ...] 이진화할 열 범위, None 이면 전체 이미지
+        if cols is None:
+            cols = [(0, img.shape[1])]
+        else:
+            self.img_lane.fill(0)
+
+        for u0, u1 in cols:
+            img_hsv = self.img_hsv[:, u0:u1]
 
-    def binarize(self, img):
-        img_hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+            cv2.cvtColor(img[:, u0:u1], cv2.COLOR_BGR2HSV, dst=img_hsv)
 
-        # 이진화된 white / yellow 색상 범위 설정, 
-        img_wlane = cv2.inRange(img_hsv, self.lower_wlane, self.upper_wlane)
-        img_ylane = cv2.inRange(img_hsv, self.lower_ylane, self.upper_ylane)
-        # 비트 연산을 통해 두 이미지 합치기
-        self.img_lane = cv2.bitwise_or(img_wlane, img_ylane)
+            # white / yellow 색상 범위를 합친 차선 mask 를 출력 버퍼에 바로 기록
+            self.binarizer.binarize(img_hsv, dst=self.img_lane[:, u0:u1])
 
         return self.img_lane
 
     def mask_roi(self, img):
-        h = img.shape[0]
-        w = img.shape[1]
-        
+        # 미리 그려둔 ROI mask 로 차량 앞 영역만 남기기
+        # 메인 루프에서는 BEV 공간의 ROI mask 를 사용하므로 따로 호출하지 않는다
         if len(img.shape) == 3:
             # shpae 는 [h, w, c], c는 3-채널 RGB 값
-            c = img.shape[2]
-            mask = np.zeros((h, w, c), dtype=np.uint8)
+            return cv2.bitwise_and(img, img, dst=self.img_crop, mask=self.roi_mask)
 
-            mask_value = (255, 255, 255)
-
-        else:
-            # 2-채널 grayscale, 다른 영역 검정으로
-            c = img.shape[2]
-            mask = np.zeros((h, w, c), dtype=np.uint8)
-
-            mask_value = (255)
-
-        cv2.fillPoly(mask, self.crop_pts, mask_value)
-
-        mask = cv2.bitwise_and(mask, img)
-
-        return mask
+        # 1-채널 grayscale, 다른 영역 검정으로
+        return cv2.bitwise_and(img, img, mask=self.roi_mask)
 
 
 
@@ -199,9 +224,22 @@ class BEVTransform:
 
         self.RT_b2g = np.matmul(np.matmul(self.traslationMtx(xb, 0, zb),    self.rotationMtx(np.deg2rad(-90), 0, 0)),
                                                                             self.rotationMtx(0, 0, np.deg2rad(180)))
+        # 역행렬은 고정값이므로 한 번만 계산
+        self.RT_g2b = np.linalg.inv(self.RT_b2g)
 
         self.proj_mtx = self.project2img_mtx(params_cam)
 
+        # BEV 이미지 pixel (u, v, 1) -> 지면 좌표 (x, y)
+        # BEV 가상 카메라는 높이 zb 에서 지면을 수직으로 내려다보므로 지면까지의 depth 는 항상 zb
+        fc, cx, cy = self.proj_mtx[0, 0], self.proj_mtx[0, 2], self.proj_mtx[1, 2]
+        bev2bird = np.array([[zb/fc,     0, -cx*zb/fc],
+                             [    0, zb/fc, -cy*zb/fc],
+                             [    0,     0,        zb],
+                             [    0,     0,         1]])
+        self.bev2ground = np.matmul(self.RT_b2g, bev2bird)[0:2, :]
+
+        self.bev_roi_mask = None
+
         self._build_tf(params_cam)
 
 
@@ -227,7 +265,7 @@ class BEVTransform:
                                 np.zeros_like(Yu.reshape([1,-1])),
                                 np.ones_like(Yu.reshape([1,-1]))], axis=0)
         
-        xyz_bird = np.matmul(np.linalg.inv(self.RT_b2g), xyz_g)
+        xyz_bird = np.matmul(self.RT_g2b, xyz_g)
 
         xyi = self.project_pts2img(xyz_bird)
 
@@ -239,9 +277,18 @@ class BEVTransform:
         self.perspective_inv_tf = cv2.getPerspectiveTransform(dst_pts, src_pts)
 
 
+    def build_roi_mask(self, roi_mask):
+        # 원본 이미지의 ROI mask 를 BEV 공간으로 한 번만 warp
+        # (BEV 변환 후 masking == masking 후 BEV 변환)
+        bev_mask = cv2.warpPerspective(roi_mask, self.perspective_tf, (self.width, self.height), flags=cv2.INTER_NEAREST)
+        self.bev_roi_mask = cv2.merge([bev_mask, bev_mask, bev_mask])
+
     # warping - 원근 맵에 대한 왜곡 변환
-    def warp_bev_img(self, img):
-        img_warp = cv2.warpPerspective(img, self.perspective_tf, (self.width, self.height), flags=cv2.INTER_LINEAR)
+    def warp_bev_img(self, img, dst=None):
+        img_warp = cv2.warpPerspective(img, self.perspective_tf, (self.width, self.height), dst=dst, flags=cv2.INTER_LINEAR)
+
+        if self.bev_roi_mask is not None and img_warp.ndim == 3:
+            cv2.bitwise_and(img_warp, self.bev_roi_mask, dst=img_warp)
         
         return img_warp
 
@@ -273,6 +320,32 @@ class BEVTransform:
 
         return xyz_g
 
+    def recon_lane_pts_bev(self, img_bev):
+        # BEV 이미지에서 바로 지면 좌표 복원 - bev2ground 행렬곱 1번
+        UV_mark = cv2.findNonZero(img_bev)
+
+        if UV_mark is None:
+            return np.zeros((4, 10))
+
+        return self.recon_lane_pts_uv(UV_mark.reshape([-1, 2]))
+
+    def recon_lane_pts_uv(self, UV_mark):
+        # BEV pixel 좌표 (N, 2) -> 지면 좌표 (4, N)
+        if len(UV_mark) == 0:
+            return np.zeros((4, 10))
+
+        UV_mark = np.asarray(UV_mark, dtype=np.float64)
+
+        xy_g = np.matmul(self.bev2ground[:, 0:2], UV_mark.T) + self.bev2ground[:, 2:3]
+
+        xyz_g = np.concatenate([xy_g,
+                                np.zeros((1, xy_g.shape[1])),
+                                np.ones((1, xy_g.shape[1]))], axis=0)
+
+        xyz_g = xyz_g[:, xyz_g[0,:]>=0]
+
+        return xyz_g
+
 
     def project_lane2img(self, x_pred, y_pred_l, y_pred_r):
         xyz_l_g = np.concatenate([x_pred.reshape([1,-1]),
@@ -287,8 +360,8 @@ class BEVTransform:
                                   np.ones_like(y_pred_r.reshape([1,-1]))
                                   ], axis=0)
 
-        xyz_l_b = np.matmul(np.linalg.inv(self.RT_b2g), xyz_l_g)
-        xyz_r_b = np.matmul(np.linalg.inv(self.RT_b2g), xyz_r_g)
+        xyz_l_b = np.matmul(self.RT_g2b, xyz_l_g)
+        xyz_r_b = np.matmul(self.RT_g2b, xyz_r_g)
 
         xyl = self.project_pts2img(xyz_l_b)
         xyr = self.project_pts2img(xyz_r_b)
@@ -372,9 +445,203 @@ class BEVTransform:
 #========================================================#
 
 
+class LaneTracker:
+    '''
+    BEV 이진화 이미지에서 좌/우 차선을 frame 간 추적
+    \n 차선은 BEV pixel 좌표에서 u = a*v^2 + b*v + c (2차식) 로 표현
+    \n 추적 중 : 이전 차선 다항식 ±margin 안의 pixel 만 사용
+    \n 추적 실패 : 아래쪽 절반 histogram 의 좌/우 peak 에서 시작하는 sliding window 탐색
+    \n 계수는 지수 이동 평균으로 smoothing (다음 frame 탐색 범위용, 발행 경로는 CURVEFit.smooth 로 smoothing)
+    '''
+    def __init__(self, width, height, margin=40, n_windows=9, min_pix=50, smooth=0.5):
+        self.width = width
+        self.height = height
+        self.margin = margin            # 차선 다항식 주변 탐색 폭 (pixel)
+        self.n_windows = n_windows      # sliding window 개수
+        self.min_pix = min_pix          # 차선으로 인정할 최소 pixel 수, 미만이면 추적 실패
+        self.smooth = smooth            # 새 계수 반영 비율 (1 이면 smoothing 없음)
+
+        self.v_eval = np.arange(0, height, dtype=np.float64)
+        self.fits = [None, None]        # left, right
+
+    def is_tracking(self):
+        return self.fits[0] is not None and self.fits[1] is not None
+
+    def reset(self):
+        self.fits = [None, None]
+
+    def search_cols(self):
+        # 이전 차선 주변 열 범위 [(u0, u1), ...], 추적 중이 아니면 None (전체 이미지)
+        if not self.is_tracking():
+            return None
+
+        cols = []
+        for fit in self.fits:
+            u = np.polyval(fit, self.v_eval)
+            u0 = int(np.clip(np.min(u) - self.margin, 0, self.width))
+            u1 = int(np.clip(np.max(u) + self.margin + 1, 0, self.width))
+            if u1 > u0:
+                cols.append((u0, u1))
+
+        # 두 범위가 겹치면 합치기 (같은 열을 두 번 이진화하지 않도록)
+        if len(cols) == 2 and cols[1][0] <= cols[0][1]:
+            cols = [(min(cols[0][0], cols[1][0]), max(cols[0][1], cols[1][1]))]
+
+        return cols
+
+    def update(self, img_lane, cols=None):
+        # 차선 pixel 좌표 (N, 2) [u, v] 반환, cols 가 주어지면 해당 열 범위만 탐색
+        if cols is None:
+            cols = [(0, img_lane.shape[1])]
+
+        UV_list = []
+        for u0, u1 in cols:
+            UV = cv2.findNonZero(img_lane[:, u0:u1])
+            if UV is not None:
+                UV_list.append(UV.reshape([-1, 2]) + [u0, 0])
+
+        if len(UV_list) == 0:
+            self.reset()
+            return np.zeros((0, 2), dtype=np.int32)
+
+        UV = np.concatenate(UV_list, axis=0)
+        u = UV[:, 0].astype(np.float64)
+        v = UV[:, 1].astype(np.float64)
+
+        if self.is_tracking():
+            lane_masks = [np.abs(u - np.polyval(fit, v)) < self.margin for fit in self.fits]
+        else:
+            lane_masks = self.sliding_window(u, v)
+
+        new_fits = []
+        for mask in lane_masks:
+            if np.count_nonzero(mask) < self.min_pix:
+                break
+            new_fits.append(self.fit_quad(v[mask], u[mask]))
+
+        if len(new_fits) < 2:
+            # 신뢰도 부족 - 다음 frame 은 전체 이미지 sliding window 탐색
+            self.reset()
+            return UV
+
+        for i, fit in enumerate(new_fits):
+            if self.fits[i] is None:
+                self.fits[i] = fit
+            else:
+                self.fits[i] = (1 - self.smooth)*self.fits[i] + self.smooth*fit
+
+        return UV[lane_masks[0] | lane_masks[1]]
+
+    def fit_quad(self, v, u):
+        # u = a*v^2 + b*v + c 최소자승, np.polyfit(lstsq) 대신 3x3 정규방정식
+        vn = v/self.height
+        V = np.stack([vn*vn, vn, np.ones_like(vn)])
+        a, b, c = np.linalg.solve(V.dot(V.T), V.dot(u))
+
+        return np.array([a/self.height**2, b/self.height, c])
+
+    def sliding_window(self, u, v):
+        # 아래쪽 절반의 열 방향 histogram 에서 좌/우 시작 위치 탐색
+        bottom = v >= self.height//2
+        histogram = np.bincount(u[bottom].astype(np.int32), minlength=self.width)
+        mid = self.width//2
+        bases = [np.argmax(histogram[:mid]), mid + np.argmax(histogram[mid:])]
+
+        window_h = self.height//self.n_windows
+        lane_masks = []
+
+        for u_cur in bases:
+            mask = np.zeros(len(u), dtype=bool)
+            for w in range(self.n_windows):
+                v_high = self.height - w*window_h
+                v_low = v_high - window_h
+                in_win = (v >= v_low) & (v < v_high) & (np.abs(u - u_cur) < self.margin)
+                mask |= in_win
+
+                # window 안 pixel 이 충분하면 다음 window 중심을 평균 위치로 이동
+                if np.count_nonzero(in_win) > self.min_pix//self.n_windows:
+                    u_cur = np.mean(u[in_win])
+
+            lane_masks.append(mask)
+
+        return lane_masks
+
+
+class RobustPolyFit:
+    '''
+    numpy 로 구현한 RANSAC + 가중 최소자승 다항식 fitting (sklearn RANSACRegressor + Lasso 대체)
+    \n y = coef[0] + coef[1]*x + ... + coef[order]*x^order
+    \n 1. max_trials 개의 무작위 부분집합을 한 번에 뽑아 batch 로 ridge fitting
+    \n 2. 모든 후보(+ 이전 frame 계수)를 행렬곱 1번으로 평가해 inlier 가 가장 많은 후보 선택
+    \n 3. inlier 에 대해 잔차 기반 가중 최소자승 + 이전 frame 계수 prior 로 refinement
+    '''
+    def __init__(self, order=3, alpha=10, max_trials=10, min_samples=50, residual_threshold=0.5, prior_weight=0.1, seed=None):
+        self.order = order
+        self.alpha = alpha                              # 상수항 제외 계수의 L2 regularization 세기
+        self.max_trials = max_trials                    # 무작위 샘플 선택 횟수
+        self.min_samples = min_samples                  # 한 trial 에서 고르는 샘플 수 = fitting 에 필요한 최소 point 수
+        self.residual_threshold = residual_threshold    # inlier 판단 잔차 (파라미터 T)
+        self.prior_weight = prior_weight                # 이전 frame 계수로 당기는 세기
+
+        self.rng = np.random.default_rng(seed)
+        self.reg = np.diag([0.] + [1.]*order)
+        self.coef = np.zeros(order + 1)
+
+    def vander(self, x):
+        return np.vander(np.asarray(x, dtype=np.float64), self.order + 1, increasing=True)
+
+    def set_coef(self, coef):
+        self.coef = np.asarray(coef, dtype=np.float64).copy()
+
+    def predict(self, x):
+        return self.vander(x).dot(self.coef)
+
+    def fit(self, x, y):
+        n = len(x)
+        if n < self.min_samples:
+            return False
+
+        V = self.vander(x)
+        y = np.asarray(y, dtype=np.float64)
+        k = self.min_samples
+
+        # 1. 중복 없는 무작위 부분집합 (max_trials, k) - 난수 행렬을 행 단위 argpartition
+        idx = np.argpartition(self.rng.random((self.max_trials, n)), k - 1, axis=1)[:, :k]
+        Vs = V[idx]
+        ys = y[idx]
+
+        A = np.einsum('tki,tkj->tij', Vs, Vs)/k + self.alpha*self.reg
+        b = np.einsum('tki,tk->ti', Vs, ys)/k
+        C = np.linalg.solve(A, b[..., None])[..., 0]
+
+        # 이전 frame 계수도 후보로 포함
+        C = np.vstack([C, self.coef])
+
+        # 2. 모든 후보의 잔차를 (n, trials+1) 행렬 하나로 계산
+        R = np.abs(V.dot(C.T) - y[:, None])
+        inlier = R < self.residual_threshold
+        best = np.argmax(inlier.sum(axis=0))
+
+        mask = inlier[:, best]
+        m = np.count_nonzero(mask)
+        if m <= self.order:
+            return False
+
+        # 3. 잔차가 작을수록 큰 가중치 + 이전 계수 prior
+        w = 1 - (R[mask, best]/self.residual_threshold)**2
+        Vi = V[mask]
+        Vw = Vi.T*w
+
+        A = Vw.dot(Vi)/m + self.alpha*self.reg + self.prior_weight*np.eye(self.order + 1)
+        b = Vw.dot(y[mask])/m + self.prior_weight*self.coef
+        self.coef = np.linalg.solve(A, b)
+
+        return True
+
+
 class CURVEFit:
-            #   (slef, 다항식 차수- 3차, lasso 상수-1, 차선 폭, 파라 T- 중심축과의 y축 마진(보통 2~3alpha), 차선 추정 x좌표 범위, x좌표 간격, RANSAC 알고리즘에 필요한 최소 포인트 수)
-    def __init__(self, order=3, alpha=10, lane_width=3.5, y_margin=0.5, x_range=5, dx=0.5, min_pts=50):
+            #   (slef, 다항식 차수- 3차, ridge 상수, 차선 폭, 파라 T- 중심축과의 y축 마진(보통 2~3alpha), 차선 추정 x좌표 범위, x좌표 간격, RANSAC 알고리즘에 필요한 최소 포인트 수)
+    def __init__(self, order=3, alpha=10, lane_width=3.5, y_margin=0.5, x_range=5, dx=0.5, min_pts=50, smooth=1.):
 
         self.order = order
         self.lane_width = lane_width
@@ -382,73 +649,69 @@ class CURVEFit:
         self.x_range = x_range
         self.dx = dx
         self.min_pts = min_pts
+        self.smooth = smooth            # 발행 차선의 새 값 반영 비율 (1 이면 smoothing 없음)
+        self.y_pred_smooth = None       # smoothing 된 (y_pred_l, y_pred_r)
 
         self.lane_path = Path()
+        self.path_builder = PathMsgBuilder()
+        self.rng = np.random.default_rng()
         
         #TODO: (2) RANSAC Parameter 결정
-        # RANSAC의 개념 및 아래 링크를 참고하여 적절한 Parameter를 입력하기 바랍니다.
-        # linear_model - RANSACRegressor
+        # RANSAC 의 개념은 sklearn 문서 참고
         # https://scikit-learn.org/stable/modules/generated/sklearn.linear_model.RANSACRegressor.html
-        # linear_model - lasso
-        # https://scikit-learn.org/stable/modules/generated/sklearn.linear_model.Lasso.html#sklearn.linear_model.Lasso
+        # sklearn Lasso(L1) 대신 closed-form 으로 풀리는 ridge(L2) 를 사용한다.
+        # alpha(float): controlling regularization strength
+        self.ransac_left = RobustPolyFit(order=order, alpha=alpha,
+                                         max_trials=10,                             # 무작위 샘플 선택을 위한 최대 반복 횟수
+                                         min_samples=self.min_pts,                  # 무작위로 골라지는 최소 샘플 수
+                                         residual_threshold=self.y_margin)          # 중앙 편차(파라미터 T)
+
+        self.ransac_right = RobustPolyFit(order=order, alpha=alpha,
+                                          max_trials=10,
+                                          min_samples=self.min_pts,
+                                          residual_threshold=self.y_margin)
 
-        # sklearn.linear_model.Lasso()
-        # The optimization objective for Lasso is: (1 / (2 * n_samples)) * ||y - Xw||^2_2 + alpha * ||w||_1
-        # alpha(float, default=1.0): controlling regularization strength
-        self.ransac_left = linear_model.RANSACRegressor(estimator=linear_model.Lasso(alpha=alpha),
-                                                        max_trials=10,                              # 무작위 샘플 선택을 위한 최대 반복 횟수
-                                                        loss='absolute_error',                      # 'absolute_error(default value)' or 'squared_error'
-                                                        min_samples=self.min_pts,                   # 무작위로 골라지는 최소 샘플 수: int (>= 1) or float ([0, 1]), default=None
-                                                        residual_threshold=self.y_margin)           # 중앙 편차(파라미터 T): float, default=None
-
-        self.ransac_right = linear_model.RANSACRegressor(estimator=linear_model.Lasso(alpha=alpha),     # object, default=None
-                                                        max_trials=10,                              # 무작위 샘플 선택을 위한 최대 반복 횟수
-                                                        loss='absolute_error',                      # 'absolute_error(default value)' or 'squared_error'
-                                                        min_samples=self.min_pts,                   # 무작위로 골라지는 최소 샘플 수: int (>= 1) or float ([0, 1]), default=None
-                                                        residual_threshold=self.y_margin)           # 중앙 편차(파라미터 T): float, default=None
+        self._init_model()
 
+    def _init_model(self):
+        # 직선 차선 (y = ±lane_width/2) 으로 초기화 - fitting 없이 계수 직접 설정
+        init_coef = np.zeros(self.order + 1)
 
-        self._init_model()
+        init_coef[0] = 0.5*self.lane_width
+        self.ransac_left.set_coef(init_coef)
 
-    def _init_model(self):        
-        X = np.stack([np.arange(0, 2, 0.02)**i for i in reversed(range(1, self.order+1))]).T
-        y_l = 0.5*self.lane_width*np.ones_like(np.arange(0, 2, 0.02))
-        y_r = -0.5*self.lane_width*np.ones_like(np.arange(0, 2, 0.02))
+        init_coef[0] = -0.5*self.lane_width
+        self.ransac_right.set_coef(init_coef)
 
-        self.ransac_left.fit(X, y_l)
-        self.ransac_right.fit(X, y_r)
+        self.y_pred_smooth = None
 
- 
     def preprocess_pts(self, lane_pts):
-        idx_list = []
+        x_g = lane_pts[0, :]
+        y_g = lane_pts[1, :]
 
-        # Random Sampling
-        for d in np.arange(0, self.x_range, self.dx):
+        # Random Sampling - dx 구간별 최대 min_pts 개
+        # 구간 번호로 정렬하고 같은 구간 안은 난수로 섞은 뒤, 구간 안 순위가 min_pts 미만인 point 만 사용
+        valid = np.flatnonzero((x_g >= 0) & (x_g < self.x_range))
+        bins = np.floor(x_g[valid]/self.dx).astype(np.int32)
 
-            idx_full_list = np.where(np.logical_and(lane_pts[0, :]>=d, lane_pts[0, :]<d+self.dx))[0].tolist()
-            
-            idx_list += random.sample(idx_full_list, np.minimum(self.min_pts, len(idx_full_list)))
+        order = np.lexsort((self.rng.random(len(valid)), bins))
+        bins_sorted = bins[order]
+        rank = np.arange(len(order)) - np.searchsorted(bins_sorted, bins_sorted, side='left')
 
-        lane_pts = lane_pts[:, idx_list]
-        x_g = np.copy(lane_pts[0, :])
-        y_g = np.copy(lane_pts[1, :])
+        idx = valid[order[rank < self.min_pts]]
+        x_g = x_g[idx]
+        y_g = y_g[idx]
         
         # 이전 Frame의 Fitting 정보를 활용하여 현재 Line에 대한 Point를 분류
-        X_g = np.stack([x_g**i for i in reversed(range(1, self.order+1))]).T
+        #1. Sampling 된 Point들의 X좌표로 이전 frame curve 의 Y좌표 예측
+        #2. 결과로 나온 Y좌표가 실제 값의 Y좌표와 마진보다 작게 차이나면 Left, Right Lane Point 집합에 추가
+        y_ransac_collect_r = self.ransac_right.predict(x_g)
+        mask_r = np.abs(y_g - y_ransac_collect_r) < self.y_margin
 
-        y_ransac_collect_r = self.ransac_right.predict(X_g)
-        y_right = y_g[np.logical_and(y_g >= y_ransac_collect_r-self.y_margin, y_g < y_ransac_collect_r+self.y_margin)]
-        x_right = x_g[np.logical_and(y_g >= y_ransac_collect_r-self.y_margin, y_g < y_ransac_collect_r+self.y_margin)]
-
-        y_ransac_collect_l = self.ransac_left.predict(X_g)
-        y_left = y_g[np.logical_and(y_g >= y_ransac_collect_l-self.y_margin, y_g < y_ransac_collect_l+self.y_margin)]
-        x_left = x_g[np.logical_and(y_g >= y_ransac_collect_l-self.y_margin, y_g < y_ransac_collect_l+self.y_margin)]
-        
-        #1. Sampling 된 Point들의 X좌표를 활용하여 Prediction Input 생성
-        #2. RANSAC을 활용하여 Prediction 수행
-        #3. 결과로 나온 Y좌표가 실제 값의 Y좌표와 마진보다 작게 차이나면 Left, Right Lane Point 집합에 추가
+        y_ransac_collect_l = self.ransac_left.predict(x_g)
+        mask_l = np.abs(y_g - y_ransac_collect_l) < self.y_margin
         
-        return x_left, y_left, x_right, y_right
+        return x_g[mask_l], y_g[mask_l], x_g[mask_r], y_g[mask_r]
 
     def fit_curve(self, lane_pts):
         # 기존 Curve를 바탕으로 Point 분류
@@ -460,26 +723,16 @@ class CURVEFit:
 
             x_left, y_left, x_right, y_right = self.preprocess_pts(lane_pts)
         
-        # 1. 분류된 point들의 X좌표를 활용하야 Fit Input 생성
-        # 2. RANSAC Fitting 수행
-        # 3. Curve Prediction에 사용할 Input 생성
-        # 4. RANSAC Prediction 수행
-        # 5. Fitting에 사용한 Point의 수와 Minimum samples 수를 비교하여 예외처리
-        
-        X_left = np.stack([x_left**i for i in reversed(range(1, self.order+1))]).T
-        X_right = np.stack([x_right**i for i in reversed(range(1, self.order+1))]).T
-
-        if y_left.shape[0] >= self.ransac_left.min_samples:
-            self.ransac_left.fit(X_left, y_left)
-        
-        if y_right.shape[0] >= self.ransac_right.min_samples:
-            self.ransac_right.fit(X_right, y_right)
+        # 1. 분류된 point 로 RANSAC Fitting 수행 (point 수가 min_samples 미만이면 이전 계수 유지)
+        # 2. RANSAC Prediction 수행
+        # 3. Fitting에 사용한 Point의 수와 Minimum samples 수를 비교하여 예외처리
+        self.ransac_left.fit(x_left, y_left)
+        self.ransac_right.fit(x_right, y_right)
 
         x_pred = np.arange(0, self.x_range, self.dx).astype(np.float32)
-        X_pred = np.stack([x_pred**i for i in reversed(range(1, self.order+1))]).T
 
-        y_pred_l = self.ransac_left.predict(X_pred)
-        y_pred_r = self.ransac_right.predict(X_pred)
+        y_pred_l = self.ransac_left.predict(x_pred)
+        y_pred_r = self.ransac_right.predict(x_pred)
 
         #END
 
@@ -510,33 +763,32 @@ class CURVEFit:
         else:
             pass
 
-        return x_pred, y_pred_l, y_pred_r
+        return (x_pred,) + self.smooth_pred(y_pred_l, y_pred_r)
+
+    def smooth_pred(self, y_pred_l, y_pred_r):
+        # x_pred 는 매 frame 같으므로 예측값의 지수 이동 평균 = 다항식 계수의 지수 이동 평균
+        if self.y_pred_smooth is None or self.smooth >= 1:
+            self.y_pred_smooth = (y_pred_l, y_pred_r)
+        else:
+            l, r = self.y_pred_smooth
+            self.y_pred_smooth = ((1 - self.smooth)*l + self.smooth*y_pred_l,
+                                  (1 - self.smooth)*r + self.smooth*y_pred_r)
+
+        return self.y_pred_smooth
 
     def update_lane_width(self, y_pred_l, y_pred_r):
         self.lane_width = np.clip(np.max(y_pred_l - y_pred_r), 3.5, 5)
 
     def write_path_msg(self, x_pred, y_pred_l, y_pred_r, frame_id='/map'):
-        self.lane_path = Path()
-
         trans_matrix = np.array([   [math.cos(self.vehicle_yaw), -math.sin(self.vehicle_yaw),self.vehicle_pos_x],
                                     [math.sin(self.vehicle_yaw),  math.cos(self.vehicle_yaw),self.vehicle_pos_y],
                                     [                        0 ,                          0 ,                1 ]    ])
 
-        self.lane_path.header.frame_id = frame_id
-
-        for i in range(len(x_pred)):
-            local_result = np.array([[x_pred[i]], [(0.5)*(y_pred_l[i] + y_pred_r[i])], [1]])
-            global_result = trans_matrix.dot(local_result)
-
-            tmp_pose = PoseStamped()
-            tmp_pose.pose.position.x = global_result[0][0]
-            tmp_pose.pose.position.y = global_result[1][0]
-            tmp_pose.pose.position.z = 0
-            tmp_pose.pose.orientation.x = 0
-            tmp_pose.pose.orientation.y = 0
-            tmp_pose.pose.orientation.z = 0
-            tmp_pose.pose.orientation.w = 1
-            self.lane_path.poses.append(tmp_pose)
+        # 좌/우 차선 중앙 경로를 행렬곱 1번으로 map 좌표로 변환
+        global_result = transform_points(trans_matrix, x_pred, 0.5*(y_pred_l + y_pred_r))
+
+        self.path_builder.frame_id = frame_id
+        self.lane_path = self.path_builder.build(global_result)
 
         return self.lane_path
 
@@ -4,61 +4,71 @@
 import rospy
 import cv2
 import numpy as np
-import os, rospkg
+import os, sys, rospkg
 
-from sensor_msgs.msg import CompressedImage
-from cv_bridge import CvBridgeError
+current_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(current_path)
+
+from camera_frame_bus import CameraSubscriber
+from lane_binarizer import LaneBinarizer, start_reconfigure_server
 
 # image parser binarization Node - HSV 영역의 특정 색상(white & yellow) 범위만 출력
 # white & yellow 색상 범위 - 합친 코드
+# 색상 범위는 lane_binarizer 모듈과 공유하며, rqt_reconfigure 로 실시간 조정 가능
 
 # 노드 실행 순서 
 # 1. HSV 색상 영역 지정
-# 2. 특정 영역의 색상 검출
-# 3. 비트 연산을 통핸 두 이미지의 합
+# 2. 특정 영역의 색상 검출 (채널별 LUT 로 white / yellow 를 한 번에 class 구분)
+# 3. class 별 색으로 차선 이미지 생성
 # 4. 이미지 출력
 
+# 출력 이미지에서 색상 class 별 표시 색 (BGR)
+LANE_DRAW_COLOR = {'white': (255, 255, 255), 'yellow': (0, 255, 255)}
+
 class IMGParser:
     def __init__(self):
-        self.image_sub = rospy.Subscriber("/image_jpeg/compressed", CompressedImage, self.callback)
-
-    def callback(self, msg):
-        try:
-            # 카메라 데이터 받아서 데이터 변환 - Byte 단위 이미지 -> np.array
-            # np.fromstring 함수를 이용하여 데이터를 uint8 형태로 변환
-            np_arr = np.frombuffer(msg.data, dtype='uint8')
-            # 1차원 배열 형태 np_arr를 3차원 배열의 bgr 형태로 변환
-            img_bgr = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        #TODO: (1) HSV 색상 영역 지정
+        self.binarizer = LaneBinarizer()
+        self.reconfigure_server = start_reconfigure_server(self.binarizer)
 
-        except CvBridgeError as e:
-            print(e)
+        # class bit -> 표시 색 palette (여러 class 가 겹치면 앞 순서 class 색)
+        names = self.binarizer.ranges[0]
+        self.palette = np.zeros((256, 3), dtype=np.uint8)
+        for bits in range(1, 256):
+            k = (bits & -bits).bit_length() - 1
+            if k < len(names):
+                self.palette[bits] = LANE_DRAW_COLOR.get(names[k], (0, 255, 0))
 
-        # cv2.cvtColor() - bgr 이미지 -> HSV 이미지 
-        img_hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
+        self.img_bits = None
+        self.img_concat = None
 
-        # white, yellow 색상 영역 검출하기 위해 범위를 지정
-        lower_wlane = np.array([0,0,205])
-        upper_wlane = np.array([30,60,255])
+        # 카메라 데이터 수신 - JPEG 직접 디코딩 또는 camera_frontend 공유 메모리 (~use_frame_bus)
+        self.image_sub = CameraSubscriber(self.callback)
 
-        lower_ylane = np.array([0,70,120])# ([0,60,100])
-        upper_ylane = np.array([40,195,230])# ([40,175,255])
+    def callback(self, frame):
+        img_bgr = frame.bgr
+        h, w = img_bgr.shape[:2]
 
-        # cv2.inRange("이미지 정보", 하한 값, 상한 값) - 특정 색상 영역을 추출, 범위 지정
-        img_wlane = cv2.inRange(img_hsv, lower_wlane, upper_wlane)
-        img_wlane = cv2.cvtColor(img_wlane, cv2.COLOR_GRAY2BGR)
+        if self.img_bits is None or self.img_bits.shape != (h, w):
+            self.img_bits = np.empty((h, w), dtype=np.uint8)
+            self.img_concat = np.empty((h, 2 * w, 3), dtype=np.uint8)
 
-        img_ylane = cv2.inRange(img_hsv, lower_ylane, upper_ylane)
-        img_ylane = cv2.cvtColor(img_ylane, cv2.COLOR_GRAY2BGR)
+        # bgr 이미지 -> HSV 이미지
+        img_hsv = frame.hsv
 
+        #TODO: (2) 특정 영역의 색상 검출
+        img_bits = self.binarizer.label(img_hsv, dst=self.img_bits)
 
-        # 비트 연산을 통해 두 이미지 합치기
-        img_lane = cv2.bitwise_or(img_wlane, img_ylane)
-        # np.concatenate() - 서로 다른 두 배열 합치는 함수
-        img_concat = np.concatenate((img_bgr, img_lane), axis=1)
+        #TODO: (3) class 별 색으로 차선 이미지 생성 - 원본과 나란히 출력 버퍼에 기록
+        self.img_concat[:, :w] = img_bgr
+        self.img_concat[:, w:] = self.palette[img_bits]
 
+        # frame bus 사용 시 처리하는 동안 공유 메모리 slot 이 덮어써졌으면 출력하지 않음
+        if not frame.is_valid():
+            return
 
-        # 출력
-        cv2.imshow("Ego-0 Bin Cam", img_concat)
+        #TODO: (4) 출력
+        cv2.imshow("Ego-0 Bin Cam", self.img_concat)
         cv2.waitKey(1)      # 단위: ms
 
 
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import cv2
+import numpy as np
+import time
+
+from collections import OrderedDict
+
+# lane_binarizer 는 HSV 이미지에서 차선 색상(white, yellow ...)을 이진화하는 공용 모듈입니다.
+# image_lane_fitting, image_parser_binarization 이 같은 색상 범위와 같은 코드를 사용하고,
+# 색상 범위는 dynamic_reconfigure(cfg/LaneBinarize.cfg)로 노드 재시작 없이 바꿀 수 있습니다.
+
+# 이진화 방식 - 채널별 256-entry LUT 로 "이 채널 값이 k 번째 색상 범위 안" 을 bit k 로 표시하고,
+# H / S / V 세 LUT 결과를 AND 하면 bit k 가 남은 화소가 k 번째 색상 (색상 개수와 상관없이 한 번에 계산)
+# - label()    : 색상 class bit mask (split 1번 + LUT 3번 + AND 2번)
+# - binarize() : 모든 색상을 합친 차선 mask (0/255) = label() != 0
+# 중간 결과는 매 프레임 새로 만들지 않고 미리 만든 버퍼를 재사용
+# 640x480, 1 core 측정 (python3 lane_binarizer.py 로 재측정 가능, 측정마다 +-30% 정도 흔들림)
+#   색상 수                              1        2        3        4
+#   기존 (색상마다 inRange + bitwise_or)  0.31 ms  0.54 ms  0.83 ms  1.13 ms
+#   binarize() (채널별 LUT)              0.52 ms  0.54 ms  0.52 ms  0.57 ms
+#   (label() 은 binarize() 와 거의 같고, 이전 구현 (3 채널 LUT + numpy AND) 은 2 색상에서 1.3 ~ 1.9 ms)
+# 현재 설정(white, yellow 2 색상)에서는 기존과 속도 차이가 없고, 색상이 3 개 이상이면 LUT 쪽이 빠름
+
+# 사용 예
+#   binarizer = LaneBinarizer()
+#   img_lane = binarizer.binarize(img_hsv, dst=img_lane)
+#   img_bits = binarizer.label(img_hsv)     # img_bits & binarizer.bit('yellow')
+
+# 차선 색상별 HSV 범위 (lower, upper)
+LANE_COLOR_RANGES = OrderedDict([
+    ('white',  ([0, 0, 205],  [30, 60, 255])),
+    ('yellow', ([0, 70, 120], [40, 195, 230])),     # ([0,60,100]), ([40,175,255])
+])
+
+
+class LaneBinarizer:
+    def __init__(self, color_ranges=LANE_COLOR_RANGES):
+        # 중간 결과용 scratch 버퍼 (이미지 크기가 바뀔 때만 새로 만듦)
+        self.scratch = {}
+        self.set_ranges(color_ranges)
+
+    def set_ranges(self, color_ranges):
+        '''
+        # 색상 범위 설정 + LUT 재계산 (dynamic_reconfigure 콜백에서 호출)
+        # color_ranges : {name: (lower[h, s, v], upper[h, s, v])}, 최대 8 개
+        '''
+        if len(color_ranges) > 8:
+            raise ValueError("LaneBinarizer supports up to 8 colour classes : {}".format(len(color_ranges)))
+
+        names = list(color_ranges.keys())
+        bounds = [(np.array(lower, dtype=np.uint8), np.array(upper, dtype=np.uint8)) for lower, upper in color_ranges.values()]
+
+        # 채널별 LUT : 값 v 가 k 번째 색상의 해당 채널 범위 안이면 bit k 를 켠다
+        luts = [np.zeros((1, 256), dtype=np.uint8) for _ in range(3)]
+        for k, (lower, upper) in enumerate(bounds):
+            for c in range(3):
+                luts[c][0, lower[c]:int(upper[c]) + 1] |= np.uint8(1 << k)
+
+        # 콜백 thread 에서 바뀌어도 이진화 중인 프레임은 이전 값을 그대로 쓰도록 한 번에 교체
+        self.ranges = (names, bounds, luts)
+
+    def get_ranges(self):
+        names, bounds, _ = self.ranges
+        return OrderedDict((name, (lower.tolist(), upper.tolist())) for name, (lower, upper) in zip(names, bounds))
+
+    def bit(self, name):
+        return 1 << self.ranges[0].index(name)
+
+    def _scratch(self, h, w):
+        # (h, w) uint8 버퍼 4 개 : H / S / V 채널, LUT 결과
+        bufs = self.scratch.get((h, w))
+        if bufs is None:
+            self.scratch.clear()
+            bufs = self.scratch[(h, w)] = [np.empty((h, w), dtype=np.uint8) for _ in range(4)]
+        return bufs
+
+    def binarize(self, img_hsv, dst=None):
+        '''
+        # 모든 색상을 합친 차선 mask
+        # Input
+            # img_hsv : HSV 이미지 (h, w, 3)
+            # dst : (h, w) uint8 출력 버퍼 (slice view 가능), None 이면 새로 생성
+        # Output
+            # dst : 차선 255, 나머지 0
+        '''
+        dst = self.label(img_hsv, dst)
+        cv2.compare(dst, 0, cv2.CMP_GT, dst=dst)
+
+        return dst
+
+    def label(self, img_hsv, dst=None):
+        '''
+        # 색상 class bit mask
+        # Output
+            # dst : (h, w) uint8, bit k 가 켜져 있으면 k 번째 색상 (여러 색상 범위가 겹치면 여러 bit)
+        '''
+        _, _, luts = self.ranges
+        h, w = img_hsv.shape[:2]
+        if dst is None:
+            dst = np.empty((h, w), dtype=np.uint8)
+
+        planes = self._scratch(h, w)
+        tmp = planes[3]
+        cv2.split(img_hsv, planes[:3])
+        cv2.LUT(planes[0], luts[0], dst=dst)
+        for c in (1, 2):
+            cv2.LUT(planes[c], luts[c], dst=tmp)
+            cv2.bitwise_and(dst, tmp, dst=dst)
+
+        return dst
+
+
+def config_to_ranges(config, names):
+    # dynamic_reconfigure config -> {name: (lower, upper)}
+    return OrderedDict(
+        (name, ([config['{}_{}_lower'.format(name, ch)] for ch in 'hsv'],
+                [config['{}_{}_upper'.format(name, ch)] for ch in 'hsv']))
+        for name in names)
+
+
+def start_reconfigure_server(binarizer):
+    '''
+    # dynamic_reconfigure 서버 시작 (cfg/LaneBinarize.cfg)
+    # 패키지를 catkin_make 로 빌드하지 않아 설정 모듈이 없으면 고정 범위로 동작
+    '''
+    import rospy
+
+    try:
+        from dynamic_reconfigure.server import Server
+        from ssafety.cfg import LaneBinarizeConfig
+    except ImportError as err:
+        rospy.logwarn("lane_binarizer: dynamic_reconfigure disabled ({})".format(err))
+        return None
+
+    names = binarizer.ranges[0]
+
+    def callback(config, level):
+        binarizer.set_ranges(config_to_ranges(config, names))
+        return config
+
+    return Server(LaneBinarizeConfig, callback)
+
+
+def benchmark(width=640, height=480, n_iter=200):
+    # 기존 방식(색상마다 inRange + bitwise_or)과 비교, 색상 수 1 ~ 4
+    rng = np.random.default_rng(0)
+    img_hsv = cv2.cvtColor((rng.random((height, width, 3)) * 255).astype(np.uint8), cv2.COLOR_BGR2HSV)
+    color_ranges = list(LANE_COLOR_RANGES.items()) + [('blue', ([100, 80, 80], [130, 255, 255])),
+                                                      ('red', ([160, 80, 80], [179, 255, 255]))]
+
+    def measure(func):
+        func()
+        start = time.perf_counter()
+        for _ in range(n_iter):
+            func()
+        return (time.perf_counter() - start) / n_iter * 1e3
+
+    for n in range(1, len(color_ranges) + 1):
+        bounds = [(np.array(l, dtype=np.uint8), np.array(u, dtype=np.uint8)) for _, (l, u) in color_ranges[:n]]
+        binarizer = LaneBinarizer(OrderedDict(color_ranges[:n]))
+        img_lane = np.empty((height, width), dtype=np.uint8)
+        img_bits = np.empty((height, width), dtype=np.uint8)
+
+        def baseline():
+            img_mask = cv2.inRange(img_hsv, bounds[0][0], bounds[0][1])
+            for lower, upper in bounds[1:]:
+                img_mask = cv2.bitwise_or(img_mask, cv2.inRange(img_hsv, lower, upper))
+            return img_mask
+
+        assert np.array_equal(baseline(), binarizer.binarize(img_hsv, img_lane))
+        for k, (lower, upper) in enumerate(bounds):
+            assert np.array_equal(cv2.inRange(img_hsv, lower, upper) > 0,
+                                  binarizer.label(img_hsv, img_bits) & (1 << k) > 0)
+
+        print('{} colours - inRange + bitwise_or : {:.3f} ms, binarize : {:.3f} ms, label : {:.3f} ms'.format(
+            n, measure(baseline), measure(lambda: binarizer.binarize(img_hsv, img_lane)),
+            measure(lambda: binarizer.label(img_hsv, img_bits))))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -9,6 +9,11 @@ from geometry_msgs.msg import Point, PoseStamped, Point32
 from nav_msgs.msg import Path
 import numpy as np
 
+current_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(current_path)
+
+from path_msg_util import PathMsgBuilder, transform_points
+
 # lattice_planner은 충돌 회피 경로 생성 및 선택 예제
 # 차량 경로상의 장애물을 탐색하여 충돌 여부의 판단은 지역경로(/local_path)와 장애물 정보(/Object_topic)를 받아 판단
 # 충돌이 예견될 경우 회피경로를 생성 및 선택 하고 새로운 지역경로(/lattice_path)를 Pulish한다.
@@ -61,6 +66,11 @@ class latticePlanner:
 
         self.lattice_path_pub = rospy.Publisher("/lattice_path", Path, queue_size=10)
 
+        # 회피 경로 오프셋, 오프셋별 Rviz 시각화 publisher 와 Path builder 는 한 번만 생성
+        self.lane_off_set = [-3.0, -1.75, -1, 1, 1.75, 3.0]
+        self.lattice_pubs = [rospy.Publisher('/lattice_path_{}'.format(i+1), Path, queue_size=1) for i in range(len(self.lane_off_set))]
+        self.path_builders = [PathMsgBuilder('/map') for _ in self.lane_off_set]
+
         self.is_path = False
         self.is_status = False
         self.is_obj = False
@@ -169,7 +179,7 @@ class latticePlanner:
             world_ego_vehicle_position = np.array([[vehicle_pose_x], [vehicle_pose_y], [1]])
             # 시작점(global_ref_start_point)을 기준으로 변환한 자동차(world_ego_vehicle_position) 좌표
             local_ego_vehicle_position = det_trans_matrix.dot(world_ego_vehicle_position)
-            lane_off_set = [-3.0, -1.75, -1, 1, 1.75, 3.0]
+            lane_off_set = self.lane_off_set
             local_lattice_points = []
             
             for i in range(len(lane_off_set)):
@@ -180,11 +190,18 @@ class latticePlanner:
             # Path 생성 방식은 3차 방정식을 이용하며 lane_change_ 예제와 동일한 방식의 경로 생성을 하면 됩니다.
             # 생성된 Lattice 경로는 out_path 변수에 List 형식으로 넣습니다.
 
-            for end_point in local_lattice_points:
-                # lane_change_3.py의 내용 참고
-                waypoints_x=[]
-                waypoints_y=[]
+            # Add_point
+            # 3 차 곡선 경로가 모두 만들어 졌다면 이후 주행 경로를 추가 합니다.
+            # 기준 경로 점 i 에서 진행 방향(i -> i+1)의 법선 방향으로 lane_off_set 만큼 이동한 점을 행렬 연산으로 한 번에 계산
+            ref_xy = np.array([[pose.pose.position.x, pose.pose.position.y] for pose in ref_path.poses])
+            add_point_size = min(int(vehicle_velocity * 2), len(ref_path.poses) - 1)
+            add_idx = np.arange(look_distance*2, add_point_size)
 
+            tmp_theta = np.arctan2(ref_xy[add_idx + 1, 1] - ref_xy[add_idx, 1], ref_xy[add_idx + 1, 0] - ref_xy[add_idx, 0])
+            add_normal = np.stack([-np.sin(tmp_theta), np.cos(tmp_theta)], axis=1)
+
+            for lane_num, end_point in enumerate(local_lattice_points):
+                # lane_change_3.py의 내용 참고
                 x_interval = 0.5        # 생성할 Path 의 Point 간격
                 x_start = 0
                 x_end = end_point[0]
@@ -193,8 +210,7 @@ class latticePlanner:
                 # 필요한 Point 수
                 x_num = x_end / x_interval
                 # 계산된 Point 의 숫자 만큼 X 좌표를 생성한다.
-                for i in range(x_start, int(x_num)):
-                    waypoints_x.append(i*x_interval)
+                waypoints_x = np.arange(x_start, int(x_num)) * x_interval
 
                 # 3차 곡선을 이용한 주행 경로 생성
                 # 시작 위치와 목표 위치 사이 부드러운 곡선 경로
@@ -206,67 +222,21 @@ class latticePlanner:
                 b = 3 * (y_end - y_start) / x_end**2
                 a = -2 * (y_end - y_start) / x_end**3
 
-                for x in waypoints_x:
-                    result = a * x**3 + b * x**2 + c * x + d
-                    waypoints_y.append(result)
-                    
+                waypoints_y = a * waypoints_x**3 + b * waypoints_x**2 + c * waypoints_x + d
 
                 # Local Result: 차선 변경 시작 위치 기준 좌표의 Point 정보,
                 # Global Result: map 기준 좌표의 Point 좌표
                 # 좌표 변환 행렬을 통해 Local Result 를 이용해 Global Result 를 계산한다.
                 # Global Result 는 차선 변경 Path 의 데이터가 된다.
+                global_result = transform_points(trans_matrix, waypoints_x, waypoints_y)
+                add_result = ref_xy[add_idx] + lane_off_set[lane_num] * add_normal
 
-                lattice_path = Path()
-                lattice_path.header.frame_id = '/map'
-                for i in range(0,len(waypoints_y)) :
-                    local_result = np.array([[waypoints_x[i]],[waypoints_y[i]],[1]])
-                    global_result = trans_matrix.dot(local_result)
+                out_path.append(self.path_builders[lane_num].build(np.vstack([global_result, add_result])))
 
-                    read_pose=PoseStamped()
-                    read_pose.pose.position.x = global_result[0][0]
-                    read_pose.pose.position.y = global_result[1][0]
-                    read_pose.pose.position.z = 0.
-                    read_pose.pose.orientation.x = 0
-                    read_pose.pose.orientation.y = 0
-                    read_pose.pose.orientation.z = 0
-                    read_pose.pose.orientation.w = 1
-
-                    lattice_path.poses.append(read_pose)
-
-                out_path.append(lattice_path)
-
-            # Add_point
-            # 3 차 곡선 경로가 모두 만들어 졌다면 이후 주행 경로를 추가 합니다.
-            add_point_size = min(int(vehicle_velocity * 2), len(ref_path.poses))
-            
-            for i in range(look_distance*2,add_point_size):
-                if i+1 < len(ref_path.poses):
-                    tmp_theta = atan2(ref_path.poses[i + 1].pose.position.y - ref_path.poses[i].pose.position.y,ref_path.poses[i + 1].pose.position.x - ref_path.poses[i].pose.position.x)
-                    tmp_translation = [ref_path.poses[i].pose.position.x,ref_path.poses[i].pose.position.y]
-                    tmp_t = np.array([[cos(tmp_theta), -sin(tmp_theta), tmp_translation[0]], [sin(tmp_theta), cos(tmp_theta), tmp_translation[1]], [0, 0, 1]])
-
-                    for lane_num in range(len(lane_off_set)) :
-                        local_result = np.array([[0], [lane_off_set[lane_num]], [1]])
-                        global_result = tmp_t.dot(local_result)
-
-                        read_pose = PoseStamped()
-                        read_pose.pose.position.x = global_result[0][0]
-                        read_pose.pose.position.y = global_result[1][0]
-                        read_pose.pose.position.z = 0
-                        read_pose.pose.orientation.x = 0
-                        read_pose.pose.orientation.y = 0
-                        read_pose.pose.orientation.z = 0
-                        read_pose.pose.orientation.w = 1
-                        out_path[lane_num].poses.append(read_pose)
-            
             #TODO: (5) 생성된 모든 Lattice 충돌 회피 경로 메시지 Publish
             # 생성된 모든 Lattic 충돌 회피 경로는 Rviz 창에서 시각화
-
-            for i in range(len(out_path)):
-                # Ros에 globals라는 함수 내에서 딕셔너리로 기본적으로 제공되는 변수가 있는데 lattice_pub_1라는 키가 있고 
-                # 해당 키에 /lattice_path_1 같은 이름으로 publisher를 지정할 수 있는 것 같다.
-                globals()['lattice_pub_{}'.format(i+1)] = rospy.Publisher('/lattice_path_{}'.format(i+1), Path, queue_size=1)
-                globals()['lattice_pub_{}'.format(i+1)].publish(out_path[i])
+            for lattice_pub, lattice_path in zip(self.lattice_pubs, out_path):
+                lattice_pub.publish(lattice_path)
 
         return out_path
 
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+#-*- coding:utf-8 -*-
+
+import rospy
+import cv2
+import numpy as np
+import os, sys, rospkg
+import json
+import math
+
+from sensor_msgs.msg import PointCloud2
+import sensor_msgs.point_cloud2 as pc2
+from nav_msgs.msg import Odometry
+from morai_msgs.msg import ObjectStatus, ObjectStatusList
+from tf.transformations import euler_from_quaternion
+
+current_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(current_path)
+
+from lidar_ex_calib_velodyne import getTransformMat, getCameraMat
+from lidar_camera_projection import LiDARCameraProjector
+from camera_pedes_detector import non_maximum_supression
+from camera_frame_bus import CameraSubscriber
+
+# lidar_camera_fusion 은 카메라 보행자 검출 결과(HOG + SVM)에 LiDAR 거리를 붙여주는 예제입니다.
+# 매 프레임 LiDAR scan 을 이미지 평면으로 한 번만 투영하고, 모든 검출 박스가 그 투영 결과를 같이 사용합니다.
+# 박스 안 점들의 depth percentile 로 거리를 정하고, 해당 점들의 LiDAR 좌표로 map 좌표를 계산해
+# 시뮬레이터 ground truth(/Object_topic)와 같은 ObjectStatusList 형식으로 송신합니다. (pedestrian_list 만 채움)
+# acc.py 를 args="/Object_topic_to_camera" 로 실행하면 차량 / 장애물은 /Object_topic 그대로 두고
+# 보행자 ACC 만 차량 센서(카메라 + LiDAR) 결과로 수행합니다.
+
+# 노드 실행 순서
+# 1. sensor_params.json 에서 Camera, LiDAR 설치 정보 읽기
+# 2. 투영 행렬(Extrinsic·Intrinsic) 1회 계산
+# 3. HOG descriptor + 사전 학습된 SVM 분류기 설정
+# 4. 보행자 검출 + NMS
+# 5. LiDAR scan 투영 (프레임당 1회)
+# 6. 박스별 depth percentile -> LiDAR 좌표 -> map 좌표
+# 7. ObjectStatusList 메시지 Publish
+
+class LiDARCameraFusion:
+    def __init__(self, pkg_name='ssafety'):
+        rospy.Subscriber("/lidar3D", PointCloud2, self.scan_callback)
+        self.camera_sub = CameraSubscriber(self.img_callback)
+        rospy.Subscriber("/odom", Odometry, self.odom_callback)
+
+        self.object_pub = rospy.Publisher('/Object_topic_to_camera', ObjectStatusList, queue_size=1)
+
+        self.pc_np = None
+        self.img_bgr = None
+        self.is_odom = False
+
+        #TODO: (1) sensor_params.json 에서 Camera, LiDAR 설치 정보 읽기
+        rospack = rospkg.RosPack()
+        currentPath = rospack.get_path(pkg_name)
+
+        with open(os.path.join(currentPath, 'sensor/sensor_params.json'), 'r') as fp:
+            sensor_params = json.load(fp)
+
+        params_cam = sensor_params["params_cam"]
+        self.params_lidar = sensor_params["params_lidar"]
+
+        #TODO: (2) 투영 행렬 1회 계산
+        self.projector = LiDARCameraProjector(getTransformMat(params_cam, self.params_lidar),
+                                              getCameraMat(params_cam),
+                                              params_cam["WIDTH"], params_cam["HEIGHT"])
+
+        #TODO: (3) HOG descriptor + 사전 학습된 SVM 분류기 설정
+        self.pedes_detector = cv2.HOGDescriptor()
+        self.pedes_detector.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+        # 박스 안 depth percentile, percentile 거리에서 같은 물체로 볼 depth 범위(m)
+        self.depth_percentile = 20
+        self.depth_margin = 1.0
+
+        rate = rospy.Rate(10)
+        while not rospy.is_shutdown():
+            if self.img_bgr is not None and self.pc_np is not None and self.is_odom:
+                object_list = self.fusion(self.img_bgr, self.pc_np)
+                self.object_pub.publish(object_list)
+
+            rate.sleep()
+
+    def img_callback(self, frame):
+        # bus 프레임은 공유 메모리 view 라 메인 루프에서 쓰는 동안 덮어써질 수 있으므로 노드 소유 배열로 보관
+        img_bgr = frame.own_bgr()
+        if img_bgr is not None:
+            self.img_bgr = img_bgr
+
+    def scan_callback(self, msg):
+        self.pc_np = np.array(list(pc2.read_points(msg, field_names=("x", "y", "z"), skip_nans=True)), np.float32)
+
+    def odom_callback(self, msg):
+        self.is_odom = True
+        odom_quaternion = (msg.pose.pose.orientation.x, msg.pose.pose.orientation.y, msg.pose.pose.orientation.z, msg.pose.pose.orientation.w)
+        _, _, self.vehicle_yaw = euler_from_quaternion(odom_quaternion)
+        self.vehicle_pos_x = msg.pose.pose.position.x
+        self.vehicle_pos_y = msg.pose.pose.position.y
+
+    def detect(self, img_bgr):
+        #TODO: (4) 보행자 검출 + NMS
+        img_gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+        (rects, weights) = self.pedes_detector.detectMultiScale(img_gray, winStride=(4, 4), padding=(2, 2), scale=32)
+
+        if len(rects) == 0:
+            return []
+
+        return non_maximum_supression(rects, scores=np.asarray(weights).reshape(-1))
+
+    def fusion(self, img_bgr, pc_np):
+        object_list = ObjectStatusList()
+        object_list.header.frame_id = 'map'
+        object_list.header.stamp = rospy.Time.now()
+
+        rects = self.detect(img_bgr)
+        if len(rects) == 0:
+            return object_list
+
+        #TODO: (5) LiDAR scan 투영 - 모든 박스가 같은 투영 결과를 공유
+        u, v, depth, index = self.projector.project(pc_np, return_index=True)
+
+        # LiDAR -> map 변환 (LiDAR 설치 위치 + 차량 yaw)
+        trans_matrix = np.array([[math.cos(self.vehicle_yaw), -math.sin(self.vehicle_yaw)],
+                                 [math.sin(self.vehicle_yaw),  math.cos(self.vehicle_yaw)]])
+        lidar_offset = np.array([self.params_lidar["X"], self.params_lidar["Y"]])
+        vehicle_pos = np.array([self.vehicle_pos_x, self.vehicle_pos_y])
+
+        for num, box in enumerate(rects):
+            #TODO: (6) 박스별 depth percentile -> LiDAR 좌표 -> map 좌표
+            box_dist, in_box = self.projector.box_depth(u, v, depth, box, self.depth_percentile)
+            if box_dist is None:
+                continue
+
+            # percentile 거리 근처 점만 물체로 보고 LiDAR 좌표의 중앙값을 위치로 사용
+            obj_mask = in_box & (np.abs(depth - box_dist) < self.depth_margin)
+            local_xy = np.median(pc_np[index[obj_mask], :2], axis=0) + lidar_offset
+            global_xy = trans_matrix.dot(local_xy) + vehicle_pos
+
+            pedestrian = ObjectStatus()
+            pedestrian.unique_id = num
+            pedestrian.type = 0
+            pedestrian.name = 'pedestrian'
+            pedestrian.position.x = global_xy[0]
+            pedestrian.position.y = global_xy[1]
+            pedestrian.position.z = 0.
+            object_list.pedestrian_list.append(pedestrian)
+
+        #TODO: (7) ObjectStatusList 메시지 구성
+        object_list.num_of_pedestrian = len(object_list.pedestrian_list)
+
+        return object_list
+
+
+if __name__ == '__main__':
+    rospy.init_node('lidar_camera_fusion', anonymous=True)
+
+    fusion = LiDARCameraFusion()
+
+    rospy.spin()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+#-*- coding:utf-8 -*-
+
+import numpy as np
+
+# lidar_camera_projection 은 LiDAR PointCloud를 Camera Image Plane으로 투영하는 공용 모듈입니다.
+# lidar_ex_calib_velodyne 의 getTransformMat(Extrinsic), getCameraMat(Intrinsic) 결과를 받아
+# CameraMat·TransformMat 를 3x4 투영 행렬 하나로 미리 합쳐 두고, 매 프레임에는 행렬곱 1번과
+# boolean mask 1번으로 투영 + 필터링을 끝냅니다. (np.insert / np.delete 반복 복사 제거)
+# 투영 결과로 픽셀 단위 depth(z-buffer)를 만들어 두면 카메라 검출 결과에 LiDAR 거리를 붙일 수 있습니다.
+
+# 사용 순서
+# 1. LiDARCameraProjector(TransformMat, CameraMat, width, height) 생성 (투영 행렬 1회 계산)
+# 2. project(pc) : (N,3) 또는 (N,4) LiDAR 포인트 -> 이미지 좌표 u, v 와 depth
+# 3. update_depth_map(u, v, depth) : 픽셀별 최소 depth 갱신
+# 4. draw_pts_img(img, u, v) : 이미지 배열에 직접 점 그리기 (cv2.circle 반복 호출 제거)
+# 5. get_depth(u, v) : 픽셀 주변 depth 조회
+# 6. box_depth(u, v, depth, box) : 검출 박스 안 점들의 depth percentile
+
+
+class LiDARCameraProjector:
+    def __init__(self, TransformMat, CameraMat, width, height, min_depth=0.1):
+        '''
+        # Input
+            # TransformMat : 4x4 LiDAR to Camera Transformation Matrix (getTransformMat)
+            # CameraMat : 3x3 Intrinsic Matrix (getCameraMat)
+            # width, height : image size
+            # min_depth : 카메라 앞쪽으로 이 거리(m) 미만인 점은 제거
+        '''
+        self.width = int(width)
+        self.height = int(height)
+        self.min_depth = min_depth
+
+        # (3x3)·(3x4) -> 3x4 투영 행렬, 회전부/이동부를 나눠 두면 homogeneous 배열을 만들 필요가 없다
+        proj_mat = np.asarray(CameraMat, dtype=np.float64).dot(np.asarray(TransformMat, dtype=np.float64)[:3, :])
+        self.ProjMat = proj_mat.astype(np.float32)
+        self.rot_T = np.ascontiguousarray(self.ProjMat[:, :3].T)
+        self.trans = self.ProjMat[:, 3].copy()
+
+        # 픽셀별 depth 버퍼 - 매 프레임 재할당하지 않고 fill 로 초기화
+        self.depth_map = np.full((self.height, self.width), np.inf, dtype=np.float32)
+
+    def project(self, pc_lidar, return_index=False):
+        '''
+        # Input
+            # pc_lidar : pointcloud w.r.t. lidar frame, (N,3) or (N,4) [x, y, z, (1 or intensity)]
+            # return_index : True 이면 투영된 점의 원본 pc_lidar index 도 반환
+        # Output
+            # u, v : int32 pixel coordinates inside the image
+            # depth : float32 camera-frame depth of each pixel (m)
+            # (index) : int64 index into pc_lidar
+        '''
+        if pc_lidar is None or len(pc_lidar) == 0:
+            empty = np.zeros(0, dtype=np.int32)
+            if return_index:
+                return empty, empty, np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float32)
+
+        xyz = np.asarray(pc_lidar, dtype=np.float32)[:, :3]
+        uvw = xyz.dot(self.rot_T)
+        uvw += self.trans
+
+        depth = uvw[:, 2]
+        # LiDAR 후방(x<0) + 카메라 뒤쪽(depth<min_depth) 제거를 한 번의 mask로
+        mask = (xyz[:, 0] > 0) & (depth > self.min_depth)
+
+        # mask 된 점만 나누기 (0 나누기 방지)
+        inv_depth = np.zeros_like(depth)
+        np.divide(1.0, depth, out=inv_depth, where=mask)
+        u = uvw[:, 0] * inv_depth
+        v = uvw[:, 1] * inv_depth
+
+        mask &= (u >= 0) & (u < self.width) & (v >= 0) & (v < self.height)
+
+        if return_index:
+            return u[mask].astype(np.int32), v[mask].astype(np.int32), depth[mask], np.flatnonzero(mask)
+        return u[mask].astype(np.int32), v[mask].astype(np.int32), depth[mask]
+
+    def update_depth_map(self, u, v, depth):
+        # 같은 픽셀에 여러 점이 들어오면 가장 가까운 점을 남긴다 (z-buffer)
+        self.depth_map.fill(np.inf)
+        np.minimum.at(self.depth_map, (v, u), depth)
+
+        return self.depth_map
+
+    def get_depth(self, u, v, window=2):
+        '''
+        # 픽셀 (u, v) 주변 (2*window+1)^2 영역의 최소 depth 반환, 점이 없으면 inf
+        # u, v 는 스칼라 또는 배열 모두 가능
+        '''
+        u = np.atleast_1d(np.asarray(u, dtype=np.int32))
+        v = np.atleast_1d(np.asarray(v, dtype=np.int32))
+
+        offsets = np.arange(-window, window + 1, dtype=np.int32)
+        uu = np.clip(u[:, None, None] + offsets[None, None, :], 0, self.width - 1)
+        vv = np.clip(v[:, None, None] + offsets[None, :, None], 0, self.height - 1)
+
+        return self.depth_map[vv, uu].reshape(len(u), -1).min(axis=1)
+
+    def box_depth(self, u, v, depth, box, percentile=20, min_pts=3):
+        '''
+        # 검출 박스 (x, y, w, h) 안에 투영된 점들의 depth percentile 반환
+        # 박스에는 배경 점도 섞이므로 중앙값 대신 낮은 percentile 로 앞쪽 물체의 거리를 잡는다
+        # Output
+            # box_dist : depth (m), 점이 min_pts 개 미만이면 None
+            # in_box : 박스 안 점들의 boolean mask (u, v, depth 와 같은 길이)
+        '''
+        x, y, w, h = box
+        in_box = (u >= x) & (u < x + w) & (v >= y) & (v < y + h)
+
+        if np.count_nonzero(in_box) < min_pts:
+            return None, in_box
+
+        return float(np.percentile(depth[in_box], percentile)), in_box
+
+
+def draw_pts_img(img, xi, yi, color=(0, 255, 0), radius=1):
+    '''
+    # 이미지 배열에 점을 직접 기록 (in-place)
+    # cv2.circle 을 점마다 호출하는 대신 (2*radius+1)^2 개의 offset 만큼만 fancy indexing
+    '''
+    h, w = img.shape[:2]
+    xi = np.asarray(xi, dtype=np.int32)
+    yi = np.asarray(yi, dtype=np.int32)
+
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            if dx * dx + dy * dy > radius * radius:
+                continue
+            img[np.clip(yi + dy, 0, h - 1), np.clip(xi + dx, 0, w - 1)] = color
+
+    return img
@@ -6,10 +6,17 @@ import cv2
 import numpy as np
 import math
 import time
-from sensor_msgs.msg import PointCloud2, CompressedImage
+import os, sys
+from sensor_msgs.msg import PointCloud2
 import sensor_msgs.point_cloud2 as pc2
 from numpy.linalg import inv
 
+current_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(current_path)
+
+from lidar_camera_projection import LiDARCameraProjector, draw_pts_img
+from camera_frame_bus import CameraSubscriber
+
 
 # lidar_ex_calib_velodyne 은 MORAI SIM에서 송신하는 LiDAR PointCloud2 Data를 Camera Image Data에 정합하는 예제입니다.
 # 정합을 위해서는 LiDAR와 Camera 간의 위치 자세 관계성을 나타내는 Transformation Matrix(Extrinsic)와 Image Plane에 대한 정보인 Camera Matrix(Intrinsic)가 필요합니다.
@@ -183,55 +190,26 @@ def getCameraMat(params_cam):
 class LiDARToCameraTransform:
     def __init__(self, params_cam, params_lidar):
         self.scan_sub = rospy.Subscriber("/lidar3D", PointCloud2, self.scan_callback)
-        self.image_sub = rospy.Subscriber("/image_jpeg/compressed", CompressedImage, self.img_callback)
+        self.image_sub = CameraSubscriber(self.img_callback)
         self.pc_np = None
         self.img = None
         self.width = params_cam["WIDTH"]
         self.height = params_cam["HEIGHT"]
         self.TransformMat = getTransformMat(params_cam, params_lidar)
         self.CameraMat = getCameraMat(params_cam)
+        # CameraMat·TransformMat 를 3x4 투영 행렬로 한 번만 합쳐 둔다
+        self.projector = LiDARCameraProjector(self.TransformMat, self.CameraMat, self.width, self.height)
 
     #TODO : (4) LiDAR의 PointCloud2, Camera의 Image data 수신
-    def img_callback(self, msg):
-        np_arr = np.frombuffer(msg.data, np.uint8)
-        self.img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+    def img_callback(self, frame):
+        # bus 프레임은 공유 메모리 view 라 메인 루프에서 쓰는 동안 덮어써질 수 있으므로 노드 소유 배열로 보관
+        img_bgr = frame.own_bgr()
+        if img_bgr is not None:
+            self.img = img_bgr
 
     def scan_callback(self, msg):
-        point_list = []
-        for point in pc2.read_points(msg, skip_nans=True):
-            point_list.append((point[0], point[1], point[2], 1))
-        self.pc_np = np.array(point_list, np.float32)
-
-    #TODO : (5.1) LiDAR Pointcloud to Camera Frame
-    # Input
-        # pc_lidar : pointcloud data w.r.t. lidar frame
-    # Output
-        # pc_wrt_cam : pointcloud data w.r.t. camera frame
-    def transformLiDARToCamera(self, pc_lidar):
-        pc_wrt_cam = self.TransformMat.dot(pc_lidar)
-        pc_wrt_cam = np.delete(pc_wrt_cam, 3, axis=0)
-        return pc_wrt_cam
-
-    #TODO : (5.2) Camera Frame PointCloud to Image Plane with Filtering
-    # Input
-        # pc_camera : pointcloud data w.r.t. camera frame
-    # Output
-        # pc_proj_to_img : projection lidar data to image plane
-    # Tip : for clear data use filtering
-    def transformCameraToImage(self, pc_camera):
-        pc_proj_to_img = self.CameraMat.dot(pc_camera)
-        pc_proj_to_img = np.delete(pc_proj_to_img,np.where(pc_proj_to_img[2,:]<0),axis=1)
-        pc_proj_to_img /= pc_proj_to_img[2,:]
-        pc_proj_to_img = np.delete(pc_proj_to_img,np.where(pc_proj_to_img[0,:]>self.width),axis=1)
-        pc_proj_to_img = np.delete(pc_proj_to_img,np.where(pc_proj_to_img[1,:]>self.height),axis=1)
-        return pc_proj_to_img
-
-def draw_pts_img(img, xi, yi):
-    point_np = img
-
-    for ctr in zip(xi, yi):
-        point_np = cv2.circle(point_np, ctr, 2, (0,255,0),-1)
-    return point_np
+        # x, y, z 만 읽어서 (N,3) 배열로 - homogeneous 좌표는 투영 행렬에서 처리
+        self.pc_np = np.array(list(pc2.read_points(msg, field_names=("x", "y", "z"), skip_nans=True)), np.float32)
 
 if __name__ == '__main__':
     rospy.init_node('ex_calib', anonymous=True)
@@ -239,22 +217,23 @@ if __name__ == '__main__':
     time.sleep(1)
     rate = rospy.Rate(10)
 
-    while not rospy.is_shutdown():
-        xyz_p = Transformer.pc_np[:, 0:3]
-        xyz_p = np.insert(xyz_p,3,1,axis=1).T
-        xyz_p = np.delete(xyz_p,np.where(xyz_p[0,:]<0),axis=1)
-        #xyz_p = np.delete(xyz_p,np.where(xyz_p[0,:]>10),axis=1)
-        #xyz_p = np.delete(xyz_p,np.where(xyz_p[2,:]<-1.2),axis=1) #Ground Filter
-        #print(xyz_p[0])
+    projectionImage = None
 
-        xyz_c = Transformer.transformLiDARToCamera(xyz_p)
-        #print(np.size(xyz_c[0]))
+    while not rospy.is_shutdown():
+        if Transformer.pc_np is None or Transformer.img is None:
+            rate.sleep()
+            continue
 
-        xy_i = Transformer.transformCameraToImage(xyz_c)
-        #print(np.size(xy_i[0]))
+        # LiDAR -> Camera -> Image Plane 투영과 필터링을 한 번에
+        xi, yi, depth = Transformer.projector.project(Transformer.pc_np)
+        Transformer.projector.update_depth_map(xi, yi, depth)
 
         #TODO: (6) PointCloud가 Image에 투영된 Processed Image 시각화
-        xy_i = xy_i.astype(np.int32)
-        projectionImage = draw_pts_img(Transformer.img, xy_i[0,:], xy_i[1,:])        
+        # 출력 버퍼는 한 번만 만들고 매 프레임 copyto 로 덮어쓴다
+        if projectionImage is None or projectionImage.shape != Transformer.img.shape:
+            projectionImage = np.empty_like(Transformer.img)
+        np.copyto(projectionImage, Transformer.img)
+        draw_pts_img(projectionImage, xi, yi)
         cv2.imshow("LidartoCameraProjection", projectionImage)
-        cv2.waitKey(1)
\ No newline at end of file
+        cv2.waitKey(1)
+        rate.sleep()
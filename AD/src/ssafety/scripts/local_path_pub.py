@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os, sys
 import rospy
 import rospkg
+import numpy as np
 from math import cos,sin,pi,sqrt,pow
 from geometry_msgs.msg import Point32,PoseStamped
 from nav_msgs.msg import Odometry,Path
 
+current_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(current_path)
+
+from path_msg_util import PathMsgBuilder
+
 # local_path_pub 은 global Path (전역경로) 데이터를 받아 Local Path (지역경로) 를 만드는 예제입니다.
 # Local Path (지역경로) 는 global Path(전역경로) 에서 차량과 가장 가까운 포인트를 시작으로 만들어 집니다.
 
@@ -45,13 +52,12 @@ class local_path_pub :
         # 너무 작지도 크기지도 않은 값을 사용한다 (50 ~ 200)
         self.local_path_size = 100
 
+        self.path_builder = PathMsgBuilder('/map')
+
         rate = rospy.Rate(20) # 20hz
         while not rospy.is_shutdown():
    
             if self.is_odom == True and self.is_path == True:
-                local_path_msg = Path()
-                local_path_msg.header.frame_id = '/map'
-                
                 x = self.x
                 y = self.y
 
@@ -60,42 +66,27 @@ class local_path_pub :
                 # global Path 에서 차량의 현재 위치를 찾습니다.
                 # 현제 위치는 WayPoint 로 기록하며 현재 차량이 Path 에서 몇번 째 위치에 있는지 나타내는 값이 됩니다.
                 # 차량의 현재 위치는 Local Path 를 만드는 시작 위치가 됩니다.
-                # 차량의 현재 위치를 탐색하는 반복문은 작성해 current_waypoint 찾습니다.
-                # => 차량의 현재 위치는 왜 탐색을.. odom로 바로 받는데;;
-                # 차량의 현재 위치가 아니라 Global Path를 탐색하는 반복문을 잘못쓴 것 같다.
-                min_dis = float('inf')
+                # 콜백에서 만들어 둔 global path 좌표 배열로 거리 계산 + argmin 을 한 번에 수행합니다.
+                global_path_xy = self.global_path_xy
+                length = len(global_path_xy)
                 current_waypoint = -1
-                for i, path in enumerate(self.global_path_msg.poses) :
-                    temp = sqrt((x - path.pose.position.x)**2 + (y - path.pose.position.y)**2)
-                    if min_dis > temp:
-                        min_dis = temp
-                        current_waypoint = i
-                
+                if length > 0:
+                    dis_sq = (global_path_xy[:, 0] - x)**2 + (global_path_xy[:, 1] - y)**2
+                    current_waypoint = int(np.argmin(dis_sq))
+
                 #TODO: (6) 가장 가까운 포인트(current Waypoint) 위치부터 Local Path 생성 및 예외 처리
 
                 # 차량의 현재 위치 부터 local_path_size 로 지정한 Path 의 크기 만큼의 Path local_path 를 생성합니다.
                 # 차량에 남은 Path 의 길이가 local_path_size 보다 작은 경우가 있음으로 조건 문을 이용하여 해당 조건을 예외 처리 합니다.
-                length = len(self.global_path_msg.poses)
                 if current_waypoint != -1 :
                     path_size = (current_waypoint + self.local_path_size
                     if current_waypoint + self.local_path_size < length 
                     else length)
 
-                    # 차량의 현재 위치 추가 (아니였다고 한다..)
-                    # read_pose = PoseStamped()
-                    # read_pose.pose.position.x = x
-                    # read_pose.pose.position.y = y
-                    # read_pose.pose.orientation.w = 1
-                    # local_path_msg.poses.append(read_pose)
-
-                    # 나머지는 global_path로.. local_path_size만큼 추가.. 맞나..?
-                    for i in range(current_waypoint + 1, path_size):
-                        # global_path_pub에서 복붙했다. 잘 모르겠어서..
-                        read_pose = PoseStamped()
-                        read_pose.pose.position.x = self.global_path_msg.poses[i].pose.position.x
-                        read_pose.pose.position.y = self.global_path_msg.poses[i].pose.position.y
-                        read_pose.pose.orientation.w = 1
-                        local_path_msg.poses.append(read_pose)
+                    local_path_msg = self.path_builder.build(global_path_xy[current_waypoint + 1:path_size])
+                else:
+                    local_path_msg = Path()
+                    local_path_msg.header.frame_id = '/map'
 
                 print(x,y)
                 #TODO: (7) Local Path 메세지 Publish
@@ -115,7 +106,9 @@ class local_path_pub :
 
     def global_path_callback(self,msg):
         self.is_path = True
-        self.global_path_msg = msg        
+        self.global_path_msg = msg
+        # 매 주기 poses 를 순회하지 않도록 수신 시 좌표 배열을 한 번만 만들어 둔다
+        self.global_path_xy = np.array([[pose.pose.position.x, pose.pose.position.y] for pose in msg.poses], dtype=np.float64).reshape(-1, 2)
 
 if __name__ == '__main__':
     try:
@@ -17,6 +17,7 @@ current_path = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(current_path)
 
 from lib.mgeo.class_defs import *
+from path_msg_util import PathMsgBuilder
 
 # mgeo_dijkstra_path_1 은 Mgeo 데이터를 이용하여 시작 Node 와 목적지 Node 를 지정하여 Dijkstra 알고리즘을 적용하는 예제 입니다.
 # 사용자가 직접 지정한 시작 Node 와 목적지 Node 사이 최단 경로 계산하여 global Path(전역경로) 를 생성 합니다.
@@ -180,15 +181,12 @@ class dijkstra_path_pub :
         '''
         # dijkstra 경로 데이터 중 Point 정보를 이용하여 Path 데이터를 만들어 줍니다.
         '''
-        
-        for waypoint in path["point_path"] :
-            path_x = waypoint[0]
-            path_y = waypoint[1]
-            read_pose = PoseStamped()
-            read_pose.pose.position.x = path_x
-            read_pose.pose.position.y = path_y
-            read_pose.pose.orientation.w = 1
-            out_path.poses.append(read_pose)
+        if len(path["point_path"]) == 0:
+            return out_path
+
+        point_path = np.array(path["point_path"], dtype=np.float64)[:, 0:2]
+        out_path = PathMsgBuilder('/map').build(point_path)
+
         return out_path
 
 class Dijkstra:
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from geometry_msgs.msg import PoseStamped
+from nav_msgs.msg import Path
+
+# path_msg_util 은 여러 노드에서 반복되는 nav_msgs/Path 생성 코드를 모아둔 공용 모듈입니다.
+# 점마다 3x1 배열을 만들어 trans_matrix.dot 를 호출하던 부분을 N 개 점 행렬곱 1번으로 바꾸고,
+# PoseStamped 는 미리 만들어 둔 pool 을 재사용해서 매 주기 수백 개의 메시지 객체를 새로 만들지 않습니다.
+# rospy Publisher.publish() 는 호출 시점에 직렬화를 끝내므로, publish 이후 pool 을 다시 채워도 안전합니다.
+
+# 사용 예
+#   builder = PathMsgBuilder('/map')
+#   xy = transform_points(trans_matrix, local_x, local_y)
+#   path_pub.publish(builder.build(xy))
+
+
+def transform_points(trans_matrix, x, y):
+    '''
+    # 3x3 좌표 변환 행렬(회전 + 이동)로 N 개의 점을 한 번에 변환
+    # Input
+        # trans_matrix : 3x3 [[cos, -sin, tx], [sin, cos, ty], [0, 0, 1]]
+        # x, y : local 좌표 (N,)
+    # Output
+        # xy : 변환된 좌표 (N, 2)
+    '''
+    trans_matrix = np.asarray(trans_matrix, dtype=np.float64)
+    local_xy = np.stack([np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)], axis=1)
+
+    return local_xy.dot(trans_matrix[0:2, 0:2].T) + trans_matrix[0:2, 2]
+
+
+class PathMsgBuilder:
+    '''
+    PoseStamped pool 을 재사용하는 Path 메시지 생성기
+    \n 같은 builder 로 만든 Path 는 다음 build 호출 때 내용이 바뀌므로, 동시에 여러 Path 가 필요하면 builder 를 여러 개 사용
+    '''
+    def __init__(self, frame_id='/map'):
+        self.frame_id = frame_id
+        self.pose_pool = []
+
+    def build(self, xy):
+        # xy : (N, 2) map 좌표
+        n = len(xy)
+
+        while len(self.pose_pool) < n:
+            pose = PoseStamped()
+            pose.pose.orientation.w = 1
+            self.pose_pool.append(pose)
+
+        # tolist() 로 numpy scalar 대신 python float 을 넣어 직렬화 비용을 줄인다
+        for pose, (x, y) in zip(self.pose_pool, np.asarray(xy).tolist()):
+            pose.pose.position.x = x
+            pose.pose.position.y = y
+
+        path_msg = Path()
+        path_msg.header.frame_id = self.frame_id
+        path_msg.poses = self.pose_pool[:n]
+
+        return path_msg
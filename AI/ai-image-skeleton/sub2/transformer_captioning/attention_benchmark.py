@@ -0,0 +1,110 @@
+"""
+MultiHeadAttention backend 별 처리량 / 메모리 비교.
+peak MB 는 cuda 에서 측정한 값, score MB 는 attention score tensor 크기 (cpu 에서도 표시)
+max err 는 chunked_attention 을 query 전체 길이로 한 번에 계산한 결과와의 최대 절대 오차이고,
+--atol 을 넘는 backend 가 있으면 종료 코드 1 로 끝납니다.
+reference backend 는 lib/transformer_layers.py 의 Req 2-1 을 구현한 뒤에 --backends 로 추가해서 비교합니다.
+
+사용 예:
+  python attention_benchmark.py --lengths 64 256 1024 --device cuda
+  python attention_benchmark.py --backends sdpa chunked --chunk-size 128
+  python attention_benchmark.py --backends reference sdpa chunked      # Req 2-1 구현 확인
+"""
+import argparse
+import copy
+import time
+
+import torch
+
+from lib.transformer_layers import ATTENTION_BACKENDS, MultiHeadAttention, causal_mask
+
+
+def score_buffer_bytes(backend, batch_size, num_heads, length, chunk_size, element_size=4):
+    # attention score 로 한 번에 만드는 tensor 크기 (sdpa 는 fused kernel 안에서 처리하므로 None)
+    if backend == "reference":
+        return batch_size * num_heads * length * length * element_size
+    if backend == "chunked":
+        return batch_size * num_heads * min(chunk_size, length) * length * element_size
+    return None
+
+
+def measure(attn, x, mask, n_iter):
+    """
+    Returns:
+    - output, 1회 평균 시간(초), peak memory(byte, cuda 에서만 측정 / cpu 는 None)
+    """
+    device = x.device
+    with torch.no_grad():
+        output = attn(query=x, key=x, value=x, attn_mask=mask)  # warmup
+
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+            base = torch.cuda.memory_allocated()
+        start = time.perf_counter()
+        for _ in range(n_iter):
+            output = attn(query=x, key=x, value=x, attn_mask=mask)
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        elapsed = (time.perf_counter() - start) / n_iter
+
+    peak = torch.cuda.max_memory_allocated() - base if device.type == "cuda" else None
+    return output, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["sdpa", "chunked"],
+                        choices=ATTENTION_BACKENDS)
+    parser.add_argument("--lengths", nargs="+", type=int, default=[32, 128, 512, 1024])
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--num-heads", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--n-iter", type=int, default=10)
+    parser.add_argument("--atol", type=float, default=1e-5)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    reference = MultiHeadAttention(args.embed_dim, args.num_heads).to(args.device).eval()
+    modules = {}
+    for backend in args.backends:
+        modules[backend] = copy.deepcopy(reference)
+        modules[backend].backend = backend
+        modules[backend].chunk_size = args.chunk_size
+
+    print(f"device={args.device} N={args.batch_size} E={args.embed_dim} H={args.num_heads} "
+          f"chunk_size={args.chunk_size}")
+    failed = []
+    print(f"{'length':>8} {'backend':>10} {'ms':>9} {'tokens/s':>12} {'peak MB':>9} {'score MB':>9} {'max err':>10}")
+    for length in args.lengths:
+        x = torch.randn(args.batch_size, length, args.embed_dim, device=args.device)
+        mask = causal_mask(length, args.device)
+
+        # 비교 기준 : score 를 한 번에 만드는 chunked 계산 (backend 와 무관하게 항상 같은 식)
+        baseline_attn = copy.deepcopy(reference)
+        baseline_attn.backend = "chunked"
+        baseline_attn.chunk_size = length
+        with torch.no_grad():
+            baseline = baseline_attn(query=x, key=x, value=x, attn_mask=mask)
+
+        for backend, attn in modules.items():
+            output, elapsed, peak = measure(attn, x, mask, args.n_iter)
+            error = (output - baseline).abs().max().item()
+            score = score_buffer_bytes(backend, args.batch_size, args.num_heads, length, args.chunk_size)
+            peak_mb = f"{peak / 2 ** 20:9.1f}" if peak is not None else f"{'-':>9}"
+            score_mb = f"{score / 2 ** 20:9.1f}" if score is not None else f"{'-':>9}"
+            print(f"{length:>8} {backend:>10} {elapsed * 1e3:9.2f} {args.batch_size * length / elapsed:12.0f} "
+                  f"{peak_mb} {score_mb} {error:10.2e}")
+            if not error <= args.atol:
+                failed.append((length, backend, error))
+
+    for length, backend, error in failed:
+        print(f"FAIL length={length} backend={backend} max err {error:.2e} > atol {args.atol:.0e}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
+import time
+
 import numpy as np
 
 from . import optim
-from .coco_utils import sample_coco_minibatch, decode_captions
+from .coco_utils import sample_coco_minibatch, decode_captions, CocoCaptionDataset
 
 import torch
+from torch.utils.data import BatchSampler, DataLoader, RandomSampler
 
 
 class CaptioningSolverTransformer(object):
@@ -53,6 +56,15 @@ class CaptioningSolverTransformer(object):
           iterations.
         - verbose: Boolean; if set to false then no output will be printed during
           training.
+        - use_data_loader: Boolean; True 이면 sample_coco_minibatch 대신 DataLoader 로 학습합니다.
+          (epoch 마다 중복 없이 shuffle, dataset 이나 sampler 를 주면 자동으로 True)
+        - dataset: torch Dataset. index list 를 받아 (captions, features) minibatch 를 반환해야 합니다.
+          기본값은 CocoCaptionDataset(data, "train")
+        - sampler: index list 를 만드는 batch sampler. 기본값은 BatchSampler(RandomSampler(dataset))
+        - num_workers: DataLoader worker process 수
+        - pin_memory: Boolean; pinned memory 로 읽어서 device 로 비동기 복사합니다.
+        - device: 학습 device. 기본값은 model 파라미터가 있는 device
+        - amp: Boolean; mixed precision 학습 (cuda: float16 + GradScaler, cpu: bfloat16)
         """
         self.model = model
         self.data = data
@@ -64,7 +76,20 @@ class CaptioningSolverTransformer(object):
 
         self.print_every = kwargs.pop("print_every", 10)
         self.verbose = kwargs.pop("verbose", True)
+
+        self.dataset = kwargs.pop("dataset", None)
+        self.sampler = kwargs.pop("sampler", None)
+        self.use_data_loader = kwargs.pop("use_data_loader", False) or \
+            self.dataset is not None or self.sampler is not None
+        self.num_workers = kwargs.pop("num_workers", 0)
+        self.pin_memory = kwargs.pop("pin_memory", False)
+        self.device = torch.device(kwargs.pop("device", None) or next(self.model.parameters()).device)
+        self.amp = kwargs.pop("amp", False)
+
+        self.model.to(self.device)
         self.optim = torch.optim.Adam(self.model.parameters(), self.learning_rate)
+        self.amp_dtype = torch.float16 if self.device.type == "cuda" else torch.bfloat16
+        self.scaler = torch.amp.GradScaler("cuda", enabled=self.amp and self.device.type == "cuda")
 
         # Throw an error if there are extra keyword arguments
         if len(kwargs) > 0:
@@ -83,6 +108,7 @@ class CaptioningSolverTransformer(object):
         # Set up some variables for book-keeping
         self.epoch = 0
         self.loss_history = []
+        self.samples_per_sec = 0.
 
     ############################################################################
     # Req 2-5: single gradient update를 위한 _step() 함수 구현                     #
@@ -123,6 +149,9 @@ class CaptioningSolverTransformer(object):
         """
         학습 시작을 위한 코드입니다.
         """
+        if self.use_data_loader:
+            return self._train_data_loader()
+
         num_train = self.data["train_captions"].shape[0]
         iterations_per_epoch = max(num_train // self.batch_size, 1)
         num_iterations = self.num_epochs * iterations_per_epoch
@@ -140,6 +169,97 @@ class CaptioningSolverTransformer(object):
             # At the end of every epoch, increment the epoch counter.
             epoch_end = (t + 1) % iterations_per_epoch == 0
 
+    def _make_data_loader(self):
+        dataset = self.dataset if self.dataset is not None else CocoCaptionDataset(self.data, "train")
+        sampler = self.sampler
+        if sampler is None:
+            sampler = BatchSampler(RandomSampler(dataset), self.batch_size, drop_last=False)
+
+        # sampler 가 index list 를 만들고 dataset 이 minibatch 를 한 번에 읽으므로 batch_size=None
+        return DataLoader(dataset, sampler=sampler, batch_size=None, num_workers=self.num_workers,
+                          pin_memory=self.pin_memory and self.device.type == "cuda",
+                          persistent_workers=self.num_workers > 0)
+
+    def _to_device(self, loader):
+        """
+        다음 minibatch 를 미리 device 로 복사합니다. cuda 에서는 별도 stream 에서 복사해서
+        현재 minibatch 의 forward / backward 와 겹쳐서 실행됩니다.
+        """
+        if self.device.type != "cuda":
+            for captions, features in loader:
+                yield captions.to(self.device), features.to(self.device)
+            return
+
+        stream = torch.cuda.Stream(self.device)
+        pending = None
+        for captions, features in loader:
+            with torch.cuda.stream(stream):
+                batch = (captions.to(self.device, non_blocking=True), features.to(self.device, non_blocking=True))
+            if pending is not None:
+                yield pending
+            torch.cuda.current_stream(self.device).wait_stream(stream)
+            for tensor in batch:
+                tensor.record_stream(torch.cuda.current_stream(self.device))
+            pending = batch
+        if pending is not None:
+            yield pending
+
+    def _loader_step(self, captions, features):
+        """
+        DataLoader 로 읽은 minibatch (device tensor) 로 single gradient update 를 수행합니다.
+        Returns:
+        - loss: detached loss tensor (host 동기화를 피하기 위해 .item() 을 호출하지 않음)
+        """
+        captions_in = captions[:, :-1]
+        captions_out = captions[:, 1:]
+        mask = captions_out != self.model._null
+
+        with torch.autocast(device_type=self.device.type, dtype=self.amp_dtype, enabled=self.amp):
+            scores = self.model(features, captions_in)
+        loss = self.transformer_temporal_softmax_loss(scores.float(), captions_out, mask)
+
+        self.optim.zero_grad(set_to_none=True)
+        self.scaler.scale(loss).backward()
+        self.scaler.step(self.optim)
+        self.scaler.update()
+
+        return loss.detach()
+
+    def _train_data_loader(self):
+        loader = self._make_data_loader()
+        iterations_per_epoch = len(loader)
+        num_iterations = self.num_epochs * iterations_per_epoch
+
+        # loss 는 print 할 때만 host 로 가져옵니다. (매 step .item() 을 하면 data loading 과 학습이 직렬화됨)
+        pending_losses = []
+        num_samples = 0
+        start = time.perf_counter()
+
+        t = 0
+        for epoch in range(self.num_epochs):
+            for captions, features in self._to_device(loader):
+                pending_losses.append(self._loader_step(captions, features))
+                num_samples += captions.shape[0]
+
+                # Maybe print training loss
+                if self.verbose and t % self.print_every == 0:
+                    self.loss_history += torch.stack(pending_losses).tolist()
+                    pending_losses = []
+                    self.samples_per_sec = num_samples / (time.perf_counter() - start)
+                    print(
+                        "(Iteration %d / %d) loss: %f (%.0f samples/s)"
+                        % (t + 1, num_iterations, self.loss_history[-1], self.samples_per_sec)
+                    )
+                t += 1
+
+            self.epoch += 1
+
+        if pending_losses:
+            self.loss_history += torch.stack(pending_losses).tolist()
+        self.samples_per_sec = num_samples / (time.perf_counter() - start)
+        if self.verbose:
+            print("%d samples, %.0f samples/s" % (num_samples, self.samples_per_sec))
+
     ############################################################################
     # Req 2-4: 학습 loss 계산 코드 구현                                             #
     ############################################################################
@@ -93,9 +93,35 @@ class CaptioningTransformer(nn.Module):
 
         return scores
 
+    def _memory(self, features):
+        """
+        Image features를 decoder의 memory로 변환합니다. (N, D) -> (N, 1, W)
+        """
+        return self.visual_projection(features).unsqueeze(1)
+
+    def _decode_step(self, tokens, cache, t):
+        """
+        Incremental decoding의 한 step. 새 토큰(tokens[:, t]) 하나만 decoder layer를 통과시키고,
+        이전 timestep의 self-attention key / value 는 cache에 projection 된 값을 그대로 사용합니다.
+        Inputs:
+         - tokens: token buffer, tokens[:, :t + 1] 까지 채워져 있어야 합니다. of shape (N, L)
+         - cache: TransformerDecoder.init_cache()로 만든 layer별 key / value buffer
+         - t: 현재 timestep
+        Returns:
+         - scores: score for the next token, of shape (N, V)
+        """
+        # Positional encoding은 prefix 전체에 적용한 뒤 마지막 위치만 사용합니다. (embedding 비용은 무시할 수준)
+        tgt = self.positional_encoding(self.embedding(tokens[:, :t + 1]))[:, -1:]
+        out = self.transformer.forward_step(tgt, cache, t)
+        return self.output(out[:, 0])
+
     def sample(self, features, max_length=30):
         """
         Image features가 주어졌을 때, greedy decoding을 통해 이미지 캡션을 예측합니다.
+        각 step에서는 새 토큰 하나의 query / key / value projection 과 feedforward 만 계산하고,
+        이전 timestep의 key / value 는 cache를 사용합니다. (image memory 의 key / value 는 처음 한 번만 projection)
+        매 step 전체 prefix를 forward 하던 방식과 결과는 같고, step t 의 연산은 projection / feedforward 가
+        토큰 1개, attention 이 (t + 1) 개 key 에 대한 내적이므로 전체 projection 은 O(T), attention 은 O(T^2) 입니다.
         Inputs:
          - features: image features, of shape (N, D)
          - max_length: maximum possible caption length
@@ -103,34 +129,82 @@ class CaptioningTransformer(nn.Module):
          - captions: captions for each example, of shape (N, max_length)
         """
         with torch.no_grad():
-            features = torch.Tensor(features)
+            device = self.output.weight.device
+            features = torch.Tensor(features).to(device)
             N = features.shape[0]
 
-            # Create an empty captions tensor (where all tokens are NULL).
-            captions = self._null * np.ones((N, max_length), dtype=np.int32)
+            # tokens[:, 0] 은 START 토큰, tokens[:, t + 1] 에 t 번째 예측 단어를 기록합니다.
+            tokens = torch.full((N, max_length + 1), self._null, dtype=torch.int32, device=device)
+            tokens[:, 0] = self._start
 
-            # Create a partial caption, with only the start token.
-            partial_caption = self._start * np.ones(N, dtype=np.int32)
-            partial_caption = torch.LongTensor(partial_caption)
-            # [N] -> [N, 1]
-            partial_caption = partial_caption.unsqueeze(1)
+            memory = self._memory(features)
+            cache = self.transformer.init_cache(memory, max_length)
 
             for t in range(max_length):
+                # Predict the next token and choose the most likely word ID.
+                # [N, V] -> [N]
+                output_logits = self._decode_step(tokens.long(), cache, t)
+                tokens[:, t + 1] = torch.argmax(output_logits, axis=1)
 
-                # Predict the next token (ignoring all other time steps).
-                output_logits = self.forward(features, partial_caption)
-                output_logits = output_logits[:, -1, :]
+            return tokens[:, 1:].cpu().numpy()
 
-                # Choose the most likely word ID from the vocabulary.
-                # [N, V] -> [N]
-                word = torch.argmax(output_logits, axis=1)
+    def beam_search(self, features, beam_size=3, max_length=30, length_penalty=0.):
+        """
+        Image features가 주어졌을 때, batch 단위 beam search로 이미지 캡션을 예측합니다.
+        N개 이미지의 beam 들을 (N * beam_size) batch 하나로 묶어서 incremental decoding 합니다.
+        Inputs:
+         - features: image features, of shape (N, D)
+         - beam_size: number of beams per image
+         - max_length: maximum possible caption length
+         - length_penalty: 최종 선택 시 log-prob 합을 (길이 ** length_penalty) 로 나눕니다. 0 이면 합 그대로 사용
+        Returns:
+         - captions: captions for each example, of shape (N, max_length). <END> 이후는 <NULL>
+        """
+        with torch.no_grad():
+            device = self.output.weight.device
+            features = torch.Tensor(features).to(device)
+            N, B = features.shape[0], beam_size
+
+            tokens = torch.full((N * B, max_length + 1), self._null, dtype=torch.int32, device=device)
+            tokens[:, 0] = self._start
+
+            memory = self._memory(features).repeat_interleave(B, dim=0)
+            cache = self.transformer.init_cache(memory, max_length)
+
+            # 처음에는 beam 들이 모두 같으므로 첫 beam 만 확장합니다.
+            beam_scores = torch.full((N, B), -float("inf"), device=device)
+            beam_scores[:, 0] = 0.
+            finished = torch.zeros(N * B, dtype=torch.bool, device=device)
+            lengths = torch.zeros(N * B, device=device)
+            beam_offset = (torch.arange(N, device=device) * B).unsqueeze(1)
+
+            for t in range(max_length):
+                log_probs = torch.log_softmax(self._decode_step(tokens.long(), cache, t), dim=1)
+                V = log_probs.shape[1]
+
+                # 끝난 beam 은 <NULL> 만 이어 붙이고 점수는 그대로 유지합니다.
+                log_probs[finished] = -float("inf")
+                log_probs[finished, self._null] = 0.
+
+                candidates = (beam_scores.view(-1, 1) + log_probs).view(N, B * V)
+                beam_scores, index = candidates.topk(B, dim=1)
+                source = (beam_offset + index // V).view(-1)
+                word = (index % V).view(-1)
 
-                # Update our overall caption and our current partial caption.
-                captions[:, t] = word.numpy()
-                word = word.unsqueeze(1)
-                partial_caption = torch.cat([partial_caption, word], dim=1)
+                # 선택된 beam 순서로 token / cache 재배열
+                tokens = tokens[source]
+                tokens[:, t + 1] = word
+                cache = self.transformer.reorder_cache(cache, source)
+                lengths = lengths[source] + (~finished[source]).float()
+                finished = finished[source] | (word == self._end)
 
-            return captions
+                if finished.all():
+                    break
+
+            normalized = beam_scores / lengths.view(N, B).clamp(min=1.) ** length_penalty
+            best = (beam_offset[:, 0] + normalized.argmax(dim=1))
+
+            return tokens[best, 1:].cpu().numpy()
 
 
 class TransformerDecoderLayer(nn.Module):
@@ -183,6 +257,49 @@ class TransformerDecoderLayer(nn.Module):
         # Attend to both the target sequence and the sequence from the last
         # encoder layer.
         tgt2 = self.multihead_attn(query=tgt, key=memory, value=memory)
+        return self._cross_attention_block(tgt, tgt2)
+
+    def init_cache(self, memory, max_length):
+        """
+        Incremental decoding 용 key / value buffer 를 만듭니다.
+        - "key" / "value": self-attention key / value, of shape (N, H, max_length, W/H)
+        - "memory_key" / "memory_value": memory 의 key / value (처음 한 번만 projection), of shape (N, H, S, W/H)
+        """
+        N, _, W = memory.shape
+        H = self.self_attn.backend_heads
+        memory_key, memory_value = self.multihead_attn.project_key_value(memory, memory)
+        return {
+            "key": memory.new_zeros((N, H, max_length, W // H)),
+            "value": memory.new_zeros((N, H, max_length, W // H)),
+            "memory_key": memory_key,
+            "memory_value": memory_value,
+        }
+
+    def forward_step(self, tgt, cache, t):
+        """
+        Incremental decoding 용 forward. timestep t 의 토큰 하나만 계산합니다.
+        이전 timestep 의 layer 입력은 causal mask 때문에 값이 바뀌지 않으므로, 새 토큰의 key / value projection 만
+        cache 의 t 위치에 기록하고 새 토큰의 query 가 cache[:, :, :t + 1] 에 attend 하면 forward 와 같은 결과가 됩니다.
+
+        Inputs:
+        - tgt: the new token of the decoder layer input, of shape (N, 1, W)
+        - cache: init_cache() 로 만든 key / value buffer
+        - t: current timestep
+        Returns:
+        - out: the Transformer features of the new token, of shape (N, 1, W)
+        """
+        key, value = self.self_attn.project_key_value(tgt, tgt)
+        cache["key"][:, :, t:t + 1] = key
+        cache["value"][:, :, t:t + 1] = value
+        tgt2 = self.self_attn.attend(tgt, cache["key"][:, :, :t + 1], cache["value"][:, :, :t + 1])
+        tgt = tgt + self.dropout1(tgt2)
+        tgt = self.norm1(tgt)
+
+        tgt2 = self.multihead_attn.attend(tgt, cache["memory_key"], cache["memory_value"])
+        return self._cross_attention_block(tgt, tgt2)
+
+    def _cross_attention_block(self, tgt, tgt2):
+        # tgt2 : cross-attention output
         tgt = tgt + self.dropout2(tgt2)
         tgt = self.norm2(tgt)
 
@@ -208,4 +325,24 @@ class TransformerDecoder(nn.Module):
         for mod in self.layers:
             output = mod(output, memory, tgt_mask=tgt_mask)
 
-        return output
\ No newline at end of file
+        return output
+
+    def init_cache(self, memory, max_length):
+        """
+        Incremental decoding 용 layer별 key / value buffer를 만듭니다. (TransformerDecoderLayer.init_cache 참고)
+        """
+        return [mod.init_cache(memory, max_length) for mod in self.layers]
+
+    def reorder_cache(self, cache, index):
+        """
+        Beam search 에서 선택된 beam 순서(index)로 cache 의 batch 차원을 재배열합니다.
+        """
+        return [{name: buffer[index] for name, buffer in layer_cache.items()} for layer_cache in cache]
+
+    def forward_step(self, tgt, cache, t):
+        output = tgt
+
+        for mod, layer_cache in zip(self.layers, cache):
+            output = mod.forward_step(output, layer_cache, t)
+
+        return output
@@ -1,31 +1,106 @@
 import os, json
+import queue
+import threading
 import numpy as np
 import h5py
+import torch
+from torch.utils.data import Dataset
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 BASE_DIR = os.path.join(dir_path, "datasets/coco_captioning")
 
-def load_coco_data(base_dir=BASE_DIR, max_train=None, pca_features=True):
+STORAGE_TYPES = ("memory", "hdf5", "mmap")
+
+
+def take_rows(array, idxs):
+    """
+    array[idxs] 를 정렬된 index 로 읽습니다.
+    h5py.Dataset 은 증가하는 index 만 fancy indexing 할 수 있고, memmap / HDF5 는 정렬된 순서로 읽어야
+    연속적으로 읽을 수 있으므로 중복을 제거하고 정렬해서 읽은 뒤 원래 순서로 되돌립니다.
+    """
+    idxs = np.asarray(idxs)
+    unique_idxs, inverse = np.unique(idxs, return_inverse=True)
+    return np.asarray(array[unique_idxs])[inverse.reshape(idxs.shape)]
+
+
+def _npy_path(h5_path, key, cache_dir):
+    name = os.path.splitext(os.path.basename(h5_path))[0]
+    return os.path.join(cache_dir, "%s.%s.npy" % (name, key))
+
+
+def _convert_to_npy(dataset, npy_path, chunk_rows=4096):
+    # 전체를 메모리에 올리지 않도록 chunk_rows 씩 복사합니다.
+    tmp_path = npy_path + ".tmp"
+    out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dataset.dtype, shape=dataset.shape)
+    for start in range(0, dataset.shape[0], chunk_rows):
+        out[start:start + chunk_rows] = dataset[start:start + chunk_rows]
+    out.flush()
+    del out
+    os.replace(tmp_path, npy_path)
+
+
+def _load_h5(h5_path, keys=None, storage="memory", cache_dir=None):
+    """
+    HDF5 파일의 dataset 들을 storage 방식으로 읽습니다.
+    Returns:
+    - {key: np.ndarray | h5py.Dataset | np.memmap}
+    """
+    if storage == "memory":
+        with h5py.File(h5_path, "r") as f:
+            return {k: np.asarray(f[k]) for k in (keys or f.keys())}
+
+    if storage == "hdf5":
+        # file 을 열어둔 채로 dataset 을 반환합니다. (row 를 읽을 때 필요한 부분만 디스크에서 읽음)
+        f = h5py.File(h5_path, "r")
+        return {k: f[k] for k in (keys or f.keys())}
+
+    # mmap : 처음 한 번 .npy 로 변환한 뒤 memmap 으로 엽니다. (HDF5 파일이 바뀌면 다시 변환)
+    os.makedirs(cache_dir, exist_ok=True)
+    arrays = {}
+    with h5py.File(h5_path, "r") as f:
+        for k in (keys or f.keys()):
+            npy_path = _npy_path(h5_path, k, cache_dir)
+            if f[k].ndim == 0:
+                arrays[k] = np.asarray(f[k])
+                continue
+            if not os.path.exists(npy_path) or os.path.getmtime(npy_path) < os.path.getmtime(h5_path):
+                _convert_to_npy(f[k], npy_path)
+            arrays[k] = np.load(npy_path, mmap_mode="r")
+    return arrays
+
+
+def load_coco_data(base_dir=BASE_DIR, max_train=None, pca_features=True, storage="memory", cache_dir=None):
+    """
+    COCO captioning data 를 dictionary 로 읽습니다.
+    Inputs:
+    - storage: dataset 을 읽는 방식
+      - "memory": 모든 dataset 을 np.ndarray 로 메모리에 읽습니다. (기존 방식)
+      - "hdf5": HDF5 파일을 열어둔 채로 h5py.Dataset 을 그대로 사용합니다.
+      - "mmap": 처음 한 번 .npy 로 변환한 뒤 np.memmap 으로 사용합니다. (가장 빠름)
+      "hdf5" / "mmap" 은 minibatch 에 필요한 row 만 디스크에서 읽기 때문에, PCA 하지 않은
+      전체 차원 feature (pca_features=False) 도 메모리에 올리지 않고 학습할 수 있습니다.
+    - cache_dir: "mmap" 의 .npy 저장 위치 (기본값 base_dir/npy_cache)
+    """
+    assert storage in STORAGE_TYPES
+    if cache_dir is None:
+        cache_dir = os.path.join(base_dir, "npy_cache")
+
     print('base dir ', base_dir)
     data = {}
     caption_file = os.path.join(base_dir, "coco2014_captions.h5")
-    with h5py.File(caption_file, "r") as f:
-        for k, v in f.items():
-            data[k] = np.asarray(v)
+    data.update(_load_h5(caption_file, storage=storage, cache_dir=cache_dir))
 
     if pca_features:
         train_feat_file = os.path.join(base_dir, "train2014_vgg16_fc7_pca.h5")
     else:
         train_feat_file = os.path.join(base_dir, "train2014_vgg16_fc7.h5")
-    with h5py.File(train_feat_file, "r") as f:
-        data["train_features"] = np.asarray(f["features"])
+    data["train_features"] = _load_h5(train_feat_file, ["features"], storage, cache_dir)["features"]
 
     if pca_features:
         val_feat_file = os.path.join(base_dir, "val2014_vgg16_fc7_pca.h5")
     else:
         val_feat_file = os.path.join(base_dir, "val2014_vgg16_fc7.h5")
-    with h5py.File(val_feat_file, "r") as f:
-        data["val_features"] = np.asarray(f["features"])
+    data["val_features"] = _load_h5(val_feat_file, ["features"], storage, cache_dir)["features"]
 
     dict_file = os.path.join(base_dir, "coco2014_vocab.json")
     with open(dict_file, "r") as f:
@@ -47,8 +122,8 @@ def load_coco_data(base_dir=BASE_DIR, max_train=None, pca_features=True):
     if max_train is not None:
         num_train = data["train_captions"].shape[0]
         mask = np.random.randint(num_train, size=max_train)
-        data["train_captions"] = data["train_captions"][mask]
-        data["train_image_idxs"] = data["train_image_idxs"][mask]
+        data["train_captions"] = take_rows(data["train_captions"], mask)
+        data["train_image_idxs"] = take_rows(data["train_image_idxs"], mask)
 #         data["train_features"] = data["train_features"][data["train_image_idxs"]]
     return data
 
@@ -74,11 +149,102 @@ def decode_captions(captions, idx_to_word):
     return decoded
 
 
-def sample_coco_minibatch(data, batch_size=100, split="train"):
+def sample_coco_minibatch(data, batch_size=100, split="train", rng=None):
+    """
+    rng: np.random.RandomState (None 이면 np.random 사용)
+    """
+    rng = np.random if rng is None else rng
     split_size = data["%s_captions" % split].shape[0]
-    mask = np.random.choice(split_size, batch_size)
-    captions = data["%s_captions" % split][mask]
-    image_idxs = data["%s_image_idxs" % split][mask]
-    image_features = data["%s_features" % split][image_idxs]
+    mask = rng.choice(split_size, batch_size)
+    captions = take_rows(data["%s_captions" % split], mask)
+    image_idxs = take_rows(data["%s_image_idxs" % split], mask)
+    image_features = take_rows(data["%s_features" % split], image_idxs)
     urls = data["%s_urls" % split][image_idxs]
     return captions, image_features, urls
+
+
+class CocoCaptionDataset(Dataset):
+    """
+    (caption, image feature) 쌍의 torch Dataset 입니다.
+    index 로 list / array 를 주면 minibatch 전체를 take_rows 로 한 번에 읽기 때문에,
+    DataLoader 의 sampler 로 BatchSampler 를 주고 batch_size=None 으로 쓰면 worker 가 batch 단위로 읽습니다.
+    storage="hdf5" 는 열린 HDF5 파일을 worker process 와 공유할 수 없으므로 num_workers=0 으로 사용합니다.
+
+    사용 예:
+      dataset = CocoCaptionDataset(data, split="train")
+      sampler = BatchSampler(RandomSampler(dataset), batch_size=100, drop_last=False)
+      loader = DataLoader(dataset, sampler=sampler, batch_size=None, num_workers=2, pin_memory=True)
+    """
+
+    def __init__(self, data, split="train"):
+        self.captions = data["%s_captions" % split]
+        self.image_idxs = data["%s_image_idxs" % split]
+        self.features = data["%s_features" % split]
+
+    def __len__(self):
+        return self.captions.shape[0]
+
+    def __getitem__(self, index):
+        """
+        Returns:
+        - captions: int64 tensor of shape (T,) or (N, T)
+        - features: float32 tensor of shape (D,) or (N, D)
+        """
+        idxs = np.atleast_1d(np.asarray(index))
+        captions = take_rows(self.captions, idxs).astype(np.int64)
+        features = take_rows(self.features, take_rows(self.image_idxs, idxs)).astype(np.float32)
+        if np.ndim(index) == 0:
+            captions, features = captions[0], features[0]
+        return torch.from_numpy(captions), torch.from_numpy(features)
+
+
+class MinibatchPrefetcher(object):
+    """
+    Background thread 에서 sample_coco_minibatch 를 미리 만들어 두는 iterator 입니다.
+    "hdf5" / "mmap" storage 에서 디스크 읽기를 학습 step 과 겹쳐서 실행할 수 있습니다.
+
+    사용 예:
+      prefetcher = MinibatchPrefetcher(data, batch_size=100, split="train", seed=231)
+      captions, features, urls = next(prefetcher)
+      prefetcher.close()
+    """
+
+    def __init__(self, data, batch_size=100, split="train", num_prefetch=2, seed=None):
+        self.data = data
+        self.batch_size = batch_size
+        self.split = split
+        # thread 에서 np.random 을 같이 쓰면 main thread 의 난수 순서가 바뀌므로 별도 RandomState 사용
+        self.rng = np.random.RandomState(seed)
+
+        self.queue = queue.Queue(maxsize=num_prefetch)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                minibatch = sample_coco_minibatch(self.data, self.batch_size, self.split, rng=self.rng)
+            except Exception as err:
+                minibatch = err
+            while not self.stop_event.is_set():
+                try:
+                    self.queue.put(minibatch, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if isinstance(minibatch, Exception):
+                return
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        minibatch = self.queue.get()
+        if isinstance(minibatch, Exception):
+            raise minibatch
+        return minibatch
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
@@ -1,8 +1,66 @@
 import torch
 import torch.nn as nn
 from torch.nn import functional as F
+import functools
 import math
 
+# MultiHeadAttention backend
+#  - "reference": 아래 TODO 에서 구현한 attention (기본값, 실습 검증 코드와 같은 결과)
+#  - "sdpa": torch.nn.functional.scaled_dot_product_attention (fused kernel, (N, H, S, T) score 를 만들지 않음)
+#  - "chunked": query 를 chunk_size 씩 나눠 계산 (score 는 (N, H, chunk_size, T) 만 사용)
+#  - "auto": sdpa 를 쓸 수 있으면 sdpa, 아니면 chunked
+ATTENTION_BACKENDS = ("reference", "sdpa", "chunked", "auto")
+HAS_SDPA = hasattr(F, "scaled_dot_product_attention")
+
+
+@functools.lru_cache(maxsize=32)
+def _causal_mask(length, device):
+    return torch.tril(torch.ones(length, length, dtype=torch.bool, device=device))
+
+
+def causal_mask(length, device=None):
+    """
+    (length, length) bool mask. mask[i, j] == False 이면 i 번째 토큰이 j 번째 토큰을 보지 않습니다.
+    길이 / device 별로 cache 되므로 반환된 tensor를 in-place로 수정하면 안 됩니다.
+    """
+    return _causal_mask(length, torch.device(device if device is not None else "cpu"))
+
+
+def chunked_attention(query, key, value, attn_mask=None, dropout_p=0., chunk_size=256):
+    """
+    Query 를 chunk_size 씩 나눠서 계산하는 scaled dot-product attention.
+    Inputs:
+    - query: (N, H, S, E/H), key / value: (N, H, T, E/H)
+    - attn_mask: bool mask of shape (S, T), False 인 위치는 attend 하지 않습니다.
+    Returns:
+    - output: (N, H, S, E/H)
+    """
+    scale = 1. / math.sqrt(query.shape[-1])
+    key_t = key.transpose(-2, -1)
+
+    outputs = []
+    for start in range(0, query.shape[-2], chunk_size):
+        scores = torch.matmul(query[..., start:start + chunk_size, :], key_t) * scale
+        if attn_mask is not None:
+            scores = scores.masked_fill(~attn_mask[..., start:start + chunk_size, :], -float("inf"))
+        weights = F.dropout(torch.softmax(scores, dim=-1), dropout_p, training=dropout_p > 0)
+        outputs.append(torch.matmul(weights, value))
+
+    return torch.cat(outputs, dim=-2)
+
+
+def set_attention_backend(model, backend, chunk_size=None):
+    """
+    model 안의 모든 MultiHeadAttention 의 backend 를 바꿉니다.
+    """
+    assert backend in ATTENTION_BACKENDS
+    for module in model.modules():
+        if isinstance(module, MultiHeadAttention):
+            module.backend = backend
+            if chunk_size is not None:
+                module.chunk_size = chunk_size
+    return model
+
 ############################################################################
 # Req 2-2: PositionalEncoding 구현                                          #
 ############################################################################
@@ -88,16 +146,25 @@ class MultiHeadAttention(nn.Module):
       attn_output = attn(query=data, key=other_data, value=other_data)
     """
 
-    def __init__(self, embed_dim, num_heads, dropout=0.1):
+    def __init__(self, embed_dim, num_heads, dropout=0.1, backend="reference", chunk_size=256):
         """
         MultiHeadAttention layer를 정의합니.
         Inputs:
          - embed_dim: Dimension of the token embedding
          - num_heads: Number of attention heads
          - dropout: Dropout probability
+         - backend: attention 연산 방식 (ATTENTION_BACKENDS 참고)
+         - chunk_size: "chunked" backend 에서 한 번에 계산하는 query 길이
         """
         super().__init__()
         assert embed_dim % num_heads == 0
+        assert backend in ATTENTION_BACKENDS
+
+        # reference 이외의 backend 에서 사용하는 설정입니다. (파라미터가 없으므로 random seed 에 영향 없음)
+        self.backend = backend
+        self.chunk_size = chunk_size
+        self.backend_heads = num_heads
+        self.backend_dropout = dropout
 
         # 본 실습에서 사용한 key, query, value, proj 레이어의 정의입니다.
         # 실습 내의 random seed가 고정되어 있기 때문에, 아래 정의된 레이어의 순서를 바꾸면 안됩니다.
@@ -138,6 +205,9 @@ class MultiHeadAttention(nn.Module):
           data in value according to the attention weights calculated using key
           and query.
         """
+        if self.backend != "reference":
+            return self._fast_forward(query, key, value, attn_mask)
+
         N, S, D = query.shape
         N, T, D = value.shape
         # Create a placeholder, to be overwritten by your code below.
@@ -162,4 +232,58 @@ class MultiHeadAttention(nn.Module):
         ############################################################################
         #                             END OF YOUR CODE                             #
         ############################################################################
-        return output
\ No newline at end of file
+        return output
+
+    def _fast_forward(self, query, key, value, attn_mask=None):
+        """
+        sdpa / chunked backend 의 forward. 입출력 shape 과 attn_mask 규칙은 forward 와 같습니다.
+        """
+        k, v = self.project_key_value(key, value)
+        return self.attend(query, k, v, attn_mask)
+
+    def project_key_value(self, key, value):
+        """
+        key / value 를 head 별로 projection 합니다.
+        Incremental decoding 에서는 새 토큰의 결과만 cache 에 이어 붙이고 attend() 에 넘깁니다.
+        Inputs:
+        - key / value: (N, T, E)
+        Returns:
+        - k / v: (N, H, T, E/H)
+        """
+        N, T, E = value.shape
+        H = self.backend_heads
+
+        # (N, T, E) -> (N, H, T, E/H)
+        k = self.key(key).view(N, T, H, E // H).transpose(1, 2)
+        v = self.value(value).view(N, T, H, E // H).transpose(1, 2)
+        return k, v
+
+    def attend(self, query, k, v, attn_mask=None):
+        """
+        projection 된 key / value (project_key_value 결과) 로 attention output 을 계산합니다.
+        "reference" backend 에서는 chunked 와 같은 식으로 계산합니다.
+        Inputs:
+        - query: (N, S, E), k / v: (N, H, T, E/H)
+        - attn_mask: forward 와 같음
+        Returns:
+        - output: (N, S, E)
+        """
+        N, S, E = query.shape
+        H = self.backend_heads
+
+        q = self.query(query).view(N, S, H, E // H).transpose(1, 2)
+
+        mask = None
+        if attn_mask is not None:
+            mask = attn_mask if attn_mask.dtype == torch.bool else attn_mask != 0
+        dropout_p = self.backend_dropout if self.training else 0.
+
+        backend = self.backend
+        if backend == "auto":
+            backend = "sdpa" if HAS_SDPA else "chunked"
+        if backend == "sdpa":
+            output = F.scaled_dot_product_attention(q, k, v, attn_mask=mask, dropout_p=dropout_p)
+        else:
+            output = chunked_attention(q, k, v, mask, dropout_p, self.chunk_size)
+
+        return self.proj(output.transpose(1, 2).reshape(N, S, E))
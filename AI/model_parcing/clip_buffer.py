@@ -0,0 +1,102 @@
+# coding: utf-8
+import collections
+import os
+import queue
+import threading
+
+import cv2
+
+# clip_buffer 는 위반 영상(최근 N 초)을 만들기 위한 메모리 ring buffer 와 백그라운드 인코더입니다.
+# 기존에는 위반이 확정될 때마다 녹화 중이던 mp4 를 처음부터 다시 디코딩해서 마지막 10 초만 webm 으로 저장했기 때문에
+# 녹화 시간이 길어질수록 느려졌습니다. 여기서는 녹화 thread 가 프레임을 JPEG 로 압축해서 최근 N 초만 보관하고,
+# 위반이 확정되면 그 시점의 프레임 목록만 넘겨서 인코더 thread 가 webm 으로 저장합니다 (녹화 / 검출은 계속 진행).
+
+# 메모리 : 1280x720 JPEG(quality 90) 약 100~200 KB x 30 fps x 10 초 = 30~60 MB
+
+# 사용 예
+#   ring = FrameRingBuffer(seconds=10, fps=30)
+#   clip_writer = ClipWriter()
+#   ring.push(frame)                                         # 녹화 thread, 매 프레임
+#   clip_writer.submit(ring.snapshot(), './parsing/cut.webm', fps=30, on_done=report)
+
+
+class FrameRingBuffer:
+    '''
+    최근 seconds 초 프레임을 JPEG 로 보관하는 ring buffer
+    '''
+    def __init__(self, seconds, fps, quality=90):
+        self.frames = collections.deque(maxlen=int(seconds * fps))
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.lock = threading.Lock()
+
+    def push(self, frame):
+        ok, encoded = cv2.imencode('.jpg', frame, self.encode_params)
+        if not ok:
+            return False
+        with self.lock:
+            self.frames.append(encoded)
+        return True
+
+    def snapshot(self):
+        # 현재 보관 중인 프레임 목록 (JPEG 배열은 다시 쓰지 않으므로 list 복사만 한다)
+        with self.lock:
+            return list(self.frames)
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+
+    def __len__(self):
+        return len(self.frames)
+
+
+class ClipWriter:
+    '''
+    JPEG 프레임 목록 -> 동영상 파일 저장을 백그라운드 thread 에서 순서대로 처리
+    \n 저장이 끝나면 on_done(path) 호출 (신고 요청 등)
+    '''
+    def __init__(self, fourcc='vp80'):
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, frames, path, fps, on_done=None):
+        if len(frames) == 0:
+            return False
+        self.jobs.put((frames, path, fps, on_done))
+        return True
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            frames, path, fps, on_done = job
+            try:
+                self.write(frames, path, fps)
+                if on_done is not None:
+                    on_done(path)
+            except Exception as err:
+                print(f"[ClipWriter] {path} 저장 실패 : {err}")
+
+    def write(self, frames, path, fps):
+        first = cv2.imdecode(frames[0], cv2.IMREAD_COLOR)
+        h, w = first.shape[:2]
+
+        # 다른 프로그램이 저장 중인 파일을 읽지 않도록 임시 파일에 쓴 뒤 교체
+        root, ext = os.path.splitext(path)
+        tmp_path = f"{root}.tmp{ext}"
+        out = cv2.VideoWriter(tmp_path, self.fourcc, fps, (w, h))
+
+        out.write(first)
+        for encoded in frames[1:]:
+            out.write(cv2.imdecode(encoded, cv2.IMREAD_COLOR))
+        out.release()
+
+        os.replace(tmp_path, path)
+
+    def close(self):
+        # 남은 작업까지 저장하고 종료
+        self.jobs.put(None)
+        self.thread.join()
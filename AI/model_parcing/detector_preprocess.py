@@ -0,0 +1,154 @@
+# coding: utf-8
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# NMS 는 AD 카메라 검출 노드와 같이 쓰는 저장소 최상위 common/nms_util.py 를 사용
+COMMON_PATH = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'common'))
+if COMMON_PATH not in sys.path:
+    sys.path.append(COMMON_PATH)
+
+from nms_util import nms
+
+# detector_preprocess 는 차량 검출기(mmdet) 입력을 만드는 전처리 / 결과를 되돌리는 후처리 모듈입니다.
+# 기존에는 1280x720 카메라 프레임을 1920x1080 으로 키운 뒤 검출기에 넣었는데, mmdet test pipeline 이
+# 다시 자체 해상도로 줄이기 때문에 계산만 늘고 정보는 늘지 않았습니다.
+# 여기서는 원본 해상도(또는 scale 배)에서 도로 ROI 만 잘라 검출하고, 필요하면 ROI 를 겹치는 tile 로 나눠서
+# 작은(먼) 차량을 더 큰 해상도로 검출합니다. tile 경계에서 중복된 박스는 class 별 NMS 로 합칩니다.
+# 결과 박스 / mask 는 후처리(VIOLATION_MAP 판정, create_json)가 쓰는 기준 좌표계(canonical, 1920x1080)로 변환해서
+# mmdet 결과와 같은 형식 (class 별 bbox 배열 list, class 별 mask list) 으로 반환합니다.
+
+# 좌표 변환 : canonical = (tile 좌표 / scale + tile 시작점) * (canonical 크기 / 프레임 크기)
+
+# 사용 예
+#   preprocessor = DetectorPreprocessor(canonical_size=(1920, 1080), roi=(0., 0.3, 1., 1.), tiles=(2, 1))
+#   tiles, windows = preprocessor.prepare(frame)
+#   tile_results = inference_detector(model, tiles)
+#   bbox_result, segm_result = preprocessor.merge(frame.shape, windows, tile_results)
+
+
+class DetectorPreprocessor:
+    '''
+    ROI crop / tile 분할 (prepare) 과 tile 결과 병합 + canonical 좌표 변환 (merge)
+    \n roi : (x0, y0, x1, y1) 프레임 비율, scale : 검출기에 넣는 해상도 배율 (1.0 = 원본)
+    \n tiles : (가로, 세로) tile 수, overlap : tile 끼리 겹치는 비율
+    '''
+    def __init__(self, canonical_size=(1920, 1080), roi=(0., 0., 1., 1.), scale=1.0,
+                 tiles=(1, 1), overlap=0.2, nms_threshold=0.5):
+        self.canonical_size = canonical_size
+        self.roi = roi
+        self.scale = scale
+        self.tiles = tiles
+        self.overlap = overlap
+        self.nms_threshold = nms_threshold
+        self.window_cache = {}
+
+    def windows(self, frame_shape):
+        # 프레임 크기별 tile 영역 [(x0, y0, x1, y1), ...] (프레임 픽셀 좌표)
+        h, w = frame_shape[:2]
+        if (h, w) in self.window_cache:
+            return self.window_cache[(h, w)]
+
+        rx0, ry0 = int(round(self.roi[0] * w)), int(round(self.roi[1] * h))
+        rx1, ry1 = int(round(self.roi[2] * w)), int(round(self.roi[3] * h))
+
+        def split(start, end, n):
+            length = (end - start) / (n - (n - 1) * self.overlap)
+            step = length * (1 - self.overlap)
+            return [(int(round(start + i * step)), min(int(round(start + i * step + length)), end)) for i in range(n)]
+
+        windows = [(x0, y0, x1, y1)
+                   for y0, y1 in split(ry0, ry1, self.tiles[1])
+                   for x0, x1 in split(rx0, rx1, self.tiles[0])]
+        self.window_cache[(h, w)] = windows
+
+        return windows
+
+    def prepare(self, frame):
+        '''
+        # Output
+            # tiles : 검출기 입력 이미지 list, windows : tile 별 프레임 영역
+        '''
+        windows = self.windows(frame.shape)
+        tiles = []
+        for x0, y0, x1, y1 in windows:
+            tile = frame[y0:y1, x0:x1]
+            if self.scale != 1.0:
+                tile = cv2.resize(tile, (int(round((x1 - x0) * self.scale)), int(round((y1 - y0) * self.scale))),
+                                  interpolation=cv2.INTER_LINEAR)
+            else:
+                tile = np.ascontiguousarray(tile)
+            tiles.append(tile)
+
+        return tiles, windows
+
+    def merge(self, frame_shape, windows, tile_results):
+        '''
+        # tile 별 mmdet 결과 -> canonical 좌표계 결과 1개
+        # Input
+            # tile_results : [(bbox_result, segm_result), ...] tile 순서
+        # Output
+            # bbox_result : class 별 (n, 5) [x1, y1, x2, y2, score], segm_result : class 별 canonical 크기 bool mask list
+        '''
+        h, w = frame_shape[:2]
+        cw, ch = self.canonical_size
+        kx, ky = cw / float(w), ch / float(h)
+
+        boxes, labels, masks, tile_index = [], [], [], []
+        num_classes = len(tile_results[0][0])
+        for t, (bbox_result, segm_result) in enumerate(tile_results):
+            if isinstance(segm_result, tuple):
+                segm_result = segm_result[0]
+            for label in range(num_classes):
+                class_boxes = np.asarray(bbox_result[label], dtype=np.float64).reshape(-1, 5)
+                boxes.append(class_boxes)
+                labels += [label] * len(class_boxes)
+                tile_index += [t] * len(class_boxes)
+                masks += list(segm_result[label]) if segm_result is not None else [None] * len(class_boxes)
+
+        boxes = np.concatenate(boxes) if boxes else np.zeros((0, 5))
+        labels = np.asarray(labels, dtype=np.int64)
+        tile_index = np.asarray(tile_index, dtype=np.int64)
+
+        # tile 좌표 -> canonical 좌표 (박스 전체를 행렬 연산으로)
+        offsets = np.asarray(windows, dtype=np.float64)[tile_index, :2] if len(boxes) else np.zeros((0, 2))
+        boxes[:, [0, 2]] = (boxes[:, [0, 2]] / self.scale + offsets[:, :1]) * kx
+        boxes[:, [1, 3]] = (boxes[:, [1, 3]] / self.scale + offsets[:, 1:]) * ky
+
+        keep = np.arange(len(boxes))
+        if len(windows) > 1 and len(boxes) > 0:
+            # tile 겹침 영역의 중복 박스 제거 (class 별)
+            keep = np.sort(nms(boxes[:, :4], boxes[:, 4], self.nms_threshold, labels=labels, box_format='xyxy'))
+
+        bbox_result = [np.zeros((0, 5), dtype=np.float32) for _ in range(num_classes)]
+        segm_result = [[] for _ in range(num_classes)]
+        for label in range(num_classes):
+            class_keep = keep[labels[keep] == label]
+            bbox_result[label] = boxes[class_keep].astype(np.float32)
+            segm_result[label] = [self._canonical_mask(masks[i], windows[tile_index[i]], kx, ky)
+                                  for i in class_keep if masks[i] is not None]
+
+        return bbox_result, segm_result
+
+    def _canonical_mask(self, mask, window, kx, ky):
+        # tile mask -> canonical 크기 mask (tile 영역에만 nearest resize 해서 붙임)
+        x0, y0, x1, y1 = window
+        cx0, cy0 = int(round(x0 * kx)), int(round(y0 * ky))
+        cx1, cy1 = int(round(x1 * kx)), int(round(y1 * ky))
+
+        canonical = np.zeros((self.canonical_size[1], self.canonical_size[0]), dtype=bool)
+        mask = np.asarray(mask).astype(np.uint8)
+        if mask.shape[:2] == (cy1 - cy0, cx1 - cx0):
+            canonical[cy0:cy1, cx0:cx1] = mask > 0
+        else:
+            canonical[cy0:cy1, cx0:cx1] = cv2.resize(mask, (cx1 - cx0, cy1 - cy0), interpolation=cv2.INTER_NEAREST) > 0
+
+        return canonical
+
+    def canonical_to_frame(self, points, frame_shape):
+        # canonical 좌표 [x1, y1, x2, y2, ...] -> 프레임 좌표 (번호판 검출 등 원본 프레임에서 자를 때)
+        h, w = frame_shape[:2]
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        return (points * (w / float(self.canonical_size[0]), h / float(self.canonical_size[1]))).reshape(-1)
@@ -0,0 +1,87 @@
+# coding: utf-8
+import threading
+
+import cv2
+import numpy as np
+
+# frame_gate 는 매 프레임 실행하는 가벼운 사전 필터로, 추론(차량 + 차선 + 위반 분류)을 돌릴 프레임을 고릅니다.
+# 프레임을 작은 흑백 썸네일로 줄여서 마지막으로 추론한 프레임과의 평균 밝기 차이를 계산하고,
+# 장면이 거의 그대로면 추론을 건너뜁니다. 추론 간격은 장면 상황에 맞춰 바뀝니다.
+# - 직전 추론에서 차량이 있었으면 min_interval, 없으면 base_interval 마다 추론 후보
+# - 후보 프레임이라도 변화량이 diff_threshold 보다 작으면 건너뛰고, max_interval 이 지나면 변화와 상관없이 추론
+# 차량이 많은 장면에서는 기존(30 프레임마다)보다 자주, 정지 / 빈 도로에서는 max_interval 마다만 추론합니다.
+# 썸네일 계산은 1920x1080 기준 약 0.3 ms
+
+# 사용 예
+#   frame_gate = FrameChangeGate(min_interval=10, base_interval=30, max_interval=90)
+#   if frame_gate.should_infer(frame):        # capture thread, 매 프레임
+#       ...
+#   frame_gate.report(num_vehicles)           # inference thread, 추론 결과
+#   print(frame_gate.stats())
+
+
+class FrameChangeGate:
+    def __init__(self, min_interval=10, base_interval=30, max_interval=90,
+                 diff_threshold=4., thumb_size=(64, 36)):
+        self.min_interval = min_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.diff_threshold = diff_threshold
+        self.thumb_size = thumb_size
+
+        self.lock = threading.Lock()
+        self.interval = base_interval
+        self.reference = None
+        self.frames_since = 0
+        self.last_diff = 0.
+
+        self.executed = 0
+        self.skipped_interval = 0
+        self.skipped_static = 0
+
+    def thumbnail(self, frame):
+        # 8 픽셀 간격으로 먼저 샘플링한 뒤 INTER_AREA 로 썸네일 (흑백, float32)
+        # (1920x1080 전체에 INTER_AREA 는 약 2 ms, 샘플링 후에는 약 0.3 ms)
+        small = cv2.resize(frame[::8, ::8], self.thumb_size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small.astype(np.float32)
+
+    def should_infer(self, frame):
+        '''
+        # 이 프레임을 추론할지 결정 (capture thread 에서 매 프레임 호출)
+        '''
+        with self.lock:
+            self.frames_since += 1
+            if self.reference is not None and self.frames_since < self.interval:
+                self.skipped_interval += 1
+                return False
+
+            thumb = self.thumbnail(frame)
+            if self.reference is not None:
+                self.last_diff = float(cv2.norm(thumb, self.reference, cv2.NORM_L1)) / thumb.size
+                if self.last_diff < self.diff_threshold and self.frames_since < self.max_interval:
+                    self.skipped_static += 1
+                    return False
+
+            self.reference = thumb
+            self.frames_since = 0
+            self.executed += 1
+            return True
+
+    def report(self, num_vehicles):
+        # 추론 결과로 다음 추론 간격 조정 (inference thread)
+        with self.lock:
+            self.interval = self.min_interval if num_vehicles > 0 else self.base_interval
+
+    def stats(self):
+        with self.lock:
+            total = self.executed + self.skipped_interval + self.skipped_static
+            return {
+                "executed": self.executed,
+                "skipped_interval": self.skipped_interval,
+                "skipped_static": self.skipped_static,
+                "execute_ratio": self.executed / max(total, 1),
+                "interval": self.interval,
+                "last_diff": self.last_diff,
+            }
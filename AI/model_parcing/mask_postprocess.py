@@ -0,0 +1,121 @@
+# coding: utf-8
+import cv2
+import numpy as np
+
+# mask_postprocess 는 차선 분할(lane_model) 결과를 ObjectInfo 용 bbox / polygon 으로 바꾸는 후처리 모듈입니다.
+# 기존 방식은 label map 을 1920x1080 으로 키운 뒤 전체 이미지 dilate(5x5, 3회)를 하고
+# label 마다 1920x1080 bool mask 를 만들어 sum / findContours 를 했습니다.
+# 여기서는 모델 해상도(800x1333) label map 에서 dilate / 면적 계산 / contour 추출을 하고
+# contour 좌표만 원본 해상도로 scale 합니다. label 별 면적은 bincount 1번으로 모두 계산합니다.
+# segm 은 LabelMask (label map 을 공유하는 lazy mask)로 넘겨서 필요한 픽셀만 원본 해상도 기준으로 읽습니다.
+
+# 사용 예
+#   label_map = torch.argmax(lane_out, 1).to(torch.uint8).cpu().numpy()[0]   # 모델 해상도 그대로
+#   for label, bbox, poly, segm in extract_label_polygons(label_map, (1920, 1080)):
+#       ...
+
+# 원본 해상도 기준 dilate 반경 (5x5 kernel 3회 = 반경 6 픽셀)
+DILATE_RADIUS = 6
+
+
+def nearest_source_index(src_len, dst_len):
+    '''
+    # torch.nn.functional.interpolate(mode='nearest') 와 같은 샘플링 위치
+    # Output
+        # index : (dst_len,) dst 픽셀 i 가 읽는 src 픽셀 index
+    '''
+    scale = np.float32(src_len) / np.float32(dst_len)
+    index = np.floor(np.arange(dst_len, dtype=np.float32) * scale).astype(np.int64)
+
+    return np.minimum(index, src_len - 1)
+
+
+class LabelMask:
+    '''
+    원본 해상도 bool mask 처럼 쓰는 label 하나의 mask (label map 을 upsample 한 결과와 같은 값)
+    \n 실제 1920x1080 배열은 np.asarray(mask) 로 요청할 때만 만든다
+    \n np.sum(mask), mask.shape, mask[np.ix_(ys, xs)] 는 배열을 만들지 않고 계산
+    '''
+    def __init__(self, label_map, label, ys, xs, area):
+        # ys, xs : 원본 해상도 행 / 열 -> label map 행 / 열 index
+        self.label_map = label_map
+        self.label = label
+        self.ys = ys
+        self.xs = xs
+        self.area = area
+        self.shape = (len(ys), len(xs))
+        self.dtype = np.dtype(bool)
+
+    def sum(self, *args, **kwargs):
+        return self.area
+
+    def __array__(self, dtype=None, copy=None):
+        mask = self.label_map[np.ix_(self.ys, self.xs)] == self.label
+        return mask if dtype is None else mask.astype(dtype)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and len(key) == 2 and all(isinstance(k, np.ndarray) for k in key):
+            # np.ix_ 등 정수 index 배열 : label map 좌표로 바꿔서 바로 읽는다
+            return self.label_map[self.ys[key[0]], self.xs[key[1]]] == self.label
+        return np.asarray(self)[key]
+
+    def astype(self, dtype):
+        return np.asarray(self, dtype=dtype)
+
+
+def extract_label_polygons(label_map, out_size, min_area=1500, epsilon=0.005, dilate_radius=DILATE_RADIUS):
+    '''
+    # label map 1장 -> label 별 (bbox, polygon)
+    # Input
+        # label_map : (h, w) uint8, 모델 해상도 argmax 결과 (0 : 배경)
+        # out_size : (W, H) 원본 해상도
+        # min_area : 원본 해상도 기준 최소 면적 (픽셀)
+        # epsilon : approxPolyDP 허용 오차 (둘레 비율)
+        # dilate_radius : 원본 해상도 기준 dilate 반경 (픽셀)
+    # Output
+        # [(label, bbox[x1, y1, x2, y2], poly[x1, y1, x2, y2, ...], segm(LabelMask)), ...] - label 오름차순
+    '''
+    out_w, out_h = out_size
+    h, w = label_map.shape[:2]
+    scale_x = out_w / float(w)
+    scale_y = out_h / float(h)
+
+    # 원본 해상도 dilate 반경을 모델 해상도로 환산 (회색조 dilate 이므로 label 값이 큰 쪽이 경계를 차지하는 것도 동일)
+    if dilate_radius > 0:
+        kx = 2 * max(1, int(round(dilate_radius / scale_x))) + 1
+        ky = 2 * max(1, int(round(dilate_radius / scale_y))) + 1
+        label_map = cv2.dilate(label_map, np.ones((ky, kx), np.uint8))
+
+    ys = nearest_source_index(h, out_h)
+    xs = nearest_source_index(w, out_w)
+
+    # 원본 해상도에서 label map 픽셀 하나가 차지하는 픽셀 수 -> label 별 원본 해상도 면적을 한 번에 계산
+    pixel_weight = np.outer(np.bincount(ys, minlength=h), np.bincount(xs, minlength=w)).astype(np.float64)
+    areas = np.bincount(label_map.ravel(), weights=pixel_weight.ravel(), minlength=256)
+
+    results = []
+    for label in np.flatnonzero(areas >= min_area):
+        if label == 0:
+            continue
+
+        c, _ = cv2.findContours((label_map == label).astype(np.uint8), cv2.RETR_EXTERNAL,
+                                cv2.CHAIN_APPROX_SIMPLE)
+        # 같은 label 의 연결 요소 중 가장 큰 것 (기존 c[0] 은 몇 픽셀짜리 조각이 선택되기도 했음)
+        contour = max(c, key=cv2.contourArea)
+
+        # bbox : label map 픽셀 범위를 원본 해상도 픽셀 범위로 (upsample 한 mask 의 boundingRect 와 같은 값)
+        x, y, bw, bh = cv2.boundingRect(contour)
+        bbox = np.array((np.searchsorted(xs, x), np.searchsorted(ys, y),
+                         np.searchsorted(xs, x + bw), np.searchsorted(ys, y + bh)))
+
+        # polygon : contour 좌표만 원본 해상도로 scale (픽셀 중심 기준)
+        contour = contour.astype(np.float32)
+        contour[:, 0, 0] = (contour[:, 0, 0] + 0.5) * scale_x - 0.5
+        contour[:, 0, 1] = (contour[:, 0, 1] + 0.5) * scale_y - 0.5
+        approx_poly = cv2.approxPolyDP(contour, epsilon * cv2.arcLength(contour, True), True)
+        points = approx_poly.squeeze(1).reshape(-1).astype(float)
+
+        segm = LabelMask(label_map, label, ys, xs, int(areas[label]))
+        results.append((int(label), bbox, points, segm))
+
+    return results
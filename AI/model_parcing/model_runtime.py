@@ -0,0 +1,252 @@
+# coding: utf-8
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import torch
+import torch.nn as nn
+
+# model_runtime 은 서비스에서 쓰는 모델(차량 검출, 차선 분할, 위반 분류)을 한 번 로드해서
+# 실행 방식(backend / precision / memory format)을 정하고, 시작할 때 warm-up, 실행할 때 지연 시간을 기록하는 모듈입니다.
+# CPU 전용 edge 장비에서 실시간 처리를 위해 TorchScript(freeze) / ONNX Runtime export 와
+# bfloat16 autocast, int8 dynamic quantization, channels_last 를 모델별로 선택할 수 있습니다.
+
+# backend
+# - 'eager'       : 일반 PyTorch 모델 (mmdet 모델처럼 export 가 어려운 모델은 call_fn 으로 감싸서 사용)
+# - 'torchscript' : torch.jit.trace + freeze + optimize_for_inference, export_dir 에 저장 후 다음 실행부터 바로 로드
+#                   저장 파일 이름에 가중치(state_dict) hash 와 입력 shape 이 들어가므로 checkpoint 가 바뀌면 다시 변환
+# - 'onnx'        : torch.onnx.export 후 onnxruntime CPUExecutionProvider 로 실행 (onnxruntime 이 없으면 eager)
+#                   export_dir 이 None 이면 임시 파일로 export 하고 session 생성 후 삭제 (캐시하지 않음)
+# precision
+# - 'fp32'        : 기본
+# - 'bf16'        : CPU autocast(bfloat16), AVX512-BF16 / AMX 가 있는 CPU 에서 빠름 (eager / torchscript)
+# - 'int8'        : nn.Linear 를 int8 dynamic quantization (CPU 전용, eager / torchscript)
+#                   conv 위주 모델은 효과가 적으므로 backend 와 같이 측정 후 선택
+
+# 사용 예
+#   runtime = ModelRuntime('violation', model, example_input=torch.zeros(1, 3, 224, 224),
+#                          backend='torchscript', channels_last=True, export_dir='./runtime_cache')
+#   runtime.warmup()
+#   outputs = runtime(img_tensor)
+#   print(latency_report())
+
+RUNTIMES = []
+
+
+class LatencyMeter:
+    '''
+    모델별 실행 시간 통계 (여러 thread 에서 호출 가능)
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.count = 0
+            self.items = 0
+            self.total = 0.
+            self.max = 0.
+            self.last = 0.
+
+    def add(self, elapsed, items=1):
+        with self.lock:
+            self.count += 1
+            self.items += items
+            self.total += elapsed
+            self.max = max(self.max, elapsed)
+            self.last = elapsed
+
+    def summary(self):
+        # return : (호출 수, 평균 ms, 최대 ms, 입력 1개당 평균 ms)
+        with self.lock:
+            if self.count == 0:
+                return 0, 0., 0., 0.
+            return (self.count, self.total / self.count * 1e3, self.max * 1e3,
+                    self.total / max(self.items, 1) * 1e3)
+
+
+def state_dict_hash(model):
+    # 가중치 / buffer 이름, dtype, shape, 값으로 만든 hash (checkpoint 가 바뀌면 달라짐)
+    digest = hashlib.sha1()
+    for key, value in model.state_dict().items():
+        digest.update(key.encode())
+        if torch.is_tensor(value):
+            value = value.detach().cpu().contiguous()
+            digest.update(f"{value.dtype}{tuple(value.shape)}".encode())
+            digest.update(value.reshape(-1).view(torch.uint8).numpy().tobytes())
+    return digest.hexdigest()
+
+
+class _SelectOutput(nn.Module):
+    # dict 를 반환하는 모델(torchvision segmentation 등)에서 key 하나만 tensor 로 반환 (trace / onnx export 용)
+    def __init__(self, model, key):
+        super().__init__()
+        self.model = model
+        self.key = key
+
+    def forward(self, x):
+        return self.model(x)[self.key]
+
+
+class ModelRuntime:
+    '''
+    모델 1개의 실행기 - 로드한 모델을 backend / precision 에 맞게 한 번 변환하고 __call__ 로 실행
+    \n example_input : trace / export / warm-up 에 쓰는 입력 (call_fn 을 쓰면 call_fn 의 입력)
+    \n output_key : 모델이 dict 를 반환하면 이 key 의 tensor 만 반환
+    \n call_fn : call_fn(model, inputs) 로 실행 (mmdet inference_detector 등, eager 만 지원)
+    '''
+    def __init__(self, name, model, example_input=None, device=torch.device('cpu'),
+                 backend='eager', precision='fp32', channels_last=False,
+                 output_key=None, call_fn=None, export_dir=None):
+        self.name = name
+        self.device = device
+        self.backend = backend
+        self.precision = precision
+        self.channels_last = channels_last
+        self.call_fn = call_fn
+        self.example_input = example_input
+        self.export_dir = export_dir
+        self.meter = LatencyMeter()
+
+        if call_fn is not None and backend != 'eager':
+            print(f"[{name}] call_fn 모델은 eager 만 지원 : {backend} -> eager")
+            self.backend = 'eager'
+        if device.type != 'cpu' and precision in ('bf16', 'int8'):
+            print(f"[{name}] {precision} 는 CPU 전용 : {precision} -> fp32")
+            self.precision = 'fp32'
+        if self.backend == 'onnx' and self.precision != 'fp32':
+            print(f"[{name}] onnx backend 는 fp32 만 지원 : {self.precision} -> fp32")
+            self.precision = 'fp32'
+
+        if output_key is not None:
+            model = _SelectOutput(model, output_key)
+        model = model.eval()
+        # export 캐시 이름용 - 양자화 / device 이동 전의 원래 가중치로 계산
+        self.weights_hash = state_dict_hash(model) if export_dir is not None else None
+
+        if self.precision == 'int8':
+            model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+        model = model.to(device)
+        if channels_last:
+            model = model.to(memory_format=torch.channels_last)
+
+        if self.backend == 'torchscript':
+            self.model = self._load_torchscript(model)
+        elif self.backend == 'onnx':
+            self.model = self._load_onnx(model)
+        else:
+            self.model = model
+
+        RUNTIMES.append(self)
+
+    def _export_path(self, ext):
+        if self.export_dir is None:
+            return None
+        os.makedirs(self.export_dir, exist_ok=True)
+        # 이름 / precision / memory format + 입력 shape + 가중치 hash (같은 이름의 다른 모델, 교체된 checkpoint 구분)
+        shape = 'x'.join(str(d) for d in self.example_input.shape)
+        tag = (f"{self.name}_{self.precision}{'_cl' if self.channels_last else ''}"
+               f"_{shape}_{self.weights_hash[:16]}")
+        return os.path.join(self.export_dir, f"{tag}.{ext}")
+
+    def _load_torchscript(self, model):
+        path = self._export_path('ts.pt')
+        if path is not None and os.path.exists(path):
+            scripted = torch.jit.load(path, map_location=self.device).eval()
+        else:
+            with torch.no_grad(), self._autocast():
+                scripted = torch.jit.trace(model, self._prepare(self.example_input), check_trace=False)
+            scripted = torch.jit.freeze(scripted)
+            if path is not None:
+                scripted.save(path)
+
+        return torch.jit.optimize_for_inference(scripted)
+
+    def _load_onnx(self, model):
+        try:
+            import onnxruntime as ort
+        except ImportError as err:
+            print(f"[{self.name}] onnxruntime 없음 ({err}) -> eager")
+            self.backend = 'eager'
+            return model
+
+        path = self._export_path('onnx')
+        temporary = path is None
+        if temporary:
+            # 캐시하지 않음 - 임시 파일로 export 하고 session 을 만든 뒤 삭제
+            fd, path = tempfile.mkstemp(prefix=f"{self.name}_", suffix='.onnx')
+            os.close(fd)
+
+        try:
+            if temporary or not os.path.exists(path):
+                with torch.no_grad():
+                    torch.onnx.export(model, self._prepare(self.example_input), path,
+                                      input_names=['input'], output_names=['output'],
+                                      dynamic_axes={'input': {0: 'batch', 2: 'height', 3: 'width'},
+                                                    'output': {0: 'batch'}},
+                                      opset_version=17)
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        finally:
+            if temporary:
+                for tmp_path in (path, path + '.data'):
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+
+        def run(x):
+            output = session.run(None, {'input': x.detach().cpu().numpy()})[0]
+            return torch.from_numpy(output)
+
+        return run
+
+    def _autocast(self):
+        return torch.autocast('cpu', dtype=torch.bfloat16, enabled=self.precision == 'bf16')
+
+    def _prepare(self, x):
+        if self.call_fn is not None:
+            return x
+        x = x.to(self.device)
+        if self.channels_last and self.backend != 'onnx':
+            x = x.contiguous(memory_format=torch.channels_last)
+        return x
+
+    @torch.no_grad()
+    def __call__(self, inputs):
+        start = time.perf_counter()
+        with self._autocast():
+            if self.call_fn is not None:
+                outputs = self.call_fn(self.model, inputs)
+            else:
+                outputs = self.model(self._prepare(inputs))
+        if torch.is_tensor(outputs):
+            # 후처리는 fp32 기준이므로 bf16 출력은 되돌린다
+            outputs = outputs.float()
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+        self.meter.add(time.perf_counter() - start, len(inputs))
+
+        return outputs
+
+    def warmup(self, n_iter=3):
+        # 첫 실행의 메모리 할당 / kernel 선택 / JIT 최적화를 시작할 때 끝내고 통계에서는 제외
+        if self.example_input is None:
+            return
+        for _ in range(n_iter):
+            self(self.example_input)
+        self.meter.reset()
+
+
+def latency_report(runtimes=None):
+    # 모델별 지연 시간 표
+    lines = [f"{'model':<12s}{'backend':<13s}{'prec':<6s}{'calls':>7s}{'mean ms':>10s}{'max ms':>10s}{'ms/img':>9s}"]
+    for runtime in runtimes or RUNTIMES:
+        count, mean, max_ms, per_item = runtime.meter.summary()
+        lines.append(f"{runtime.name:<12s}{runtime.backend:<13s}{runtime.precision:<6s}"
+                     f"{count:>7d}{mean:>10.1f}{max_ms:>10.1f}{per_item:>9.1f}")
+
+    return "\n".join(lines)
@@ -0,0 +1,81 @@
+# coding: utf-8
+import threading
+
+import cv2
+import numpy as np
+
+# plate_extractor 는 위반 차량 polygon 안에서 번호판을 찾는 모듈입니다.
+# 기존 make_plate 는 프레임 전체 크기 mask 를 만들어 cropped_image.jpg 로 저장했다가 다시 읽고,
+# 호출할 때마다 Haar cascade XML 을 새로 로드해서 프레임 전체에 detectMultiScale 을 실행한 뒤 plate_{i}.jpg 로 저장했습니다.
+# 여기서는 polygon bbox 만큼만 잘라서 그 안에서 mask / 검출을 하고, 결과는 파일 대신 배열(또는 JPEG bytes)로 반환합니다.
+# cascade 는 thread 마다 한 번만 로드합니다 (CascadeClassifier 는 thread 간 공유가 안전하지 않음).
+
+# 사용 예
+#   plate_extractor = PlateExtractor()
+#   plates = plate_extractor.extract(frame, vehicle_poly)              # [(bbox, plate_bgr), ...]
+#   plates = plate_extractor.extract(frame, vehicle_poly, encode=True) # [(bbox, jpeg bytes), ...]
+
+PLATE_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_russian_plate_number.xml'
+
+
+class PlateExtractor:
+    def __init__(self, cascade_path=PLATE_CASCADE_PATH, jpeg_quality=95):
+        self.cascade_path = cascade_path
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.local = threading.local()
+
+        # 경로가 잘못되었으면 첫 위반 때가 아니라 시작할 때 알 수 있도록 미리 한 번 로드
+        self._cascade()
+
+    def _cascade(self):
+        cascade = getattr(self.local, 'cascade', None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(self.cascade_path)
+            if cascade.empty():
+                raise IOError(f"cascade 파일을 읽을 수 없습니다 : {self.cascade_path}")
+            self.local.cascade = cascade
+        return cascade
+
+    def crop_vehicle(self, frame, poly):
+        '''
+        # 차량 polygon bbox 만큼 잘라서 polygon 밖은 검정으로
+        # Input
+            # frame : BGR 프레임, poly : [x1, y1, x2, y2, ...] (프레임 좌표)
+        # Output
+            # crop : polygon bbox 영역 (polygon 밖 0), (x0, y0) : crop 의 프레임 좌표 시작점
+        '''
+        points = np.round(np.asarray(poly, dtype=np.float64).reshape(-1, 2)).astype(np.int32)
+        h, w = frame.shape[:2]
+        x0, y0 = np.clip(points.min(axis=0), 0, [w - 1, h - 1])
+        x1, y1 = np.clip(points.max(axis=0) + 1, 1, [w, h])
+
+        mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        cv2.fillPoly(mask, [points - (x0, y0)], 255)
+        crop = cv2.bitwise_and(frame[y0:y1, x0:x1], frame[y0:y1, x0:x1], mask=mask)
+
+        return crop, (int(x0), int(y0))
+
+    def extract(self, frame, poly, encode=False):
+        '''
+        # 차량 polygon 안의 번호판 검출
+        # Output
+            # [(bbox[x, y, w, h] 프레임 좌표, 번호판 BGR 배열 또는 encode=True 이면 JPEG bytes), ...]
+        '''
+        crop, (x0, y0) = self.crop_vehicle(frame, poly)
+        if crop.size == 0:
+            return []
+
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        plates = self._cascade().detectMultiScale(gray)
+
+        results = []
+        for x, y, w, h in plates:
+            plate = crop[y:y + h, x:x + w].copy()
+            if encode:
+                ok, encoded = cv2.imencode('.jpg', plate, self.encode_params)
+                if not ok:
+                    continue
+                plate = encoded.tobytes()
+            results.append(((int(x) + x0, int(y) + y0, int(w), int(h)), plate))
+
+        return results
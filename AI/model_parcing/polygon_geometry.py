@@ -0,0 +1,209 @@
+# coding: utf-8
+import cv2
+import numpy as np
+
+# polygon_geometry 는 annotation / 추론 결과 polygon 의 기하 계산 모듈입니다 (numpy 배열 기반).
+# polygon 은 (N, 2) float 배열로 다루고, 입력으로는 [{"x", "y"}, ...] (AI-Hub annotation),
+# [x1, y1, x2, y2, ...] (COCO segmentation, ObjectInfo.poly), (N, 2) 배열을 모두 받습니다.
+# 면적 / bbox 는 한 파일의 모든 polygon 을 이어 붙여 reduceat 으로 한 번에 계산할 수 있습니다.
+# 입력 list 를 바꾸지 않으므로 호출하는 쪽에서 deepcopy 할 필요가 없습니다.
+
+# 사용 예
+#   xy = to_array(target["value"]["points"])
+#   area, bbox = polygon_area(xy), polygon_bbox(xy)
+#   areas, bboxes = polygon_areas(polys), polygon_bboxes(polys)     # 여러 개 한 번에
+#   iou = polygon_iou(poly_a, poly_b)
+
+
+def to_array(points):
+    '''
+    # polygon 입력 -> (N, 2) 배열
+    # 좌표가 모두 정수면 정수 배열 그대로 둔다
+    '''
+    if len(points) > 0 and isinstance(points[0], dict):
+        xy = np.array([(point["x"], point["y"]) for point in points])
+    else:
+        xy = np.asarray(points)
+    if xy.dtype.kind not in 'iuf':
+        xy = xy.astype(np.float64)
+    return xy.reshape(-1, 2)
+
+
+def to_points(xy):
+    # (N, 2) 또는 [x1, y1, ...] -> [{"x", "y"}, ...] (annotation json 형식)
+    return [{"x": x, "y": y} for x, y in to_array(xy).tolist()]
+
+
+def to_flat(xy):
+    # (N, 2) -> [x1, y1, x2, y2, ...] (COCO segmentation 형식)
+    return to_array(xy).reshape(-1).tolist()
+
+
+def polygon_area(xy):
+    # shoelace 공식 (닫는 점은 np.roll 로 처리, 입력을 바꾸지 않음)
+    xy = to_array(xy).astype(np.float64)
+    x, y = xy[:, 0], xy[:, 1]
+    return float(abs(0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))))
+
+
+def polygon_bbox(xy):
+    # [x, y, w, h] (COCO bbox 형식)
+    xy = to_array(xy)
+    x0, y0 = xy.min(axis=0).tolist()
+    x1, y1 = xy.max(axis=0).tolist()
+    return [x0, y0, x1 - x0, y1 - y0]
+
+
+def polygon_centroid(xy):
+    # 면적 중심 (면적이 0 이면 점 평균)
+    xy = to_array(xy).astype(np.float64)
+    x, y = xy[:, 0], xy[:, 1]
+    x_next, y_next = np.roll(x, -1), np.roll(y, -1)
+    cross = x * y_next - x_next * y
+    area = cross.sum() / 2.
+    if abs(area) < 1e-12:
+        return xy.mean(axis=0)
+    return np.array([((x + x_next) * cross).sum(), ((y + y_next) * cross).sum()]) / (6. * area)
+
+
+def simplify_polygon(xy, epsilon=None, ratio=0.005):
+    '''
+    # Douglas-Peucker 단순화 (cv2.approxPolyDP)
+    # epsilon : 허용 오차 (픽셀), None 이면 둘레 * ratio (추론 결과 polygon 과 같은 기준)
+    '''
+    contour = to_array(xy).astype(np.float32).reshape(-1, 1, 2)
+    if epsilon is None:
+        epsilon = ratio * cv2.arcLength(contour, True)
+    return cv2.approxPolyDP(contour, epsilon, True).reshape(-1, 2).astype(np.float64)
+
+
+def _concat(polys):
+    # polygon 여러 개 -> 이어 붙인 점 배열, 각 polygon 시작 index
+    arrays = [to_array(poly) for poly in polys]
+    lengths = np.array([len(a) for a in arrays], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+    return np.concatenate(arrays) if arrays else np.zeros((0, 2)), starts, lengths
+
+
+def polygon_areas(polys):
+    '''
+    # 여러 polygon 의 면적 (M,) - 점을 모두 이어 붙여 한 번에 계산
+    '''
+    xy, starts, lengths = _concat(polys)
+    xy = xy.astype(np.float64)
+    if len(lengths) == 0:
+        return np.zeros(0)
+
+    # 각 점의 다음 점 index (polygon 마지막 점은 자기 polygon 의 첫 점으로)
+    next_index = np.arange(1, len(xy) + 1)
+    next_index[starts + lengths - 1] = starts
+    cross = xy[:, 0] * xy[next_index, 1] - xy[:, 1] * xy[next_index, 0]
+
+    return np.abs(0.5 * np.add.reduceat(cross, starts))
+
+
+def polygon_bboxes(polys):
+    '''
+    # 여러 polygon 의 bbox (M, 4) [x, y, w, h]
+    '''
+    xy, starts, lengths = _concat(polys)
+    if len(lengths) == 0:
+        return np.zeros((0, 4))
+
+    mins = np.minimum.reduceat(xy, starts, axis=0)
+    maxs = np.maximum.reduceat(xy, starts, axis=0)
+
+    return np.concatenate([mins, maxs - mins], axis=1)
+
+
+def _signed_area(xy):
+    x, y = xy[:, 0], xy[:, 1]
+    return 0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def _triangulate(xy):
+    # ear clipping : 단순 polygon -> 삼각형 list (볼록 조각으로 나눠서 clipping 에 사용)
+    if _signed_area(xy) < 0:
+        xy = xy[::-1]
+    index = list(range(len(xy)))
+    triangles = []
+
+    while len(index) > 3:
+        n = len(index)
+        for k in range(n):
+            i0, i1, i2 = index[k - 1], index[k], index[(k + 1) % n]
+            a, b, c = xy[i0], xy[i1], xy[i2]
+            if (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0]) <= 0:
+                continue
+            # 다른 꼭짓점이 삼각형 안에 있으면 ear 가 아님
+            others = xy[[i for i in index if i not in (i0, i1, i2)]]
+            d1 = (b[0] - a[0]) * (others[:, 1] - a[1]) - (b[1] - a[1]) * (others[:, 0] - a[0])
+            d2 = (c[0] - b[0]) * (others[:, 1] - b[1]) - (c[1] - b[1]) * (others[:, 0] - b[0])
+            d3 = (a[0] - c[0]) * (others[:, 1] - c[1]) - (a[1] - c[1]) * (others[:, 0] - c[0])
+            if np.any((d1 >= 0) & (d2 >= 0) & (d3 >= 0)):
+                continue
+            triangles.append(xy[[i0, i1, i2]])
+            del index[k]
+            break
+        else:
+            # 자기 교차 등으로 ear 를 못 찾으면 남은 점을 부채꼴로 나눈다
+            triangles += [xy[[index[0], index[j], index[j + 1]]] for j in range(1, len(index) - 1)]
+            return triangles
+
+    triangles.append(xy[index])
+    return triangles
+
+
+def _clip_convex(subject, clip):
+    # Sutherland-Hodgman : subject polygon 을 볼록 polygon(clip, 반시계 방향) 안쪽으로 자른다
+    output = subject
+    for k in range(len(clip)):
+        if len(output) == 0:
+            break
+        a, b = clip[k - 1], clip[k]
+        edge = b - a
+        side = edge[0] * (output[:, 1] - a[1]) - edge[1] * (output[:, 0] - a[0])
+        prev_side = np.roll(side, 1)
+        prev = np.roll(output, 1, axis=0)
+
+        points = []
+        for p, q, sp, sq in zip(prev, output, prev_side, side):
+            if sq >= 0:
+                if sp < 0:
+                    points.append(p + (q - p) * (sp / (sp - sq)))
+                points.append(q)
+            elif sp >= 0:
+                points.append(p + (q - p) * (sp / (sp - sq)))
+        output = np.array(points).reshape(-1, 2)
+
+    return output
+
+
+def intersection_area(poly_a, poly_b):
+    '''
+    # 두 단순 polygon 의 교집합 면적 (rasterization 없이)
+    # poly_b 를 볼록 삼각형으로 나눈 뒤 각 삼각형으로 poly_a 를 잘라서 면적 합
+    '''
+    a = to_array(poly_a).astype(np.float64)
+    b = to_array(poly_b).astype(np.float64)
+    if len(a) < 3 or len(b) < 3:
+        return 0.
+
+    # bbox 가 겹치지 않으면 0
+    if (a[:, 0].max() <= b[:, 0].min() or b[:, 0].max() <= a[:, 0].min() or
+            a[:, 1].max() <= b[:, 1].min() or b[:, 1].max() <= a[:, 1].min()):
+        return 0.
+
+    area = 0.
+    for triangle in _triangulate(b):
+        clipped = _clip_convex(a, triangle)
+        if len(clipped) >= 3:
+            area += abs(_signed_area(clipped))
+
+    return float(area)
+
+
+def polygon_iou(poly_a, poly_b):
+    inter = intersection_area(poly_a, poly_b)
+    union = polygon_area(poly_a) + polygon_area(poly_b) - inter
+    return inter / union if union > 0 else 0.
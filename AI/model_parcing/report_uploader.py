@@ -0,0 +1,242 @@
+# coding: utf-8
+import json
+import os
+import random
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# report_uploader 는 위반 신고(메타데이터 + 위반 영상 + 번호판 이미지)를 서버로 보내는 백그라운드 전송기입니다.
+# 신고는 먼저 SQLite 큐(파일)와 spool 폴더에 저장하고, 전송 thread 가 requests.Session(연결 재사용)으로
+# multipart 요청을 보냅니다. 서버가 느리거나 꺼져 있어도 녹화 / 검출은 멈추지 않고, 프로그램이 재시작되어도
+# 보내지 못한 신고는 큐에 남아 있다가 다시 전송됩니다.
+# - 신고마다 idempotency key(uuid) 를 만들어 Idempotency-Key 헤더로 보냄 (재전송 시 서버에서 중복 제거)
+# - 실패하면 지수 백오프(backoff_base * 2^시도 횟수, 최대 backoff_max 초, jitter) 후 재시도
+# - 5xx, 404, 408, 415, 429 (서버 장애 / 배포 중 / 엔드포인트 미준비) 도 같은 백오프로 재시도
+# - 그 밖의 4xx (400, 401, 403, 413 등) 는 다시 보내도 실패하므로 failed 상태로 남기고 눈에 띄게 출력,
+#   서버 쪽을 고친 뒤 requeue_failed() 로 다시 전송 대기열에 넣을 수 있음
+# - spool 폴더의 영상 / 번호판 파일은 서버가 2xx 로 받은 뒤에만 지움
+
+# multipart 구성
+#   metadata : JSON 문자열 (BE ReportDto 필드 - aiResult, gpsLatitude, gpsLongitude 등 + nowTime)
+#   clip     : 위반 영상 (video/webm)
+#   plate_0, plate_1, ... : 번호판 JPEG
+
+# 사용 예
+#   uploader = ReportUploader("http://localhost:8080/api/report", "./parsing/report_queue.db", "./parsing/spool")
+#   uploader.enqueue({"nowTime": "1700000000", "aiResult": "차선 침범"},
+#                    clip_path='./parsing/normal_cut.webm', plates=[jpeg_bytes])
+#   uploader.requeue_failed()        # failed 로 남은 신고 다시 전송
+#   uploader.close()
+
+STATUS_PENDING = 'pending'
+STATUS_FAILED = 'failed'
+
+# 재시도하는 4xx (그 밖의 4xx 는 failed)
+RETRY_4XX = (404, 408, 415, 429)
+
+
+class ReportQueue:
+    '''
+    SQLite 기반 신고 큐 (여러 thread 에서 호출 가능)
+    '''
+    def __init__(self, db_path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            " key TEXT PRIMARY KEY, metadata TEXT, files TEXT,"
+            " status TEXT, attempts INTEGER, next_try REAL, created REAL, last_error TEXT)")
+
+    def put(self, key, metadata, files):
+        # files : [(field, path, content_type), ...]
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO reports VALUES (?, ?, ?, ?, 0, ?, ?, NULL)",
+                (key, json.dumps(metadata), json.dumps(files), STATUS_PENDING, time.time(), time.time()))
+
+    def next_due(self, now):
+        # return : 지금 보낼 신고 1건 (key, metadata, files, attempts) 과 다음 신고까지 남은 시간
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT key, metadata, files, attempts, next_try FROM reports"
+                " WHERE status = ? ORDER BY next_try LIMIT 1", (STATUS_PENDING,)).fetchone()
+        if row is None:
+            return None, None
+        key, metadata, files, attempts, next_try = row
+        if next_try > now:
+            return None, next_try - now
+        return (key, json.loads(metadata), json.loads(files), attempts), 0.
+
+    def retry_later(self, key, attempts, next_try, error):
+        with self.lock:
+            self.conn.execute("UPDATE reports SET attempts = ?, next_try = ?, last_error = ? WHERE key = ?",
+                              (attempts, next_try, error, key))
+
+    def mark_failed(self, key, error):
+        with self.lock:
+            self.conn.execute("UPDATE reports SET status = ?, last_error = ? WHERE key = ?",
+                              (STATUS_FAILED, error, key))
+
+    def requeue_failed(self, now):
+        # failed 신고를 pending 으로 되돌림 (시도 횟수 초기화), return : 되돌린 개수
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE reports SET status = ?, attempts = 0, next_try = ? WHERE status = ?",
+                (STATUS_PENDING, now, STATUS_FAILED)).rowcount
+
+    def failed(self):
+        # return : failed 신고 [(key, last_error, attempts), ...]
+        with self.lock:
+            return self.conn.execute(
+                "SELECT key, last_error, attempts FROM reports WHERE status = ? ORDER BY created",
+                (STATUS_FAILED,)).fetchall()
+
+    def remove(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM reports WHERE key = ?", (key,))
+
+    def count(self, status=STATUS_PENDING):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM reports WHERE status = ?", (status,)).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class ReportUploader:
+    '''
+    신고 전송기 - enqueue() 는 파일 저장만 하고 바로 반환, 전송은 백그라운드 thread
+    \n timeout : (연결, 응답) 초, max_attempts : None 이면 성공할 때까지 재시도
+    '''
+    def __init__(self, url, db_path, spool_dir, timeout=(3., 10.),
+                 backoff_base=1., backoff_max=300., max_attempts=None):
+        self.url = url
+        self.spool_dir = spool_dir
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_attempts = max_attempts
+
+        os.makedirs(spool_dir, exist_ok=True)
+        self.queue = ReportQueue(db_path)
+        for key, error, attempts in self.queue.failed():
+            self._warn_failed(key, error, attempts)
+
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def enqueue(self, metadata, clip_path=None, plates=()):
+        '''
+        # 신고 1건 저장 (영상은 spool 폴더로 복사, 번호판은 JPEG bytes 를 파일로 저장)
+        # Output
+            # key : idempotency key
+        '''
+        key = uuid.uuid4().hex
+        report_dir = os.path.join(self.spool_dir, key)
+        os.makedirs(report_dir)
+
+        files = []
+        if clip_path is not None:
+            # 원본 영상 경로는 다음 위반 때 덮어쓰므로 복사
+            clip_copy = os.path.join(report_dir, os.path.basename(clip_path))
+            shutil.copyfile(clip_path, clip_copy)
+            files.append(('clip', clip_copy, 'video/webm'))
+        for i, plate in enumerate(plates):
+            plate_path = os.path.join(report_dir, f'plate_{i}.jpg')
+            with open(plate_path, 'wb') as f:
+                f.write(plate)
+            files.append((f'plate_{i}', plate_path, 'image/jpeg'))
+
+        self.queue.put(key, metadata, files)
+        self.wakeup.set()
+
+        return key
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+        return delay * random.uniform(0.5, 1.)
+
+    def _warn_failed(self, key, error, attempts):
+        print(f"[경고] 신고 전송 실패 - failed 상태로 보관 (key={key}, {attempts}회, {error}), "
+              f"파일 : {os.path.join(self.spool_dir, key)}, requeue_failed() 로 재전송")
+
+    def _send(self, key, metadata, files):
+        handles = []
+        try:
+            multipart = [('metadata', (None, json.dumps(metadata), 'application/json'))]
+            for field, path, content_type in files:
+                f = open(path, 'rb')
+                handles.append(f)
+                multipart.append((field, (os.path.basename(path), f, content_type)))
+
+            return self.session.post(self.url, files=multipart, headers={'Idempotency-Key': key},
+                                     timeout=self.timeout)
+        finally:
+            for f in handles:
+                f.close()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            report, wait = self.queue.next_due(time.time())
+            if report is None:
+                self.wakeup.wait(timeout=wait if wait is not None else 1.)
+                self.wakeup.clear()
+                continue
+
+            key, metadata, files, attempts = report
+            attempts += 1
+            try:
+                response = self._send(key, metadata, files)
+                status = response.status_code
+                error = f"HTTP {status}"
+            except (requests.RequestException, OSError) as err:
+                status = None
+                error = str(err)
+
+            if status is not None and 200 <= status < 300:
+                self.queue.remove(key)
+                shutil.rmtree(os.path.join(self.spool_dir, key), ignore_errors=True)
+                print("신고가 정상적으로 등록되었습니다.")
+            elif status is not None and 400 <= status < 500 and status not in RETRY_4XX:
+                self.queue.retry_later(key, attempts, time.time(), error)
+                self.queue.mark_failed(key, error)
+                self._warn_failed(key, error, attempts)
+            elif self.max_attempts is not None and attempts >= self.max_attempts:
+                self.queue.retry_later(key, attempts, time.time(), error)
+                self.queue.mark_failed(key, error)
+                self._warn_failed(key, error, attempts)
+            else:
+                delay = self._backoff(attempts)
+                self.queue.retry_later(key, attempts, time.time() + delay, error)
+                print(f"신고 전송 실패 ({attempts}회), {delay:.1f}초 후 재시도 : {error}")
+
+    def pending(self):
+        return self.queue.count(STATUS_PENDING)
+
+    def requeue_failed(self):
+        # failed 로 남은 신고를 다시 전송 대기열에 넣음, return : 되돌린 개수
+        count = self.queue.requeue_failed(time.time())
+        self.wakeup.set()
+        return count
+
+    def close(self, timeout=None):
+        # 보내지 못한 신고는 큐에 남아서 다음 실행 때 전송
+        self.stop_event.set()
+        self.wakeup.set()
+        self.thread.join(timeout)
+        self.session.close()
+        self.queue.close()
@@ -4,8 +4,8 @@
 # In[1]:
 
 
-import json
 import os
+import functools
 import torch
 import torchvision
 import mmcv
@@ -14,8 +14,8 @@ import re
 import mmdet
 import time
 import subprocess
-import requests
-import time
+import threading
+import queue
 
 os.environ["CUDA_VISIBLE_DEVICES"] = "3"
 
@@ -37,32 +37,31 @@ from constants import ImageInfo, ObjectInfo, VEHICLE_LIST, \
     VIOLATION_MAP, VLT_COLOR, DANGER_COLOR, NORMAL_COLOR
 from lane_detection.model import LaneSegModel
 from utils import viz_inference_result
+from mask_postprocess import extract_label_polygons
+from model_runtime import ModelRuntime, latency_report
+from clip_buffer import FrameRingBuffer, ClipWriter
+from plate_extractor import PlateExtractor
+from report_uploader import ReportUploader
+from frame_gate import FrameChangeGate
+
+from detector_preprocess import DetectorPreprocessor
+from nms_util import nms    # 저장소 최상위 common/ (detector_preprocess 가 sys.path 에 추가)
 
 device = torch.device('cuda:0') if torch.cuda.is_available() else torch.device('cpu')
 
 SCORE_TH = 0.5
-
-def inference(img_path, vehicle_model, lane_model, device):
-    if torch.cuda.is_available():
-        device = torch.device("cuda:0")  # GPU 0을 사용하도록 선택합니다.
-    else:
-        device = torch.device("cpu")
-        
-    image_info = ImageInfo(img_path, None)
-    obj_id = 0
-
-    input_img = Image.fromarray(img_path);
-    
-    '''
-    permute(2, 0, 1)을 사용하여 텐서의 차원 순서를 변경합니다. 
-    OpenCV에서 읽어온 이미지의 채널 순서는 (높이, 너비, 채널)이므로 PyTorch에서 사용하는 (채널, 높이, 너비) 순서로 변경합니다.
-    '''
-    img_tensor = transforms.functional.to_tensor(input_img).permute(2, 0, 1).unsqueeze(0).to(device)
-    
-    vehicle_model.to(device)
-    
-    bbox_result, segm_result = inference_detector(vehicle_model, img_path)
-
+NMS_TH = 0.7
+
+# 후처리(위반 판정, create_json) 기준 좌표계. 검출기 입력은 카메라 해상도에서 ROI / tile 로 자른 이미지
+# (detector_preprocess 참고, DETECT_TILES=(2, 1) 등으로 먼 차량 검출 해상도를 높일 수 있음)
+CANONICAL_SIZE = (1920, 1080)
+DETECT_ROI = (0., 0., 1., 1.)
+DETECT_SCALE = 1.0
+DETECT_TILES = (1, 1)
+detector_preprocessor = DetectorPreprocessor(CANONICAL_SIZE, roi=DETECT_ROI, scale=DETECT_SCALE, tiles=DETECT_TILES)
+
+def _vehicle_objects(bbox_result, segm_result, obj_id=0):
+    # mmdet 결과 1장 -> 차량 ObjectInfo list
     bboxes = np.vstack(bbox_result)
     labels = [
         np.full(bbox.shape[0], i, dtype=np.int32)
@@ -81,12 +80,15 @@ def inference(img_path, vehicle_model, lane_model, device):
         else:
             segms = np.stack(segms, axis=0)
 
+    # mmdet 은 class 별 NMS 만 하므로 같은 차량이 car/truck 등 여러 class 로 중복 검출될 수 있다
+    # 점수 통과한 박스끼리 class 구분 없이 한 번 더 NMS
+    valid = np.flatnonzero(bboxes[:, -1] >= SCORE_TH)
+    keep = valid[nms(bboxes[valid, :4], bboxes[valid, -1], iou_threshold=NMS_TH, box_format='xyxy')]
+
     object_list = []
-    for i in range(len(labels)):
+    for i in keep:
         bbox = bboxes[i][:4]
         score = bboxes[i][-1]
-        if score < SCORE_TH:
-            continue
         category = VEHICLE_LIST[labels[i]]
         segm = segms[i]
         if category == "vehicle_bike" and bbox[3] - bbox[1] < 100:
@@ -107,65 +109,166 @@ def inference(img_path, vehicle_model, lane_model, device):
                                       segm=segm))
         obj_id += 1
 
+    return object_list
 
-    image_info.objects = object_list
-    result_img = vehicle_model.show_result(img_path, (bbox_result, segm_result))
 
-    w, h = input_img.size
+def _lane_objects(label_map, out_size, obj_id=0):
+    # 차선 segmentation 결과 1장 (모델 해상도 label map) -> 차선 ObjectInfo list
+    # dilate / 면적 / contour 는 모델 해상도에서 계산하고 좌표만 out_size 로 scale (mask_postprocess 참고)
+    object_list = []
+    for label, bbox, points, segm in extract_label_polygons(label_map, out_size, min_area=1500):
+        category = LANE_LABEL_MAP_PREV[label]
+        obj_info = ObjectInfo(obj_id, "lane", category, 
+                              bbox, points, segm, 1.)
+        obj_id += 1
+        object_list.append(obj_info)
 
-    img_tensor = transforms.functional.to_tensor(
-            transforms.functional.resized_crop(
-                input_img, h - w // 2, 0, w // 2, w, (800, 1333)
-            )
-        )
-    
+    return object_list
 
-    img_tensor = img_tensor.to(device)
-    
-    lane_model.to(device)
-    
-    lane_out = torch.sigmoid(lane_model(img_tensor.unsqueeze(0))['out'])
-    final_out = torch.argmax(lane_out[0],0).view(1,1,800,1333).to(torch.float)
-    final_out = torch.nn.functional.interpolate(final_out, (1080,1920)).squeeze()
-    lane_mask = np.array(final_out.to("cpu"))
-    lane_mask = lane_mask.astype(np.uint8)
-    lane_mask = Image.fromarray(lane_mask, mode="L")
-    
-    kernel = np.ones((5, 5), np.uint8)
-    lane_mask = cv2.dilate(np.array(lane_mask), kernel, iterations=3)
 
-    for label in np.unique(lane_mask):
-        if label == 0:
-            continue
-        segm = np.where(np.array(lane_mask) == label, True, False)
-        if np.sum(segm) < 1500:
-            continue
+@torch.no_grad()
+def inference_batch(frames, vehicle_model, lane_model, device):
+    '''
+    여러 프레임을 한 번에 차량 검출(vehicle_model) / 차선 분할(lane_model)
+    \n frames : 카메라 해상도 BGR 프레임 list (1920x1080 으로 키우지 않음)
+    \n return : 프레임별 ImageInfo list (bbox / poly / segm 은 CANONICAL_SIZE 좌표계)
+    '''
+    # 프레임마다 ROI / tile 로 자른 뒤 모든 tile 을 한 번에 batch 추론 (vehicle_model : ModelRuntime, call_fn)
+    prepared = [detector_preprocessor.prepare(frame) for frame in frames]
+    tile_results = vehicle_model([tile for tiles, _ in prepared for tile in tiles])
+
+    vehicle_results = []
+    start = 0
+    for frame, (tiles, windows) in zip(frames, prepared):
+        vehicle_results.append(detector_preprocessor.merge(frame.shape, windows, tile_results[start:start + len(tiles)]))
+        start += len(tiles)
+
+    lane_inputs = []
+    for frame in frames:
+        input_img = Image.fromarray(frame)
+        w, h = input_img.size
+        lane_inputs.append(transforms.functional.to_tensor(
+                transforms.functional.resized_crop(
+                    input_img, h - w // 2, 0, w // 2, w, (800, 1333)
+                )
+            ))
+
+    # sigmoid 는 순서를 바꾸지 않으므로 argmax 만 device 에서 계산하고,
+    # 1920x1080 float 대신 모델 해상도 uint8 label map 만 CPU 로 복사
+    lane_out = lane_model(torch.stack(lane_inputs))
+    label_maps = torch.argmax(lane_out, 1).to(torch.uint8).to("cpu").numpy()
+
+    image_infos = []
+    for frame, (bbox_result, segm_result), label_map in zip(frames, vehicle_results, label_maps):
+        image_info = ImageInfo(frame, None)
+        image_info.objects = _vehicle_objects(bbox_result, segm_result)
+        image_info.objects += _lane_objects(label_map, CANONICAL_SIZE, obj_id=len(image_info.objects))
+        image_infos.append(image_info)
+
+    return image_infos
 
 
-        category = LANE_LABEL_MAP_PREV[label]
-        c, _ = cv2.findContours(segm.astype(np.uint8), cv2.RETR_LIST, 
-                                cv2.CHAIN_APPROX_SIMPLE)
-        bbox = cv2.boundingRect(c[0])
-        bbox = (bbox[0], bbox[1], bbox[0] + bbox[2], bbox[1] + bbox[3])
-        approx_poly = cv2.approxPolyDP(c[0], 0.005 * cv2.arcLength(c[0], True), 
-                                       True)
-        points = approx_poly.squeeze(1).reshape(-1).astype(float)
-        obj_info = ObjectInfo(obj_id, "lane", category, 
-                              np.array(bbox), points, segm, 1.)
-        obj_id += 1
-        image_info.objects.append(obj_info)
+def inference(img_path, vehicle_model, lane_model, device):
+    return inference_batch([img_path], vehicle_model, lane_model, device)[0]
+
+
+@functools.lru_cache(maxsize=8)
+def _nearest_index(src_len, dst_len):
+    # PIL NEAREST resize 와 같은 샘플링 위치
+    # (PIL 의 좌표 반올림을 그대로 쓰기 위해 index 이미지를 PIL 로 resize)
+    index_img = Image.fromarray(np.arange(src_len, dtype=np.int32)[None, :])
+    return np.array(index_img.resize((dst_len, 1), Image.NEAREST))[0]
+
 
-    return image_info
+def _downsample_masks(objs, new_size):
+    # 원본 해상도 segm (N, H, W) -> NEW_SIZE 로 nearest 샘플링한 bool mask (N, h, w)
+    if len(objs) == 0:
+        return np.zeros((0, new_size[1], new_size[0]), dtype=bool)
 
+    src_h, src_w = objs[0].segm.shape[:2]
+    ys = _nearest_index(src_h, new_size[1])
+    xs = _nearest_index(src_w, new_size[0])
 
+    return np.stack([obj.segm[np.ix_(ys, xs)] for obj in objs]).astype(bool)
+
+
+def compose_violation_inputs(car_list, lane_list, new_size=NEW_SIZE):
+    '''
+    차량별 위반 분류기 입력 이미지와 차량-차선 매칭 계산 (NEW_SIZE 해상도에서 한 번에)
+    \n 원본 해상도에서 색칠 후 NEAREST resize 한 결과와 같은 값
+    \n return : inputs (C, h, w, 3) float32 [0, 1], matches [[car_id, lane_id] or []] * C
+    '''
+    car_masks = _downsample_masks(car_list, new_size)
+    lane_masks = _downsample_masks(lane_list, new_size)
+    C, L = len(car_list), len(lane_list)
+
+    car_colors = np.array([VEHICLE_COLOR_MAP[car.category] for car in car_list], dtype=np.uint8).reshape(C, 3)
+    lane_colors = np.array([LANE_COLOR_MAP_MODEL[lane.category] for lane in lane_list], dtype=np.uint8).reshape(L, 3)
+
+    # 겹침 판정은 색이 칠해진 픽셀 기준 (검정색 class 는 mask 에서 제외 - 기존 _get_arr_mask 와 동일)
+    car_hit = car_masks & car_colors.any(axis=1)[:, None, None]
+    lane_hit = lane_masks & lane_colors.any(axis=1)[:, None, None]
+
+    # 차량 x 차선 겹치는 픽셀 수 (C, L) - 행렬곱 1번
+    n_pixel = new_size[0] * new_size[1]
+    inter_counts = car_hit.reshape(C, n_pixel).astype(np.float32).dot(
+        lane_hit.reshape(L, n_pixel).astype(np.float32).T)
+
+    matches = []
+    for c in range(C):
+        # 겹침이 10 픽셀 초과인 차선 중 마지막 차선과 매칭
+        matched = np.flatnonzero(inter_counts[c] > 10)
+        matches.append([car_list[c].obj_id, lane_list[matched[-1]].obj_id] if len(matched) > 0 else [])
+
+    if L == 0:
+        # 차선이 없으면 합성 이미지는 검정 (기존 PIL 합성 결과와 동일)
+        return np.zeros((C, new_size[1], new_size[0], 3), dtype=np.float32), matches
+
+    # 픽셀마다 가장 나중에 칠해지는 차선 index
+    painted = lane_masks.any(axis=0)
+    last_lane = (L - 1) - np.argmax(lane_masks[::-1], axis=0)
+    if lane_colors.any(axis=1).all():
+        hit_any, last_hit = painted, last_lane
+    else:
+        hit_any = lane_hit.any(axis=0)
+        last_hit = (L - 1) - np.argmax(lane_hit[::-1], axis=0)
+
+    # palette index : 0 검정, 1 차량, 2 ~ L+1 차선 색, L+2 ~ 2L+1 차량-차선 교차 색
+    # (차량 -> 차선 순서로 칠한 뒤 교차 영역을 덮어쓰던 순서와 같은 우선순위)
+    index_map = np.where(painted, last_lane + 2, 0)[None].repeat(C, axis=0)
+    index_map[car_masks & ~painted] = 1
+    car_on_lane = car_hit & hit_any
+    index_map[car_on_lane] = np.broadcast_to(last_hit + L + 2, car_masks.shape)[car_on_lane]
+
+    palettes = np.zeros((C, 2 * L + 2, 3), dtype=np.uint8)
+    palettes[:, 1] = car_colors
+    palettes[:, 2:L + 2] = lane_colors
+    for c, car in enumerate(car_list):
+        car_ctg = car.category
+        for l, lane in enumerate(lane_list):
+            if lane.category in VIOLATION_MAP[car_ctg]:
+                palettes[c, L + 2 + l] = VLT_COLOR
+            elif lane.category in VIOLATION_MAP["danger"]:
+                palettes[c, L + 2 + l] = DANGER_COLOR
+            else:
+                palettes[c, L + 2 + l] = NORMAL_COLOR
+
+    inputs = palettes[np.arange(C)[:, None, None], index_map].astype(np.float32)
+    inputs /= 255.
+
+    return inputs, matches
+
+
+VIOLATION_TRANSFORMS = torch.nn.Sequential(
+        transforms.Resize(224),
+        transforms.Normalize(
+                    [0.0181, 0.0304, 0.0147], [0.1199, 0.1648, 0.1065]
+                ),
+    )
+
+
+@torch.no_grad()
 def detect_violation(object_info, violation_model, device):
-    def _get_arr_mask(pil_img, new_size):
-        result_arr = np.array(pil_img.copy().resize(new_size, Image.NEAREST))
-        result_arr = np.mean(result_arr, axis=2)
-        result_arr = np.where(result_arr > 0, True, False)
-        
-        return result_arr
-    
     lane_list = []
     car_list = []
     result_list = []
@@ -176,60 +279,14 @@ def detect_violation(object_info, violation_model, device):
         else:
             lane_list.append(obj)
             result_list.append(obj)
-    
-    img_size = (1920, 1080)
-    
-    car_arr_list = []
-    for car in car_list:
-        car_ctg = car.category
-        result_img = Image.new("RGB", img_size)
-        result_img_arr = np.array(result_img)
-        result_img_arr[car.segm, :] = VEHICLE_COLOR_MAP[car_ctg]
-        car_arr_mask = _get_arr_mask(Image.fromarray(result_img_arr), NEW_SIZE)
-        intersections = []
-        match = []
-        for lane in lane_list:
-            lane_ctg = lane.category
-            result_img_arr[lane.segm] = LANE_COLOR_MAP_MODEL[lane.category]
-            result_img = Image.fromarray(result_img_arr)
-            blank_img = Image.new("RGB", img_size)
-            blank_img_arr = np.array(blank_img)
-            blank_img_arr[lane.segm] = LANE_COLOR_MAP_MODEL[lane.category]
-            lane_arr_mask = _get_arr_mask(Image.fromarray(blank_img_arr), 
-                                         NEW_SIZE)
-            if np.sum(car_arr_mask & lane_arr_mask) > 10:
-                match = [car.obj_id, lane.obj_id]
-            
-            if lane_ctg in VIOLATION_MAP[car_ctg]:
-                color = VLT_COLOR
-            elif lane_ctg in VIOLATION_MAP["danger"]:
-                color = DANGER_COLOR
-            else:
-                color = NORMAL_COLOR
-            intersections.append((color, 
-                                  car_arr_mask & lane_arr_mask, 
-                                  match))
-        result_img_arr = np.array(result_img.resize(NEW_SIZE, Image.NEAREST))
-        for inter in intersections:
-            result_img_arr[inter[1], :] = inter[0]
-        result_img_arr = result_img_arr.astype(np.float32)
-        result_img_arr /= 255.
-        car_arr_list.append((result_img_arr, match))
-
-    if len(car_arr_list) == 0:
+
+    if len(car_list) == 0:
         return result_list
-    car_arr_list = np.array(car_arr_list, dtype=object)
-    input_image = np.stack(
-        car_arr_list[:, 0]).transpose(0, 3, 1, 2)
-    input_image = torch.from_numpy(input_image).type(torch.float32)
-    data_transforms = torch.nn.Sequential(
-            transforms.Resize(224),
-            transforms.Normalize(
-                        [0.0181, 0.0304, 0.0147], [0.1199, 0.1648, 0.1065]
-                    ),
-        )
-    img_tensor = data_transforms(input_image)
-    img_tensor = img_tensor.to(device)
+
+    inputs, matches = compose_violation_inputs(car_list, lane_list)
+
+    input_image = torch.from_numpy(inputs).permute(0, 3, 1, 2)
+    img_tensor = VIOLATION_TRANSFORMS(input_image)
     outputs = violation_model(img_tensor)
     _, preds = torch.max(outputs, 1)
     preds = np.array(preds.to("cpu"))
@@ -238,7 +295,7 @@ def detect_violation(object_info, violation_model, device):
         car_idx = np.where(preds == 2)[0][0]
         vlt_car = car_list[car_idx]
         vlt_car.label = "violation"
-        match = car_arr_list[car_idx][-1]
+        match = matches[car_idx]
         if len(match) > 0: 
             lane_obj_id = match[-1]
             new_list = [vlt_car]
@@ -252,7 +309,7 @@ def detect_violation(object_info, violation_model, device):
         car_idx = np.where(preds == 0)[0][0]
         vlt_car = car_list[car_idx]
         vlt_car.label = "danger"
-        match = car_arr_list[car_idx][-1]
+        match = matches[car_idx]
         if len(match) > 0: 
             lane_obj_id = match[-1]
             new_list = [vlt_car]
@@ -272,69 +329,7 @@ def detect_violation(object_info, violation_model, device):
 # # Config 파일 지정 및 학습된 모델 경로 지정
 output_filename = './parsing/normal_cut.webm'
 
-def parsing():
-    global new_fps, main_web_mp4, output_filename
-
-    vidcap = cv2.VideoCapture(main_web_mp4)    
-    total_frames = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-    cut_duration_seconds = 10
-    cut_frame_count = new_fps * cut_duration_seconds
-
-    output_fourcc = cv2.VideoWriter_fourcc('v','p', '8', '0')  # 저장할 동영상 코덱 설정
-    
-    parcing_out = cv2.VideoWriter(output_filename, output_fourcc, new_fps, (int(vidcap.get(3)), int(vidcap.get(4))))
-
-    for i in range(total_frames):
-        ret, frame = vidcap.read()
-        if not ret:
-            break
-        if i >= total_frames - cut_frame_count:
-            parcing_out.write(frame)
-
-    vidcap.release()
-    parcing_out.release()
-
-def make_plate(resized_frame, poly):
-
-    # poly 배열을 사용하여 mask 생성
-    mask = np.zeros_like(resized_frame)
-    cv2.fillPoly(mask, [poly.astype(np.int32).reshape(-1, 2)], (255, 255, 255))
-
-    # mask를 사용하여 bbox 부분 자르기
-    cropped_image = cv2.bitwise_and(resized_frame, mask)
-
-    # 저장할 경로 및 파일 이름 설정
-    save_path = 'cropped_image.jpg'
-
-    # 이미지 저장
-    cv2.imwrite(save_path, cropped_image)
-    # print(f'이미지 저장 완료: {save_path}')
-    # 이미지 파일 경로
-    image_path = 'cropped_image.jpg'
-
-    # 이미지 파일 로드
-    image = cv2.imread(image_path)
-
-    # 이미지를 흑백으로 변환
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-    # 번호판 검출을 위해 Haar Cascade 분류기 사용
-    plate_cascade = cv2.CascadeClassifier(cv2.data.haarcascades +'haarcascade_russian_plate_number.xml')
-
-    # 번호판 검출
-    plates = plate_cascade.detectMultiScale(gray_image)
-
-    for i, (x, y, w, h) in enumerate(plates):
-        # 번호판 영역 자르기
-        plate_roi = image[y:y+h, x:x+w]
-        
-        # 번호판 이미지 저장
-        plate_image_path = os.path.join('./', f'plate_{i}.jpg')
-        cv2.imwrite(plate_image_path, plate_roi)
-
 path = '/home/ssafy01/nia-82-134-main'
-main_web_mp4 = './parsing/webcam_out.mp4'
 
 vehicle_cfg_path = f'{path}/configs/vehicle_detection_config.py'
 vehicle_ckpt_path = f"{path}/best_models/vehicle_detection_model.pth"
@@ -346,22 +341,46 @@ violation_ckpt_path = f"{path}/best_models/vlt_cls_model.pth"
 vehicle_model = init_detector(vehicle_cfg_path, vehicle_ckpt_path, device=device)
 
 lane_model = LaneSegModel(num_classes=13)
-lane_model_ckpt = torch.load(lane_ckpt_path, map_location=device)
+lane_model_ckpt = torch.load(lane_ckpt_path, map_location='cpu')
 new_state_dict = OrderedDict()
 for n, v in lane_model_ckpt["state_dict"].items():
     new_name = n.replace("module.", "")
     new_state_dict[new_name] = v
 lane_model.load_state_dict(new_state_dict)
-lane_model.to(device)
-lane_model.eval()
 
 violation_model = models.resnet18(pretrained=False)
 num_ftrs = violation_model.fc.in_features
 violation_model.fc = nn.Linear(num_ftrs, 3)
-violation_model_ckpt = torch.load(violation_ckpt_path, map_location=device)
+violation_model_ckpt = torch.load(violation_ckpt_path, map_location='cpu')
 violation_model.load_state_dict(violation_model_ckpt["state_dict"])
-violation_model.to(device)
-violation_model.eval()
+
+# 모델 실행 방식 (model_runtime 참고)
+# CPU : 차선 / 위반 분류 모델은 TorchScript(freeze) + channels_last, 변환 결과는 RUNTIME_CACHE 에 저장해서 재사용
+# 위반 분류기는 fc 만 int8 dynamic quantization 대상이라 효과가 작아 fp32 유지 (bf16 은 AMX 지원 CPU 에서 'bf16')
+RUNTIME_CACHE = f"{path}/runtime_cache"
+RUNTIME_BACKEND = 'eager' if device.type == 'cuda' else 'torchscript'
+LANE_PRECISION = 'fp32'
+VIOLATION_PRECISION = 'fp32'
+WARMUP_ITER = 3
+
+vehicle_model = ModelRuntime('vehicle', vehicle_model, device=device,
+                             example_input=[np.zeros((720, 1280, 3), np.uint8)],
+                             call_fn=lambda model, frames: inference_detector(model, list(frames)))
+lane_model = ModelRuntime('lane', lane_model, device=device,
+                          example_input=torch.zeros(1, 3, 800, 1333), output_key='out',
+                          backend=RUNTIME_BACKEND, precision=LANE_PRECISION,
+                          channels_last=device.type == 'cpu', export_dir=RUNTIME_CACHE)
+violation_model = ModelRuntime('violation', violation_model, device=device,
+                               example_input=torch.zeros(1, 3, 224, 224),
+                               backend=RUNTIME_BACKEND, precision=VIOLATION_PRECISION,
+                               channels_last=device.type == 'cpu', export_dir=RUNTIME_CACHE)
+
+# 번호판 검출기 (cascade 는 한 번만 로드, 결과는 파일 대신 JPEG bytes 로 신고에 포함)
+plate_extractor = PlateExtractor()
+
+# 첫 프레임 지연을 없애기 위해 시작할 때 warm-up (통계에서는 제외)
+for runtime in (vehicle_model, lane_model, violation_model):
+    runtime.warmup(WARMUP_ITER)
 
 new_fps = 30
 
@@ -373,8 +392,21 @@ new_fps = 30
 
 #차선위반
 webcam = cv2.VideoCapture("/home/ssafy01/nia-82-134-main/영상/차선 위반 편집.mp4")
-fourcc = cv2.VideoWriter_fourcc('m','p','4','v')
-webcam_out = cv2.VideoWriter(main_web_mp4, fourcc, new_fps, (1280, 720))
+# 위반 영상은 녹화 파일을 다시 읽지 않고 최근 CUT_DURATION 초 프레임을 메모리에 보관했다가 저장 (clip_buffer 참고)
+CUT_DURATION = 10
+clip_ring = FrameRingBuffer(seconds=CUT_DURATION, fps=new_fps)
+clip_writer = ClipWriter(fourcc='vp80')
+
+if not os.path.isdir('./parsing'):
+        os.mkdir('./parsing')
+
+# 신고 전송 (SQLite 큐 + 백그라운드 전송, 실패 시 재시도, report_uploader 참고)
+# BE POST /api/report (multipart) 로 ReportDto 메타데이터 + 위반 영상 + 번호판 이미지를 보낸다
+# GPS 수신기가 없으므로 카메라 설치 위치를 REPORT_GPS="위도,경도" 로 지정
+REPORT_URL = os.environ.get("REPORT_URL", "http://localhost:8080/api/report")
+REPORT_GPS = tuple(float(v) for v in os.environ.get("REPORT_GPS", "37.5013,127.0397").split(","))
+REPORT_AI_RESULT = "차선 침범"
+report_uploader = ReportUploader(REPORT_URL, './parsing/report_queue.db', './parsing/spool')
 
 if not webcam.isOpened():
     print("Could not open webcam")
@@ -385,85 +417,212 @@ webcam.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
 webcam.set(cv2.CAP_PROP_FPS, new_fps)
 
 frame_interval = 30
-frame_count = 0
-violation_frame = 0
-violation_flag = False
-
-wait_frame = 0
-wait_flag = True
 
+# 추론할 프레임 선택 : 장면 변화량 + 차량 유무에 따라 간격 조정 (frame_gate 참고)
+frame_gate = FrameChangeGate(min_interval=frame_interval // 3, base_interval=frame_interval,
+                             max_interval=frame_interval * 3)
 
 time_interval = 5
 
+# 캡처 / 추론 / 녹화를 thread 로 분리
+# - capture thread : webcam.read() 만 하고 프레임을 녹화 큐, 화면 큐, (frame_gate 가 고른 프레임은) 추론 큐에 넣는다
+# - inference worker : 추론 큐에서 최대 INFER_BATCH 장을 모아 vehicle_model / lane_model 에 batch 로 추론
+# - writer thread : 모든 프레임을 순서대로 clip_ring 에 보관하고, 위반 알림을 받아 영상 저장 / 신고를 ClipWriter 에 요청
+# - main thread : 화면 출력 (cv2.imshow 는 main thread 에서만 동작)
+# 추론 큐와 화면 큐는 가득 차면 가장 오래된 프레임을 버리고, 녹화 큐는 버리지 않고 기다린다
+INFER_BATCH = 4
+INFER_WORKERS = 1
+INFER_QUEUE_SIZE = 2 * INFER_BATCH
+LATENCY_REPORT_SEC = 30
+WRITE_QUEUE_SIZE = new_fps * 10
+
+write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+infer_queue = queue.Queue(maxsize=INFER_QUEUE_SIZE)
+display_queue = queue.Queue(maxsize=1)
+violation_queue = queue.Queue()
+stop_event = threading.Event()
+
+# 위반 녹화 상태 (writer thread 가 갱신, capture thread 가 추론 여부 판단에 사용)
+violation_flag = False
+wait_flag = True
 now = time.time()
+infer_dropped = 0
 
-print(os.getcwd())
 
-if not os.path.isdir('./parsing'):
-        os.mkdir('./parsing')
+def put_drop_oldest(q, item):
+    # 큐가 가득 차면 가장 오래된 항목을 버리고 넣는다, 버린 개수 반환
+    dropped = 0
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+
+
+def capture_loop():
+    global infer_dropped
+
+    frame_count = 0
+    while webcam.isOpened() and not stop_event.is_set():
+        status, frame = webcam.read()
 
-while webcam.isOpened():
-    status, frame = webcam.read()
-
-    if not status:
-        break
-
-    if violation_flag:
-        violation_frame += 1
-        if violation_frame >= new_fps * 5:
-            violation_flag = False
-            
-            webcam_out.release()
-
-            parsing()
-            data = {"nowTime": f"{str(int(now))}"}
-            headers = {'Content-Type': 'application/json'}
-            response = requests.post("http://localhost:8080/api/hi", headers=headers, data=json.dumps(data))
-            if response.status_code == 200:
-                print("신고가 정상적으로 등록되었습니다.")
-            wait_flag = True
-            wait_frame = 0
-
-            webcam_out = cv2.VideoWriter('./parsing/webcam_out.mp4', fourcc, 10, (1280, 720))
-    elif wait_flag:
-         wait_frame += 1
-         if wait_frame >= new_fps * 5:
-             wait_flag = False
-        
-    else :
-
-        if frame_count % frame_interval == 0:
-            
+        if not status:
+            break
+
+        # 녹화는 프레임을 버리지 않는다 (큐가 가득 차면 writer 가 따라올 때까지 대기)
+        write_queue.put(frame)
+        put_drop_oldest(display_queue, frame)
+
+        if not violation_flag and not wait_flag and frame_gate.should_infer(frame):
             if not os.path.exists(output_filename):
+                infer_dropped += put_drop_oldest(infer_queue, frame)
+
+        frame_count += 1
 
-                resized_frame = cv2.resize(frame, (1920, 1080))
+    stop_event.set()
+    write_queue.put(None)
+    for _ in range(INFER_WORKERS):
+        put_drop_oldest(infer_queue, None)
 
-                image_info = inference(resized_frame, vehicle_model, lane_model, device)
 
-                result_list = detect_violation(image_info.objects, violation_model, device)
-                if result_list:
-                    labels = [obj.label for obj in result_list]
-                    if "violation" in labels:
-                        print("위반 사항이 감지되었습니다.")
-                        now = time.time()
+def inference_worker():
+    last_report = time.time()
+    while True:
+        frame = infer_queue.get()
+        if frame is None:
+            break
+
+        # 밀려 있는 프레임을 최대 INFER_BATCH 장까지 모아서 한 번에 추론
+        frames = [frame]
+        stop = False
+        while len(frames) < INFER_BATCH:
+            try:
+                frame = infer_queue.get_nowait()
+            except queue.Empty:
+                break
+            if frame is None:
+                stop = True
+                break
+            frames.append(frame)
+
+        image_infos = inference_batch(frames, vehicle_model, lane_model, device)
+        frame_gate.report(sum(obj.obj_type == "vehicle" for obj in image_infos[-1].objects))
+
+        for frame, image_info in zip(frames, image_infos):
+            result_list = detect_violation(image_info.objects, violation_model, device)
+            if result_list:
+                labels = [obj.label for obj in result_list]
+                if "violation" in labels:
+                    print("위반 사항이 감지되었습니다.")
+
+                    vehicle_polygons = [obj.poly for obj in image_info.objects if obj.obj_type == 'vehicle']
+                    vehicle_poly = detector_preprocessor.canonical_to_frame(vehicle_polygons[0], frame.shape)
+                    plates = plate_extractor.extract(frame, vehicle_poly, encode=True)
+
+                    violation_queue.put((time.time(), [plate for _, plate in plates]))
+                    break
+                else:
+                    print("위반 사항이 감지되지 않았습니다.")
+
+        # 모델별 지연 시간 (warm-up 제외 누적)
+        if time.time() - last_report > LATENCY_REPORT_SEC:
+            print(latency_report())
+            print("frame gate:", frame_gate.stats())
+            last_report = time.time()
+
+        if stop:
+            break
 
-                        vehicle_polygons = [obj.poly for obj in image_info.objects if obj.obj_type == 'vehicle']
-                        make_plate(resized_frame, vehicle_polygons[0])
 
-                        violation_frame = 0
-                        violation_flag = True
-                    else:
-                        print("위반 사항이 감지되지 않았습니다.")
+def report_violation(detected_time, plates, clip_path):
+    # 위반 영상 저장이 끝난 뒤 ClipWriter thread 에서 호출
+    # 신고 큐에 저장만 하고 전송은 ReportUploader thread 가 처리 (서버가 느리거나 꺼져 있어도 대기하지 않음)
+    metadata = {
+        "nowTime": f"{str(int(detected_time))}",
+        "aiResult": REPORT_AI_RESULT,
+        "gpsLatitude": REPORT_GPS[0],
+        "gpsLongitude": REPORT_GPS[1],
+    }
+    report_uploader.enqueue(metadata, clip_path=clip_path, plates=plates)
+
+
+def writer_loop():
+    global violation_flag, wait_flag, now
+
+    violation_frame = 0
+    wait_frame = 0
+    violation_plates = []
+
+    while True:
+        frame = write_queue.get()
+        if frame is None:
+            break
+
+        # 추론 worker 의 위반 알림 처리 (녹화 중인 프레임 기준으로 5초 더 녹화)
+        try:
+            detected_time, plates = violation_queue.get_nowait()
+            if not violation_flag and not wait_flag:
+                now = detected_time
+                violation_plates = plates
+                violation_frame = 0
+                violation_flag = True
+        except queue.Empty:
+            pass
+
+        if violation_flag:
+            violation_frame += 1
+            if violation_frame >= new_fps * 5:
+                violation_flag = False
+
+                # 최근 CUT_DURATION 초 프레임으로 위반 영상 저장 + 신고 (백그라운드, 녹화는 계속)
+                # 저장 중에 다음 위반 알림이 와도 이번 신고의 시각 / 번호판이 바뀌지 않도록 기본 인자로 고정
+                clip_writer.submit(clip_ring.snapshot(), output_filename, new_fps,
+                                   on_done=lambda path, t=now, p=violation_plates: report_violation(t, p, path))
+                wait_flag = True
+                wait_frame = 0
+        elif wait_flag:
+            wait_frame += 1
+            if wait_frame >= new_fps * 5:
+                wait_flag = False
+
+        resize_frame = cv2.resize(frame, (1280, 720))
+        clip_ring.push(resize_frame)
+
+
+print(os.getcwd())
+
+threads = [threading.Thread(target=capture_loop, daemon=True),
+           threading.Thread(target=writer_loop)]
+threads += [threading.Thread(target=inference_worker, daemon=True) for _ in range(INFER_WORKERS)]
+for thread in threads:
+    thread.start()
+
+while not stop_event.is_set():
+    try:
+        frame = display_queue.get(timeout=0.1)
+    except queue.Empty:
+        continue
 
-    resize_frame = cv2.resize(frame, (1280, 720))
-    webcam_out.write(resize_frame)
     resize_frame2 = cv2.resize(frame, (1024, 768))
     cv2.imshow("test", resize_frame2 )
 
     if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-    frame_count += 1
+        stop_event.set()
+
+# 녹화 큐에 남은 프레임까지 기록한 뒤 종료
+for thread in threads:
+    thread.join()
+
+print("추론 큐에서 버린 프레임 수:", infer_dropped)
+print(latency_report())
+print("frame gate:", frame_gate.stats())
 
 webcam.release()
-webcam_out.release()
+clip_writer.close()
+report_uploader.close()
 cv2.destroyAllWindows()
@@ -0,0 +1,159 @@
+# coding: utf-8
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from report_uploader import ReportUploader, STATUS_FAILED, STATUS_PENDING
+
+# report_uploader 테스트 - 응답 코드를 차례로 돌려주는 로컬 stub HTTP 서버로 전송 / 재시도 / failed 상태를 확인합니다.
+
+# 사용 예
+#   cd AI/model_parcing && python -m pytest -q test_report_uploader.py
+#   cd AI/model_parcing && python -m unittest test_report_uploader
+
+
+class StubServer:
+    '''
+    POST 를 받을 때마다 codes 의 응답 코드를 차례로 돌려주고 (다 쓰면 200), 받은 요청을 requests 에 기록
+    '''
+    def __init__(self, codes=()):
+        self.codes = list(codes)
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                # multipart body -> {field: (filename, bytes)}
+                message = BytesParser(policy=policy.default).parsebytes(
+                    b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + body)
+                parts = {part.get_param('name', header='content-disposition'):
+                         (part.get_filename(), part.get_payload(decode=True)) for part in message.iter_parts()}
+                stub.requests.append((self.headers['Idempotency-Key'], parts))
+
+                self.send_response(stub.codes.pop(0) if stub.codes else 200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/api/report'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def wait_until(condition, timeout=5.):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class ReportUploaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp, 'report_queue.db')
+        self.spool_dir = os.path.join(self.tmp, 'spool')
+        self.clip_path = os.path.join(self.tmp, 'normal_cut.webm')
+        with open(self.clip_path, 'wb') as f:
+            f.write(b'webm')
+        self.servers = []
+        self.uploaders = []
+
+    def tearDown(self):
+        for uploader in self.uploaders:
+            uploader.close(timeout=5.)
+        for server in self.servers:
+            server.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _server(self, codes=()):
+        server = StubServer(codes)
+        self.servers.append(server)
+        return server
+
+    def _uploader(self, url):
+        uploader = ReportUploader(url, self.db_path, self.spool_dir, timeout=(1., 2.),
+                                  backoff_base=0.01, backoff_max=0.05)
+        self.uploaders.append(uploader)
+        return uploader
+
+    def test_multipart_upload(self):
+        server = self._server()
+        uploader = self._uploader(server.url)
+        key = uploader.enqueue({"nowTime": "1", "aiResult": "차선 침범"}, clip_path=self.clip_path,
+                               plates=[b'jpeg0', b'jpeg1'])
+
+        self.assertTrue(wait_until(lambda: uploader.pending() == 0 and server.requests))
+        sent_key, parts = server.requests[0]
+        self.assertEqual(sent_key, key)
+        self.assertEqual(json.loads(parts['metadata'][1]), {"nowTime": "1", "aiResult": "차선 침범"})
+        self.assertEqual(parts['clip'], ('normal_cut.webm', b'webm'))
+        self.assertEqual(parts['plate_0'], ('plate_0.jpg', b'jpeg0'))
+        self.assertEqual(parts['plate_1'], ('plate_1.jpg', b'jpeg1'))
+        # 전송이 끝난 신고의 spool 파일은 삭제
+        self.assertTrue(wait_until(lambda: not os.path.exists(os.path.join(self.spool_dir, key))))
+
+    def test_retry_with_same_idempotency_key(self):
+        # 서버 장애 / 엔드포인트 미준비 응답은 재시도
+        server = self._server([503, 404, 415, 429])
+        uploader = self._uploader(server.url)
+        key = uploader.enqueue({"nowTime": "1"}, clip_path=self.clip_path)
+
+        self.assertTrue(wait_until(lambda: len(server.requests) == 5 and uploader.pending() == 0))
+        self.assertEqual({sent_key for sent_key, _ in server.requests}, {key})
+        self.assertEqual(uploader.queue.count(STATUS_FAILED), 0)
+
+    def test_client_error_is_failed_and_requeued(self):
+        server = self._server([400])
+        uploader = self._uploader(server.url)
+        key = uploader.enqueue({"nowTime": "1"}, clip_path=self.clip_path)
+
+        self.assertTrue(wait_until(lambda: uploader.queue.count(STATUS_FAILED) == 1))
+        self.assertEqual(uploader.pending(), 0)
+        self.assertEqual(len(server.requests), 1)
+        # failed 신고의 파일은 남겨둔다
+        self.assertTrue(os.path.exists(os.path.join(self.spool_dir, key, 'normal_cut.webm')))
+
+        self.assertEqual(uploader.requeue_failed(), 1)
+        self.assertTrue(wait_until(lambda: len(server.requests) == 2 and uploader.pending() == 0))
+        self.assertEqual(server.requests[1][0], key)
+        self.assertEqual(uploader.queue.count(STATUS_FAILED), 0)
+
+    def test_pending_survives_restart(self):
+        # 서버가 꺼져 있으면 큐에 남아 있다가 재시작 후 전송
+        server = self._server()
+        url = server.url
+        server.close()
+        self.servers.remove(server)
+
+        uploader = self._uploader(url)
+        key = uploader.enqueue({"nowTime": "1"}, clip_path=self.clip_path)
+        time.sleep(0.2)
+        self.assertEqual(uploader.queue.count(STATUS_PENDING), 1)
+        uploader.close(timeout=5.)
+        self.uploaders.remove(uploader)
+
+        server = self._server()
+        uploader = self._uploader(server.url)
+        self.assertTrue(wait_until(lambda: uploader.pending() == 0 and server.requests))
+        self.assertEqual(server.requests[0][0], key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,192 +1,191 @@
 # coding: utf-8
-import copy
+import concurrent.futures
 import datetime
 import json
 import logging
-import math
 import os
 import os.path as osp
+import re
+import shutil
+import sqlite3
+import struct
 
 import pytz
 from colorlog import ColoredFormatter
 from PIL import Image, ImageDraw, ImageFont
 from tqdm import tqdm
 
+import polygon_geometry
+
+
+LANE_CATEGORIES = ["lane_blue", "lane_shoulder", "lane_white", "lane_yellow"]
+VEHICLE_CATEGORIES = ["vehicle_car", "vehicle_bike", "vehicle_bus", "vehicle_truck"]
+
+# JPEG SOF (Start Of Frame) marker : 이미지 크기가 들어 있는 header
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_image_size(img_path):
+    """이미지를 디코딩하지 않고 header 에서 (width, height) 를 읽는다 (JPEG 이외 형식은 PIL header)"""
+    with open(img_path, "rb") as f:
+        if f.read(2) == b"\xff\xd8":
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    break
+                # padding(0xFF) 건너뛰기
+                while marker[1] == 0xFF:
+                    marker = marker[1:] + f.read(1)
+                length = struct.unpack(">H", f.read(2))[0]
+                if marker[1] in _JPEG_SOF_MARKERS:
+                    height, width = struct.unpack(">xHH", f.read(5))
+                    return width, height
+                f.seek(length - 2, os.SEEK_CUR)
+
+    with Image.open(img_path) as img:
+        return img.size
+
+
+def _annotation_image_path(annot):
+    return annot.replace("ANNOTATION", "IMAGE").replace("json", "jpg")
+
+
+def _file_signature(annot):
+    # 변경 여부 판단용 (annotation / 이미지 파일의 mtime, 크기), 이미지가 없으면 None
+    img_path = _annotation_image_path(annot)
+    if not os.path.exists(img_path):
+        return None
+    annot_stat = os.stat(annot)
+    img_stat = os.stat(img_path)
+    return f"{annot_stat.st_mtime_ns}:{annot_stat.st_size}:{img_stat.st_mtime_ns}:{img_stat.st_size}"
+
+
+def convert_annotation(annot, type_key, categories):
+    """
+    annotation json 1개 -> (image 정보, annotation list) - id 는 병합할 때 부여
+    process pool 에서 실행되므로 module 함수로 둔다
+    """
+    with open(annot, "r") as f:
+        json_data = json.load(f)
+    object_data = json_data["data_set_info"]["data"]
+    img_path = _annotation_image_path(annot)
+    width, height = read_image_size(img_path)
+
+    img_info = {"file_name": osp.basename(img_path), "height": height, "width": width}
+
+    # annotation은 segmentation / iscrowd, image_id, \
+    # category_id, id, bbox, area
+    targets = []
+    for target in object_data:
+        obj_label = target["value"]["object_Label"]
+        category = obj_label.get(type_key)
+        if category in categories:
+            targets.append((target["value"]["points"], category))
+
+    # 파일 안의 모든 polygon 면적을 한 번에 계산
+    # segmentation / bbox 는 annotation 좌표 값을 그대로 사용 (int / float 가 섞여 있어도 1090 -> 1090.0 으로 바뀌지 않음)
+    areas = polygon_geometry.polygon_areas([points for points, _ in targets]).tolist()
 
-def merge_lane_annotation(annot_list, save_path):
-    images = []
     annotations = []
-    annot_id = 1
-    image_id = 0
-    for annot in tqdm(annot_list):
-        with open(annot, "r") as f:
-            json_data = json.load(f)
-        object_data = json_data["data_set_info"]["data"]
-        img_path = annot.replace("ANNOTATION", "IMAGE").replace("json", "jpg")
-        if not os.path.exists(img_path):
+    for (points, category), area in zip(targets, areas):
+        seg_x = [point["x"] for point in points]
+        seg_y = [point["y"] for point in points]
+        segmentation = [v for point in points for v in (point["x"], point["y"])]
+        annotations.append({
+            "bbox": [min(seg_x), min(seg_y), max(seg_x) - min(seg_x), max(seg_y) - min(seg_y)],
+            "segmentation": [segmentation],
+            "area": area,
+            "category_id": categories.index(category) + 1,
+            "iscrowd": 0,
+        })
+
+    return img_info, annotations
+
+
+def _convert_annotation_job(job):
+    annot, type_key, categories = job
+    return convert_annotation(annot, type_key, categories)
+
+
+def merge_coco_annotation(annot_list, save_path, type_key, categories, supercategory,
+                          workers=None, cache_path=None, chunksize=32):
+    """
+    annotation json 여러 개 -> COCO json 1개
+    - 이미지 크기는 header 에서 읽고, annotation 변환은 process pool 에서 병렬로
+    - 결과는 변환되는 순서대로 파일에 바로 기록 (전체를 메모리에 모으지 않음)
+    - cache_path (sqlite) 를 주면 mtime / 크기가 바뀐 파일만 다시 변환 (lane / vehicle 이 같은 cache 를 써도 됨)
+    - image / annotation id 는 annot_list 순서대로 부여 (기존 결과와 같은 순서)
+    """
+    cache = None
+    if cache_path is not None:
+        cache = sqlite3.connect(cache_path)
+        cache.execute("CREATE TABLE IF NOT EXISTS converted (annot TEXT PRIMARY KEY, signature TEXT, result TEXT)")
+
+    # 이미지가 없는 annotation 은 기존과 같이 제외
+    entries = []
+    for annot in annot_list:
+        signature = _file_signature(annot)
+        if signature is None:
             continue
-        img = Image.open(img_path)
-
-        img_info = {}
-        img_info["id"] = image_id
-        file_name = osp.basename(img_path)
-        img_info["file_name"] = copy.deepcopy(file_name)
-        img_info["height"] = copy.deepcopy(img.size[1])
-        img_info["width"] = copy.deepcopy(img.size[0])
-        images.append(copy.deepcopy(img_info))
-        img.close()
-
-        # annotation은 segmentation / iscrowd, image_id, \
-        # category_id, id, bbox, area
-        for target in object_data:
-            obj_label = target["value"]["object_Label"]
-            if "lane_type" in obj_label.keys():
-                category = obj_label["lane_type"]
+        cached = None
+        if cache is not None:
+            row = cache.execute("SELECT signature, result FROM converted WHERE annot = ?",
+                                (f"{type_key}|{annot}",)).fetchone()
+            if row is not None and row[0] == signature:
+                cached = row[1]
+        entries.append((annot, signature, cached))
+
+    jobs = [(annot, type_key, categories) for annot, _, cached in entries if cached is None]
+    print(f"merge: {len(entries)} files, {len(jobs)} to convert, {len(entries) - len(jobs)} cached")
+
+    categories_info = [{"supercategory": supercategory, "id": i + 1, "name": name}
+                       for i, name in enumerate(categories)]
+
+    annot_tmp_path = save_path + ".annotations.tmp"
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor, \
+            open(save_path, "w", encoding="utf-8") as out, \
+            open(annot_tmp_path, "w+", encoding="utf-8") as annot_out:
+        converted = executor.map(_convert_annotation_job, jobs, chunksize=chunksize)
+
+        out.write('{"images": [')
+        annot_id = 1
+        for image_id, (annot, signature, cached) in enumerate(tqdm(entries)):
+            if cached is not None:
+                img_info, annotations = json.loads(cached)
             else:
-                continue
-            ann = {}
-            if category in [
-                "lane_blue",
-                "lane_shoulder",
-                "lane_white",
-                "lane_yellow",
-            ]:
-                points = target["value"]["points"]
-                temp_points = copy.deepcopy(points)
-                # deepcopy를 해야 둘다 변경되지 않음
-                area = get_area(temp_points)
-                if category == "lane_blue":
-                    ann["category_id"] = 1
-                elif category == "lane_shoulder":
-                    ann["category_id"] = 2
-                elif category == "lane_white":
-                    ann["category_id"] = 3
-                elif category == "lane_yellow":
-                    ann["category_id"] = 4
-                segmentation = []
-                seg_x = []
-                seg_y = []
-                for point in points:
-                    segmentation.append(point["x"])
-                    seg_x.append(point["x"])
-                    segmentation.append(point["y"])
-                    seg_y.append(point["y"])
-                bbox = [
-                    min(seg_x),
-                    min(seg_y),
-                    max(seg_x) - min(seg_x),
-                    max(seg_y) - min(seg_y),
-                ]
-                ann["bbox"] = bbox
-                ann["segmentation"] = [segmentation]
-                ann["area"] = area
-                ann["image_id"] = image_id
-                ann["iscrowd"] = 0
-                ann["id"] = annot_id
+                img_info, annotations = next(converted)
+                if cache is not None:
+                    cache.execute("INSERT OR REPLACE INTO converted VALUES (?, ?, ?)",
+                                  (f"{type_key}|{annot}", signature,
+                                   json.dumps([img_info, annotations], ensure_ascii=False)))
+
+            img_info = dict(img_info, id=image_id)
+            out.write(("\n" if image_id == 0 else ",\n") + json.dumps(img_info, ensure_ascii=False))
+            for ann in annotations:
+                ann = dict(ann, image_id=image_id, id=annot_id)
+                annot_out.write(("\n" if annot_id == 1 else ",\n") + json.dumps(ann, ensure_ascii=False))
                 annot_id += 1
-            if ann:
-                annotations.append(ann)
-        image_id += 1
-    merged_data = {
-        "images": images,
-        "annotations": annotations,
-        "categories": [
-            {"supercategory": "lane", "id": 1, "name": "lane_blue"},
-            {"supercategory": "lane", "id": 2, "name": "lane_shoulder"},
-            {"supercategory": "lane", "id": 3, "name": "lane_white"},
-            {"supercategory": "lane", "id": 4, "name": "lane_yellow"},
-        ],
-    }
-    with open(save_path, "w", encoding="utf-8") as f:
-        json.dump(merged_data, f, ensure_ascii=False, indent="\t")
 
+        # images 다음에 annotations 를 이어 붙인다
+        out.write('\n],\n"annotations": [')
+        annot_out.seek(0)
+        shutil.copyfileobj(annot_out, out)
+        out.write('\n],\n"categories": ' + json.dumps(categories_info, ensure_ascii=False) + "}\n")
 
-def merge_vehicle_annotation(annot_list, save_path):
-    images = []
-    annotations = []
-    annot_id = 1
-    image_id = 0
-    for annot in tqdm(annot_list):
-        with open(annot, "r") as f:
-            json_data = json.load(f)
-        object_data = json_data["data_set_info"]["data"]
-        img_path = annot.replace("ANNOTATION", "IMAGE").replace("json", "jpg")
-        if not os.path.exists(img_path):
-            continue
-        img = Image.open(img_path)
-
-        img_info = {}
-        img_info["id"] = image_id
-        file_name = osp.basename(img_path)
-        img_info["file_name"] = copy.deepcopy(file_name)
-        img_info["height"] = copy.deepcopy(img.size[1])
-        img_info["width"] = copy.deepcopy(img.size[0])
-        images.append(copy.deepcopy(img_info))
-        img.close()
-
-        # annotation은 segmentation / iscrowd, image_id, \
-        # category_id, id, bbox, area
-        for target in object_data:
-            obj_label = target["value"]["object_Label"]
-            if "vehicle_type" in obj_label.keys():
-                category = obj_label["vehicle_type"]
-            else:
-                continue
-            ann = {}
-            if category in [
-                "vehicle_car",
-                "vehicle_bike",
-                "vehicle_bus",
-                "vehicle_truck",
-            ]:
-                points = target["value"]["points"]
-                temp_points = copy.deepcopy(points)
-                # deepcopy를 해야 둘다 변경되지 않음
-                area = get_area(temp_points)
-                if category == "vehicle_car":
-                    ann["category_id"] = 1
-                elif category == "vehicle_bike":
-                    ann["category_id"] = 2
-                elif category == "vehicle_bus":
-                    ann["category_id"] = 3
-                elif category == "vehicle_truck":
-                    ann["category_id"] = 4
-                segmentation = []
-                seg_x = []
-                seg_y = []
-                for point in points:
-                    segmentation.append(point["x"])
-                    seg_x.append(point["x"])
-                    segmentation.append(point["y"])
-                    seg_y.append(point["y"])
-                bbox = [
-                    min(seg_x),
-                    min(seg_y),
-                    max(seg_x) - min(seg_x),
-                    max(seg_y) - min(seg_y),
-                ]
-                ann["bbox"] = bbox
-                ann["segmentation"] = [segmentation]
-                ann["area"] = area
-                ann["image_id"] = image_id
-                ann["iscrowd"] = 0
-                ann["id"] = annot_id
-                annot_id += 1
-            if ann:
-                annotations.append(ann)
-        image_id += 1
-    merged_data = {
-        "images": images,
-        "annotations": annotations,
-        "categories": [
-            {"supercategory": "vehicle", "id": 1, "name": "vehicle_car"},
-            {"supercategory": "vehicle", "id": 2, "name": "vehicle_bike"},
-            {"supercategory": "vehicle", "id": 3, "name": "vehicle_bus"},
-            {"supercategory": "vehicle", "id": 4, "name": "vehicle_truck"},
-        ],
-    }
-    with open(save_path, "w", encoding="utf-8") as f:
-        json.dump(merged_data, f, ensure_ascii=False, indent="\t")
+    os.remove(annot_tmp_path)
+    if cache is not None:
+        cache.commit()
+        cache.close()
+
+
+def merge_lane_annotation(annot_list, save_path, workers=None, cache_path=None):
+    merge_coco_annotation(annot_list, save_path, "lane_type", LANE_CATEGORIES, "lane",
+                          workers=workers, cache_path=cache_path)
+
+
+def merge_vehicle_annotation(annot_list, save_path, workers=None, cache_path=None):
+    merge_coco_annotation(annot_list, save_path, "vehicle_type", VEHICLE_CATEGORIES, "vehicle",
+                          workers=workers, cache_path=cache_path)
 
 
 class CustomFormatter(ColoredFormatter):
@@ -282,16 +281,8 @@ def viz_inference_result(image_path, image_info):
 
 
 def get_area(points):
-    append_dict = {"x": points[0]["x"], "y": points[0]["y"]}
-    points.append(append_dict)
-    plus = 0
-    minus = 0
-    for i in range(len(points) - 1):
-        plus += points[i]["x"] * points[i + 1]["y"]
-        minus += points[i]["y"] * points[i + 1]["x"]
-    area = math.fabs(0.5 * (plus - minus))
-
-    return area
+    # polygon 면적 ([{"x", "y"}, ...] 또는 [x1, y1, ...]), 입력 list 는 바꾸지 않음
+    return polygon_geometry.polygon_area(points)
 
 
 def create_json(data_id, image_info):
@@ -317,10 +308,7 @@ def create_json(data_id, image_info):
         objectID = f"data_set_info_{data_id}_{object_id + 1}"
         value = {"metainfo": metainfo, "annotation": "POLYGONS"}
 
-        points = []
-        for i in range(len(obj.poly) // 2):
-            points.append({"x": obj.poly[2 * i], "y": obj.poly[2 * i + 1]})
-        value["points"] = points
+        value["points"] = polygon_geometry.to_points(obj.poly)
 
         if obj.obj_type == "lane":
             extra = {"value": "lane", "label": "차선", "color": "#e0182d"}
@@ -0,0 +1,21 @@
+package ssafety.be.config;
+
+import jakarta.servlet.MultipartConfigElement;
+import org.springframework.boot.web.servlet.MultipartConfigFactory;
+import org.springframework.context.annotation.Bean;
+import org.springframework.context.annotation.Configuration;
+import org.springframework.util.unit.DataSize;
+
+/**
+ * AI 서버 신고(위반 영상 10초 webm + 번호판 이미지)를 받을 수 있도록 multipart 크기 제한을 늘립니다. (기본값 1MB)
+ */
+@Configuration
+public class MultipartConfig {
+    @Bean
+    public MultipartConfigElement multipartConfigElement() {
+        MultipartConfigFactory factory = new MultipartConfigFactory();
+        factory.setMaxFileSize(DataSize.ofMegabytes(50));
+        factory.setMaxRequestSize(DataSize.ofMegabytes(60));
+        return factory.createMultipartConfig();
+    }
+}
@@ -7,17 +7,21 @@ import org.springframework.data.domain.Pageable;
 import org.springframework.data.domain.Sort;
 import org.springframework.data.web.PageableDefault;
 import org.springframework.http.HttpStatus;
+import org.springframework.http.MediaType;
 import org.springframework.http.ResponseEntity;
 import org.springframework.web.bind.annotation.*;
+import org.springframework.web.multipart.MultipartHttpServletRequest;
 import ssafety.be.dto.ReportDto;
 import ssafety.be.dto.SearchDto;
 import ssafety.be.dto.SmsRequestDto;
 import ssafety.be.entity.Report;
 import ssafety.be.service.KakaoMapService;
 import ssafety.be.service.ReportDataService;
+import ssafety.be.service.ReportFileService;
 import ssafety.be.service.SmsService;
 
 import java.util.List;
+import java.util.Map;
 import java.util.Optional;
 
 @RestController
@@ -26,6 +30,7 @@ import java.util.Optional;
 public class ReportController {
     private final KakaoMapService kakaoMapService;
     private final ReportDataService reportDataService;
+    private final ReportFileService reportFileService;
     private final SmsService smsService;
 
     @PostMapping("/report")
@@ -41,6 +46,37 @@ public class ReportController {
         }
     }
 
+    // AI 서버의 신고 (metadata : ReportDto JSON, clip : 위반 영상, plate_0, plate_1, ... : 번호판 이미지)
+    @PostMapping(value = "/report", consumes = MediaType.MULTIPART_FORM_DATA_VALUE)
+    public ResponseEntity<String> getReportWithFiles(@RequestPart("metadata") ReportDto data,
+                                                     @RequestHeader(value = "Idempotency-Key", required = false) String idempotencyKey,
+                                                     MultipartHttpServletRequest request) {
+        try {
+            // 재전송된 신고는 다시 저장하지 않습니다.
+            String key = reportFileService.reportKey(idempotencyKey);
+            if (reportFileService.isSaved(key)) {
+                return new ResponseEntity<>("이미 처리된 신고입니다.", HttpStatus.OK);
+            }
+
+            // 첨부 파일을 저장하고 위반 영상 경로를 videoUrl 로 사용합니다.
+            Map<String, String> saved = reportFileService.save(key, request.getFileMap());
+            if (saved.containsKey("clip")) {
+                data.setVideoUrl(saved.get("clip"));
+            }
+            // 번호판은 이미지로만 첨부되므로 번호를 모르면 미확인으로 저장합니다.
+            if (data.getVehicleNumber() == null || data.getVehicleNumber().isEmpty()) {
+                data.setVehicleNumber("미확인");
+            }
+
+            reportDataService.saveReport(data);
+            reportFileService.markSaved(key);
+            return new ResponseEntity<>("신고가 성공적으로 처리되었습니다.", HttpStatus.OK);
+        } catch (Exception e) {
+            e.printStackTrace();
+            return new ResponseEntity<>("요청 처리 중 오류가 발생했습니다.", HttpStatus.INTERNAL_SERVER_ERROR);
+        }
+    }
+
     @GetMapping("/getAll")
     public Page<Report> getAllReports(@PageableDefault(size = 10) Pageable pageable) {
         // 페이지 번호 추출
@@ -0,0 +1,88 @@
+package ssafety.be.service;
+
+import org.springframework.beans.factory.annotation.Value;
+import org.springframework.stereotype.Service;
+import org.springframework.util.StringUtils;
+import org.springframework.web.multipart.MultipartFile;
+
+import java.io.IOException;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.util.LinkedHashMap;
+import java.util.Map;
+import java.util.UUID;
+
+/**
+ * ReportFileService는 AI 서버가 multipart 로 보낸 신고 첨부 파일(위반 영상, 번호판 이미지)을 저장합니다.
+ * 파일은 report.upload-dir/{신고 key}/ 에 multipart field 이름으로 저장됩니다. (clip.webm, plate_0.jpg, ...)
+ * AI 서버는 전송에 실패하면 같은 Idempotency-Key 로 다시 보내므로, 저장이 끝난 key 는 표시해 두고 중복 저장하지 않습니다.
+ */
+@Service
+public class ReportFileService {
+    private static final String SAVED_MARKER = ".saved";
+
+    private final Path uploadDir;
+
+    public ReportFileService(@Value("${report.upload-dir:./uploads}") String uploadDir) {
+        this.uploadDir = Paths.get(uploadDir);
+    }
+
+    /**
+     * Idempotency-Key 헤더 값을 폴더 이름으로 쓸 수 있는 key 로 변환합니다. (없거나 형식이 다르면 새로 생성)
+     *
+     * @param key Idempotency-Key 헤더 값
+     * @return 신고 key
+     */
+    public String reportKey(String key) {
+        if (key == null || !key.matches("[0-9A-Za-z-]{1,64}")) {
+            return UUID.randomUUID().toString();
+        }
+        return key;
+    }
+
+    /**
+     * 이미 저장이 끝난 신고인지 확인합니다.
+     *
+     * @param key 신고 key
+     * @return 저장 여부
+     */
+    public boolean isSaved(String key) {
+        return Files.exists(uploadDir.resolve(key).resolve(SAVED_MARKER));
+    }
+
+    /**
+     * 신고 저장이 끝났음을 표시합니다.
+     *
+     * @param key 신고 key
+     */
+    public void markSaved(String key) throws IOException {
+        Files.createDirectories(uploadDir.resolve(key));
+        Files.write(uploadDir.resolve(key).resolve(SAVED_MARKER), new byte[0]);
+    }
+
+    /**
+     * 첨부 파일을 저장합니다. 같은 key 로 다시 보내면 덮어씁니다.
+     *
+     * @param key   신고 key
+     * @param files multipart field 이름 -> 파일
+     * @return field 이름 -> 저장 경로
+     */
+    public Map<String, String> save(String key, Map<String, MultipartFile> files) throws IOException {
+        Path dir = uploadDir.resolve(key);
+        Files.createDirectories(dir);
+
+        Map<String, String> saved = new LinkedHashMap<>();
+        for (Map.Entry<String, MultipartFile> entry : files.entrySet()) {
+            String field = entry.getKey();
+            if (!field.matches("[0-9A-Za-z_]{1,64}")) {
+                continue;
+            }
+            String extension = StringUtils.getFilenameExtension(entry.getValue().getOriginalFilename());
+            Path path = dir.resolve(extension != null ? field + "." + extension : field).toAbsolutePath();
+            entry.getValue().transferTo(path);
+            saved.put(field, path.toString());
+        }
+        return saved;
+    }
+}
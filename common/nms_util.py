@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+# nms_util 은 검출 박스 후처리(NMS, Non-Maximum Suppression) 공용 모듈입니다.
+# ROS 의존성 없이 numpy 만 사용하며, 카메라 검출 노드(AD camera_pedes_detector, lidar_camera_fusion)와
+# AI 위반 검출 서비스(AI/model_parcing service-example, detector_preprocess)가 같이 사용합니다.
+# 저장소 최상위 common/ 폴더를 sys.path 에 추가한 뒤 import 합니다.
+# 박스끼리의 IoU 는 행렬 연산으로 한 번에 계산하고, python 반복은 "남기는 박스 수" 만큼만 돕니다.
+
+# 사용 예
+#   keep = nms(boxes, scores, iou_threshold=0.3)                    # 일반 NMS
+#   keep = nms(boxes, scores, 0.5, labels=labels, box_format='xyxy') # class 별 NMS
+#   keep, new_scores = soft_nms(boxes, scores, sigma=0.5)            # soft-NMS (gaussian)
+
+
+def to_xyxy(boxes, box_format='xywh'):
+    '''
+    # (N, 4) 박스를 [x1, y1, x2, y2] float 배열로 변환
+    # box_format : 'xywh' (cv2 / HOG 출력) 또는 'xyxy' (mmdet 출력)
+    '''
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+    if box_format == 'xyxy':
+        return boxes.copy()
+    if box_format == 'xywh':
+        xyxy = boxes.copy()
+        xyxy[:, 2:] += xyxy[:, :2]
+        return xyxy
+
+    raise ValueError("box_format must be 'xywh' or 'xyxy' : {}".format(box_format))
+
+
+def box_area(boxes_xyxy):
+    return np.clip(boxes_xyxy[:, 2] - boxes_xyxy[:, 0], 0, None) * np.clip(boxes_xyxy[:, 3] - boxes_xyxy[:, 1], 0, None)
+
+
+def box_iou(boxes_a, boxes_b):
+    '''
+    # IoU 행렬
+    # Input
+        # boxes_a : (N, 4) xyxy, boxes_b : (M, 4) xyxy
+    # Output
+        # iou : (N, M)
+    '''
+    area_a = box_area(boxes_a)
+    area_b = box_area(boxes_b)
+
+    tl = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    br = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    wh = np.clip(br - tl, 0, None)
+    overlap_area = wh[:, :, 0] * wh[:, :, 1]
+
+    union = area_a[:, None] + area_b[None, :] - overlap_area
+
+    return np.where(union > 0, overlap_area / np.maximum(union, 1e-12), 0.)
+
+
+def _offset_by_label(boxes_xyxy, labels):
+    # class 별로 박스를 서로 겹치지 않는 좌표 영역으로 옮겨서, 한 번의 NMS 로 class-aware NMS 를 수행
+    if labels is None or len(boxes_xyxy) == 0:
+        return boxes_xyxy
+
+    labels = np.asarray(labels).reshape(-1)
+    _, label_idx = np.unique(labels, return_inverse=True)
+    offset = (boxes_xyxy.max() - boxes_xyxy.min() + 1) * label_idx.astype(np.float64)
+
+    return boxes_xyxy + offset[:, None]
+
+
+def nms(boxes, scores=None, iou_threshold=0.3, labels=None, box_format='xywh', max_det=None):
+    '''
+    # 일반(hard) NMS
+    # Input
+        # boxes : (N, 4), scores : (N,) - None 이면 박스 높이를 점수로 사용
+        # iou_threshold : 이 값보다 IoU 가 큰 박스는 제거
+        # labels : (N,) - 지정하면 같은 class 끼리만 비교 (class-aware)
+        # max_det : 남길 최대 박스 수
+    # Output
+        # keep : 남은 박스 index (점수 내림차순)
+    '''
+    boxes_xyxy = to_xyxy(boxes, box_format)
+    if len(boxes_xyxy) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if scores is None:
+        scores = boxes_xyxy[:, 3] - boxes_xyxy[:, 1]
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+
+    boxes_xyxy = _offset_by_label(boxes_xyxy, labels)
+    areas = box_area(boxes_xyxy)
+
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        if max_det is not None and len(keep) >= max_det:
+            break
+
+        rest = order[1:]
+        tl = np.maximum(boxes_xyxy[i, :2], boxes_xyxy[rest, :2])
+        br = np.minimum(boxes_xyxy[i, 2:], boxes_xyxy[rest, 2:])
+        wh = np.clip(br - tl, 0, None)
+        overlap_area = wh[:, 0] * wh[:, 1]
+        iou = overlap_area / np.maximum(areas[i] + areas[rest] - overlap_area, 1e-12)
+
+        order = rest[iou <= iou_threshold]
+
+    return np.array(keep, dtype=np.int64)
+
+
+def soft_nms(boxes, scores, sigma=0.5, score_threshold=0.001, labels=None, box_format='xywh', max_det=None):
+    '''
+    # Gaussian soft-NMS : 겹치는 박스를 지우는 대신 점수를 exp(-IoU^2 / sigma) 배로 낮춘다
+    # 붐비는 장면(보행자 무리, 차량 정체)에서 실제로 붙어 있는 물체가 사라지는 것을 줄인다
+    # Output
+        # keep : 남은 박스 index (선택 순서), new_scores : keep 순서의 감쇠된 점수
+    '''
+    boxes_xyxy = to_xyxy(boxes, box_format)
+    if len(boxes_xyxy) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1).copy()
+    boxes_xyxy = _offset_by_label(boxes_xyxy, labels)
+    iou = box_iou(boxes_xyxy, boxes_xyxy)
+
+    remain = np.flatnonzero(scores > score_threshold)
+    keep = []
+    new_scores = []
+
+    while remain.size > 0:
+        best = np.argmax(scores[remain])
+        i = remain[best]
+        keep.append(i)
+        new_scores.append(scores[i])
+        if max_det is not None and len(keep) >= max_det:
+            break
+
+        remain = np.delete(remain, best)
+        scores[remain] *= np.exp(-(iou[i, remain] ** 2) / sigma)
+        remain = remain[scores[remain] > score_threshold]
+
+    return np.array(keep, dtype=np.int64), np.array(new_scores, dtype=np.float64)